@@ -0,0 +1,288 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+from app.core.config import settings
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Caché en memoria con expiración por entrada y tamaño acotado (LRU).
+
+    Es segura entre hilos y lleva contadores de aciertos/fallos para poder
+    medir su efectividad. Los valores expirados se descartan al leerlos.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Valores vigentes de `keys`; las claves ausentes o expiradas se omiten."""
+        found = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None) -> None:
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class RedisCache:
+    """
+    Caché compartida entre workers sobre Redis, con la misma interfaz que TTLCache.
+
+    Los valores se guardan como JSON bajo `prefix`. Una TTLCache local pequeña
+    evita ir a Redis por claves leídas hace poco. Si Redis falla, la lectura
+    cuenta como fallo y la escritura se ignora: la caché nunca rompe la petición.
+    """
+
+    def __init__(self, client, prefix: str, ttl: Optional[float] = 300, local: Optional[TTLCache] = None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.local = local
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key: Hashable) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if self.local is not None:
+            value = self.local.get(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            print(f"[WARN] RedisCache.get {self.prefix}: {e}")
+            self.errors += 1
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        value = json.loads(raw)
+        if self.local is not None:
+            self.local.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if self.local is not None:
+            self.local.set(key, value)
+        try:
+            self.client.set(self._key(key), json.dumps(value),
+                            ex=int(ttl) if ttl else None)
+        except Exception as e:
+            print(f"[WARN] RedisCache.set {self.prefix}: {e}")
+            self.errors += 1
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Como get para varias claves, con un solo MGET para las que no están en la capa local."""
+        keys = list(keys)
+        found = self.local.get_many(keys) if self.local is not None else {}
+        missing = [key for key in keys if key not in found]
+        if missing:
+            try:
+                raws = self.client.mget([self._key(key) for key in missing])
+            except Exception as e:
+                print(f"[WARN] RedisCache.get_many {self.prefix}: {e}")
+                self.errors += 1
+                raws = [None] * len(missing)
+            for key, raw in zip(missing, raws):
+                if raw is None:
+                    continue
+                found[key] = json.loads(raw)
+                if self.local is not None:
+                    self.local.set(key, found[key])
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: Dict[Hashable, Any], ttl: Optional[float] = None) -> None:
+        """Como set para varias claves, en un solo pipeline."""
+        if not items:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        if self.local is not None:
+            self.local.set_many(items)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(self._key(key), json.dumps(value), ex=int(ttl) if ttl else None)
+            pipe.execute()
+        except Exception as e:
+            print(f"[WARN] RedisCache.set_many {self.prefix}: {e}")
+            self.errors += 1
+
+    def delete(self, key: Hashable) -> None:
+        if self.local is not None:
+            self.local.delete(key)
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            print(f"[WARN] RedisCache.delete {self.prefix}: {e}")
+            self.errors += 1
+
+    def clear(self) -> None:
+        if self.local is not None:
+            self.local.clear()
+        try:
+            keys = list(self.client.scan_iter(match=f"{self.prefix}:*"))
+            if keys:
+                self.client.delete(*keys)
+        except Exception as e:
+            print(f"[WARN] RedisCache.clear {self.prefix}: {e}")
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "local": self.local.stats() if self.local is not None else None
+        }
+
+
+_redis_clients: Dict[str, Any] = {}
+_redis_lock = threading.Lock()
+
+
+def get_redis(url: Optional[str] = None):
+    """Cliente Redis compartido de `url` (REDIS_URL por defecto), o None si no hay URL."""
+    url = url or settings.REDIS_URL
+    if not url:
+        return None
+    with _redis_lock:
+        if url not in _redis_clients:
+            import redis
+            _redis_clients[url] = redis.Redis.from_url(
+                url, socket_timeout=1, socket_connect_timeout=1)
+        return _redis_clients[url]
+
+
+def build_cache(prefix: str, maxsize: int, ttl: Optional[float], local_ttl: Optional[float] = 30,
+                url: Optional[str] = None):
+    """
+    Crea una caché en memoria o, si hay REDIS_URL (o `url`), una RedisCache
+    compartida con una capa local de `local_ttl` segundos.
+    """
+    client = get_redis(url)
+    if client is None:
+        return TTLCache(maxsize=maxsize, ttl=ttl)
+    local = TTLCache(maxsize=maxsize, ttl=min(ttl, local_ttl) if ttl else local_ttl)
+    return RedisCache(client, prefix, ttl=ttl, local=local)
+
+
+class SharedVersion:
+    """
+    Número de versión compartido entre workers para invalidar datos en memoria.
+
+    Quien escribe llama `bump()`; quien lee compara `get()` con la versión de sus
+    datos y recarga si cambió. Con REDIS_URL el contador vive en Redis (INCR) y
+    `get()` lo consulta a lo sumo cada `check_seconds`; sin Redis el contador es
+    local al proceso. Si Redis falla se usa el último valor conocido.
+    """
+
+    def __init__(self, name: str, check_seconds: float = 1.0, client=_MISSING):
+        self.name = name
+        self.check_seconds = check_seconds
+        self.client = get_redis() if client is _MISSING else client
+        self._lock = threading.Lock()
+        self._value = 0
+        self._checked_at = 0.0
+
+    def _key(self) -> str:
+        return f"version:{self.name}"
+
+    def get(self) -> int:
+        if self.client is None:
+            return self._value
+        now = time.monotonic()
+        if now - self._checked_at < self.check_seconds:
+            return self._value
+        try:
+            raw = self.client.get(self._key())
+            with self._lock:
+                self._value = int(raw) if raw is not None else 0
+                self._checked_at = now
+        except Exception as e:
+            print(f"[WARN] SharedVersion.get {self.name}: {e}")
+        return self._value
+
+    def bump(self) -> int:
+        with self._lock:
+            if self.client is not None:
+                try:
+                    self._value = int(self.client.incr(self._key()))
+                    self._checked_at = time.monotonic()
+                    return self._value
+                except Exception as e:
+                    print(f"[WARN] SharedVersion.bump {self.name}: {e}")
+            self._value += 1
+            return self._value
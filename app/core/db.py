@@ -2,7 +2,12 @@ from fastapi import FastAPI
 from typing import Annotated
 from fastapi import Depends
 from sqlmodel import Session, create_engine, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from .config import settings
+from .pool_metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool
 
 # ✅ IMPORTAR TODOS LOS MODELOS
 from app.models import (
@@ -12,14 +17,141 @@ from app.models import (
     DriverSavings, Transaction, VerifyMount, TypeService, ConfigServiceValue
 )
 
-engine = create_engine(settings.DATABASE_URL, echo=False)
+def pool_options(url: str, poolclass) -> dict:
+    """Parámetros del pool según Settings; SQLite (desarrollo y pruebas) usa el pool por defecto."""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(
+    settings.DATABASE_URL, echo=False, **pool_options(settings.DATABASE_URL, InstrumentedQueuePool))
+
+# Columnas consultadas por radio (MBRContains) que necesitan índice SPATIAL.
+# MySQL exige columnas NOT NULL y, en MySQL 8, con SRID de columna para usarlo.
+# client_request.pickup_position es nullable: sus búsquedas se sirven del índice
+# en memoria (open_request_index) y no lleva índice SPATIAL.
+SPATIAL_INDEXES = [
+    ("driver_position", "position", "POINT NOT NULL SRID 4326"),
+]
+
 
 def create_all_tables():
     """Crea todas las tablas en la base de datos"""
     SQLModel.metadata.create_all(engine)
+    ensure_spatial_indexes()
+
+
+def ensure_spatial_indexes():
+    """
+    Agrega los índices SPATIAL que falten en bases de datos creadas antes de que
+    existieran (create_all no altera tablas existentes). Solo aplica a MySQL.
+    Antes fija el SRID de la columna si no lo tiene (sin él MySQL 8 ignora el índice).
+    Un error se registra y no impide el arranque: las búsquedas funcionan sin el índice.
+    """
+    if engine.dialect.name != "mysql":
+        return
+    for table, column, definition in SPATIAL_INDEXES:
+        try:
+            with engine.begin() as conn:
+                srid = conn.execute(text(
+                    "SELECT SRS_ID FROM information_schema.COLUMNS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table "
+                    "AND COLUMN_NAME = :column"
+                ), {"table": table, "column": column}).scalar()
+                if srid is None:
+                    print(f"Fijando SRID de {table}.{column}: {definition}")
+                    conn.execute(text(
+                        f"ALTER TABLE `{table}` MODIFY `{column}` {definition}"))
+                exists = conn.execute(text(
+                    "SELECT COUNT(*) FROM information_schema.STATISTICS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table "
+                    "AND COLUMN_NAME = :column AND INDEX_TYPE = 'SPATIAL'"
+                ), {"table": table, "column": column}).scalar()
+                if not exists:
+                    print(f"Creando índice SPATIAL en {table}.{column}")
+                    conn.execute(text(
+                        f"ALTER TABLE `{table}` ADD SPATIAL INDEX `idx_{table}_{column}` (`{column}`)"))
+        except Exception as e:
+            print(f"[ERROR] No se pudo crear el índice SPATIAL en {table}.{column}: {e}")
 
 def get_session():
     with Session(engine) as session:
         yield session
 
-SessionDep = Annotated[Session, Depends(get_session)]
\ No newline at end of file
+SessionDep = Annotated[Session, Depends(get_session)]
+
+
+# Driver asíncrono equivalente a cada driver síncrono de DATABASE_URL
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """ASYNC_DATABASE_URL si está configurada o, si no, DATABASE_URL con su driver asíncrono."""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        raise ValueError(f"No hay driver asíncrono configurado para {parsed.drivername}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+_async_engine = None
+_async_session_factory = None
+
+
+def get_async_engine():
+    """
+    Engine asíncrono (SQLAlchemy asyncio), creado en el primer uso: los procesos
+    que solo usan el camino síncrono no necesitan el driver asíncrono instalado.
+    """
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        url = async_database_url(settings.DATABASE_URL)
+        _async_engine = create_async_engine(url, echo=False, **pool_options(url, InstrumentedAsyncQueuePool))
+        # expire_on_commit=False: los objetos se serializan fuera de la sesión, después del commit
+        _async_session_factory = async_sessionmaker(
+            _async_engine, class_=AsyncSession, expire_on_commit=False)
+    return _async_engine
+
+
+def async_engine_if_created():
+    """Engine asíncrono si ya se creó (para métricas), sin crearlo."""
+    return _async_engine
+
+
+async def dispose_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _async_session_factory = None
+
+
+async def get_async_session():
+    """
+    Sesión asíncrona para handlers `async def`. Los servicios existentes (síncronos)
+    se ejecutan sobre ella con `await session.run_sync(servicio, *args)`: reciben
+    una Session normal, pero la espera de MySQL no bloquea el event loop.
+
+    run_sync corre el servicio en el hilo del event loop: solo sirve para servicios
+    que únicamente consultan la base de datos. Lo que use cachés con Redis
+    (role_cache, offers_cache, reference_data), recargue índices o calcule con numpy
+    va al threadpool (`run_in_threadpool`) o se queda en un handler síncrono con SessionDep.
+    """
+    get_async_engine()
+    async with _async_session_factory() as session:
+        yield session
+
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
\ No newline at end of file
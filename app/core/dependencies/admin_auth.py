@@ -1,11 +1,11 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
-from app.core.config import settings
+from jose import JWTError
+from app.core.dependencies.auth import get_token_claims
 
 bearer_scheme = HTTPBearer()
 
-def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+def get_current_admin(request: Request, credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
     token = credentials.credentials
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -13,7 +13,7 @@ def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(bearer
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = get_token_claims(request, token)
         role = payload.get("role")
         if role != 1:
             raise credentials_exception
@@ -1,8 +1,8 @@
 from fastapi import Request, HTTPException, status, Path
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
-from app.core.config import settings
+from jose import JWTError
+from app.core.security import decode_token
 from uuid import UUID
 
 bearer_scheme = HTTPBearer()
@@ -19,6 +19,13 @@ def user_is_owner():
             )
     return dependency
 
+def get_token_claims(request: Request, token: str) -> dict:
+    """Claims que dejó JWTAuthMiddleware para este token o, si no están, el token verificado (con caché)."""
+    state = request.scope.get("state") or {}
+    if state.get("jwt_token") == token:
+        return state["jwt_claims"]
+    return decode_token(token)
+
 def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
     token = credentials.credentials
     credentials_exception = HTTPException(
@@ -27,7 +34,7 @@ def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = get_token_claims(request, token)
         user_id = payload.get("sub")
         if not user_id:
             raise credentials_exception
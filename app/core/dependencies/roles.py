@@ -0,0 +1,50 @@
+from typing import Optional
+from uuid import UUID
+
+from fastapi import HTTPException, Request, status
+
+from app.core.db import AsyncSessionDep, SessionDep
+from app.services.role_cache_service import role_cache
+
+
+def require_role(role: str, approved: bool = True, status_code: int = status.HTTP_403_FORBIDDEN,
+                 detail: Optional[str] = None):
+    """
+    Dependencia que exige que el usuario autenticado (request.state.user_id) tenga
+    el rol `role` y, si `approved`, que esté aprobado. Retorna el user_id.
+
+    Uso:
+        user_id: UUID = Depends(require_role("DRIVER", approved=True))
+    """
+    detail = detail or f"El usuario no tiene el rol {role}{' aprobado' if approved else ''}"
+
+    def dependency(request: Request, session: SessionDep) -> UUID:
+        user_id = getattr(request.state, "user_id", None)
+        if user_id is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+        if not role_cache.has_role(session, user_id, role, approved=approved):
+            raise HTTPException(status_code=status_code, detail=detail)
+        return user_id
+
+    return dependency
+
+
+def require_role_async(role: str, approved: bool = True, status_code: int = status.HTTP_403_FORBIDDEN,
+                       detail: Optional[str] = None):
+    """
+    Igual que require_role, para handlers `async def` con AsyncSessionDep: la
+    consulta de roles usa la misma sesión asíncrona del handler (FastAPI la
+    comparte dentro de la petición), así la petición no toma además una conexión
+    del pool síncrono.
+    """
+    detail = detail or f"El usuario no tiene el rol {role}{' aprobado' if approved else ''}"
+
+    async def dependency(request: Request, session: AsyncSessionDep) -> UUID:
+        user_id = getattr(request.state, "user_id", None)
+        if user_id is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+        if not await role_cache.has_role_async(session, user_id, role, approved=approved):
+            raise HTTPException(status_code=status_code, detail=detail)
+        return user_id
+
+    return dependency
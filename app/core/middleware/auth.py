@@ -1,76 +1,92 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
-from jose import jwt, JWTError
-from app.core.config import settings
+from typing import Dict, Tuple
 from uuid import UUID
 
-class JWTAuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Lista de rutas públicas que no requieren autenticación
-        # Formato: (ruta, método_http)
-        public_paths = [
-            ("/users/", "POST"),
-            ("/users/", "GET"),  # Solo el registro de usuarios
-            ("/auth/verify/", "POST"),  # Rutas de verificación
-            ("/docs", "GET"),  # Documentación
-            ("/openapi.json", "GET"),  # Esquema OpenAPI
-            ("/drivers/", "POST"), #creacion de drivers
-            ("/drivers/", "PATCH"), #actualizacion de drivers
-            ("/openapi.json", "GET"),  # Esquema OpenAPI
-            ("/verify-docs/", "GET"),  # Rutas de verify-docs
-            ("/verify-docs/", "POST"),
-            #("/drivers-position/", "POST"),  # Rutas POST de drivers-position
-            #("/drivers-position/", "GET"),  # Rutas GET de drivers-position
-            # Rutas DELETE de drivers-position
-            #("/drivers-position/", "DELETE"),
-            # Rutas POST de driver-trip-offers
-            #("/driver-trip-offers/", "POST"),
-            #("/driver-trip-offers/", "GET"),  # Rutas GET de driver-trip-offers
-            ("/static/uploads/", "GET"),
-            #("/distance-value/", "GET"),
-            #("/vehicle-type-configuration/", "GET"),
-            # ("/referrals/", "POST"),
-            #("/referrals/", "GET"),
-            ("/login-admin/", "POST"),
-
-        ]
-
-        # Verificar si la ruta y método actual están en la lista de públicas
-        is_public = any(
-            request.url.path.startswith(path) and request.method == method
-            for path, method in public_paths
-        )
-
-        if is_public:
-            return await call_next(request)
+from jose import JWTError
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.security import decode_token
+
+# Lista de rutas públicas que no requieren autenticación
+# Formato: (prefijo de ruta, método_http)
+PUBLIC_PATHS = [
+    ("/users/", "POST"),
+    ("/users/", "GET"),  # Solo el registro de usuarios
+    ("/auth/verify/", "POST"),  # Rutas de verificación
+    ("/docs", "GET"),  # Documentación
+    ("/openapi.json", "GET"),  # Esquema OpenAPI
+    ("/drivers/", "POST"),  # creacion de drivers
+    ("/drivers/", "PATCH"),  # actualizacion de drivers
+    ("/verify-docs/", "GET"),  # Rutas de verify-docs
+    ("/verify-docs/", "POST"),
+    ("/static/uploads/", "GET"),
+    ("/login-admin/", "POST"),
+]
+
+
+def _compile_public_paths(paths) -> Dict[str, Tuple[str, ...]]:
+    # Prefijos agrupados por método: str.startswith(tupla) los compara todos en una sola llamada
+    by_method: Dict[str, Tuple[str, ...]] = {}
+    for path, method in paths:
+        by_method[method] = by_method.get(method, ()) + (path,)
+    return by_method
+
+
+class JWTAuthMiddleware:
+    """
+    Middleware ASGI de autenticación por JWT (sin BaseHTTPMiddleware, así no
+    agrega una tarea por petición ni bufferiza respuestas en streaming).
+
+    Deja en el scope (`request.state`) `user_id`, `jwt_claims` y `jwt_token` para
+    que get_current_user / get_current_admin no vuelvan a decodificar el token.
+    Las conexiones que no son HTTP (websocket, lifespan) pasan sin cambios.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.public_paths = _compile_public_paths(PUBLIC_PATHS)
+
+    def is_public(self, path: str, method: str) -> bool:
+        prefixes = self.public_paths.get(method)
+        return bool(prefixes) and path.startswith(prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.is_public(scope["path"], scope["method"]):
+            await self.app(scope, receive, send)
+            return
 
         # Para el resto de rutas, verificar token
-        try:
-            auth_header = request.headers.get("Authorization")
-            if not auth_header or not auth_header.startswith("Bearer "):
-                return JSONResponse(
-                    status_code=401,
-                    content={"detail": "No se proporcionó token de autenticación"}
-                )
-
-            token = auth_header.split(" ")[1]
-            payload = jwt.decode(token, settings.SECRET_KEY,
-                                 algorithms=[settings.ALGORITHM])
-            user_id = payload.get("sub")
-
-            if not user_id:
-                return JSONResponse(
-                    status_code=401,
-                    content={"detail": "Token inválido"}
-                )
-
-            request.state.user_id = UUID(user_id)
+        auth_header = ""
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                auth_header = value.decode("latin-1")
+                break
+        if not auth_header.startswith("Bearer "):
+            await self._reject(scope, receive, send, "No se proporcionó token de autenticación")
+            return
 
+        token = auth_header.split(" ")[1]
+        try:
+            claims = decode_token(token)
         except JWTError:
-            return JSONResponse(
-                status_code=401,
-                content={"detail": "Token inválido o expirado"}
-            )
+            await self._reject(scope, receive, send, "Token inválido o expirado")
+            return
+
+        user_id = claims.get("sub")
+        try:
+            user_id = UUID(user_id) if user_id else None
+        except ValueError:
+            user_id = None
+        if user_id is None:
+            await self._reject(scope, receive, send, "Token inválido")
+            return
+
+        state = scope.setdefault("state", {})
+        state["user_id"] = user_id
+        state["jwt_claims"] = claims
+        state["jwt_token"] = token
+        await self.app(scope, receive, send)
 
-        return await call_next(request)
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, detail: str) -> None:
+        response = JSONResponse(status_code=401, content={"detail": detail})
+        await response(scope, receive, send)
@@ -0,0 +1,108 @@
+import bisect
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Límites superiores (ms) de los buckets del histograma de espera por una conexión
+CHECKOUT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """
+    Espera por conexión del pool: cantidad, tiempo total y máximo, timeouts e
+    histograma acumulado por buckets de CHECKOUT_BUCKETS_MS (el último bucket,
+    "+Inf", cuenta las esperas más largas).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+        self.buckets = [0] * (len(CHECKOUT_BUCKETS_MS) + 1)
+
+    def observe(self, seconds: float, timed_out: bool = False) -> None:
+        index = bisect.bisect_left(CHECKOUT_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total_s += seconds
+            self.wait_max_s = max(self.wait_max_s, seconds)
+            self.buckets[index] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            histogram = {}
+            cumulative = 0
+            for bound, count in zip(list(CHECKOUT_BUCKETS_MS) + ["+Inf"], self.buckets):
+                cumulative += count
+                histogram[str(bound)] = cumulative
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_total_ms": round(self.wait_total_s * 1000, 3),
+                "wait_avg_ms": round(self.wait_total_s * 1000 / waits, 3) if waits else 0.0,
+                "wait_max_ms": round(self.wait_max_s * 1000, 3),
+                "checkout_latency_ms": histogram
+            }
+
+
+class _InstrumentedPoolMixin:
+    """Mide cuánto espera cada checkout por una conexión (incluye abrir una nueva)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.observe(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.observe(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # dispose() crea un pool nuevo: se conservan las métricas acumuladas
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_stats(engine) -> Optional[Dict[str, Any]]:
+    """Estado actual del pool de `engine` y sus métricas de espera, o None si no es un QueuePool."""
+    if engine is None:
+        return None
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    stats = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": pool._max_overflow,
+        "timeout_s": pool.timeout()
+    }
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.snapshot())
+    return stats
@@ -0,0 +1,37 @@
+import hashlib
+import time
+from typing import Any, Dict
+
+from jose import jwt
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+# Tokens ya verificados, por hash del token. Solo en memoria del proceso: nunca se comparten.
+verified_tokens = TTLCache(maxsize=settings.AUTH_TOKEN_CACHE_MAXSIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL_SECONDS)
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """
+    Verifica el JWT y devuelve sus claims. Un token ya verificado se sirve desde
+    `verified_tokens` hasta su `exp` (o AUTH_TOKEN_CACHE_TTL_SECONDS, lo que
+    ocurra primero). Lanza JWTError si el token no es válido o ya expiró.
+    """
+    key = token_key(token)
+    claims = verified_tokens.get(key)
+    if claims is not None:
+        if "exp" not in claims or claims["exp"] > time.time():
+            return claims
+        verified_tokens.delete(key)
+
+    claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    ttl = settings.AUTH_TOKEN_CACHE_TTL_SECONDS
+    if "exp" in claims:
+        ttl = min(ttl, claims["exp"] - time.time())
+    if ttl > 0:
+        verified_tokens.set(key, claims, ttl=ttl)
+    return claims
@@ -1,25 +1,353 @@
 import socketio
 import json
 from datetime import datetime
+from typing import Optional, Tuple
+from urllib.parse import parse_qs
+from uuid import UUID
+from jose import JWTError
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from app.services.position_ingest_service import position_ingestor
+from app.services.presence_service import driver_presence
+from app.services.trip_trace_service import trip_trace_store
+from app.services.role_cache_service import role_cache
+from app.models.user_has_roles import RoleStatus
+from app.models.client_request import ClientRequest, StatusEnum
+from app.models.driver_trip_offer import DriverTripOffer
+from app.models.user import User
+from app.core.cache import TTLCache, build_cache
+from app.core.config import settings
+from app.core.db import engine
+from app.core.security import decode_token
+from app.core.socket_registry import socket_registry
+
+
+def manager_url() -> Optional[str]:
+    return settings.SOCKETIO_REDIS_URL or settings.REDIS_URL
+
+
+def build_client_manager(kind: Optional[str] = None, url: Optional[str] = None):
+    """
+    Client manager de Socket.IO según SOCKETIO_MANAGER: en memoria (un solo
+    proceso) o AsyncRedisManager, que publica cada emit en Redis para que llegue
+    a los sockets conectados a cualquier worker o nodo.
+    """
+    kind = (kind or settings.SOCKETIO_MANAGER or '').lower()
+    url = url or manager_url()
+    if not kind:
+        kind = 'redis' if url else 'memory'
+    if kind == 'memory':
+        return socketio.AsyncManager()
+    if kind == 'redis':
+        if not url:
+            raise ValueError('SOCKETIO_MANAGER=redis requiere SOCKETIO_REDIS_URL o REDIS_URL')
+        return socketio.AsyncRedisManager(url, channel=settings.SOCKETIO_CHANNEL)
+    raise ValueError(f'SOCKETIO_MANAGER no soportado: {kind}')
+
+
+sio = socketio.AsyncServer(async_mode='asgi', client_manager=build_client_manager())
+print(f'[INFO] Socket.IO client manager: {type(sio.manager).__name__}')
+
+
+def _is_distributed() -> bool:
+    return isinstance(sio.manager, AsyncPubSubManager)
+
+
+# Sid vigente de cada usuario visible para todos los workers, para unir a una sala
+# el socket de un usuario conectado a otro worker. Vive en el mismo Redis que el
+# manager; el TTL retira los sids de workers que terminaron sin desconectar.
+user_sids = build_cache('socket_sid', maxsize=100000, ttl=settings.SOCKETIO_SID_TTL_SECONDS,
+                        local_ttl=5, url=manager_url() if _is_distributed() else None)
+
+# (id_client, id_driver_assigned) de cada viaje, para autorizar los eventos de viaje.
+# Solo se confía en la copia para aceptar: si el usuario no aparece se vuelve a leer
+# de la base de datos, así una asignación recién hecha no se rechaza.
+trip_parties = TTLCache(maxsize=20000, ttl=30)
+# Viaje activo de cada conductor (False si no tiene), para enrutar sus posiciones sin
+# consultar la base de datos en cada ping
+driver_trips = TTLCache(maxsize=20000, ttl=30)
+NO_TRIP_TTL_SECONDS = 5
+
+# Nombre que se muestra en los mensajes del chat, tomado del usuario y no del cliente
+user_names = TTLCache(maxsize=20000, ttl=300)
+
+ACTIVE_TRIP_STATUSES = (
+    StatusEnum.ACCEPTED, StatusEnum.ON_THE_WAY, StatusEnum.ARRIVED, StatusEnum.TRAVELLING)
+
+Parties = Tuple[UUID, Optional[UUID]]
+
+
+# Salas: los eventos de un usuario o de un viaje solo se envían a los sockets
+# de esa sala, no a todas las conexiones. Los nombres de evento no cambian.
+def user_room(user_id) -> str:
+    return f'user:{user_id}'
+
+
+def trip_room(id_client_request) -> str:
+    return f'trip:{id_client_request}'
+
+
+async def emit_to_user(user_id, event, data):
+    """
+    Emite un evento dirigido a un usuario con la convención de la app:
+    el usuario escucha `{event}/{user_id}` y lo recibe en su sala `user:{user_id}`.
+    """
+    await sio.emit(f'{event}/{user_id}', data, room=user_room(user_id))
+
+
+async def emit_to_trip(id_client_request, event, data):
+    """Emite `{event}/{id_client_request}` a los sockets suscritos al viaje."""
+    await sio.emit(f'{event}/{id_client_request}', data, room=trip_room(id_client_request))
+
+
+async def join_trip(sid, id_client_request):
+    if id_client_request:
+        await sio.enter_room(sid, trip_room(id_client_request))
+
+
+async def join_user_to_trip(user_id, id_client_request):
+    """
+    Une al viaje los sockets del usuario. Si no está conectado a este proceso y hay
+    varios workers, el manager reenvía el enter_room al worker que tiene el socket.
+    """
+    local = [sid for sid, _ in list(sio.manager.get_participants('/', user_room(user_id)))]
+    if not local and _is_distributed():
+        sid = await run_in_threadpool(user_sids.get, str(user_id))
+        local = [sid] if sid else []
+    for sid in local:
+        await join_trip(sid, id_client_request)
+
+
+def _load(data):
+    # Si data es string, conviértelo a dict
+    if isinstance(data, str):
+        data = json.loads(data)
+    return data
+
+
+def _connect_token(environ, auth) -> Optional[str]:
+    # Mismo JWT que las peticiones HTTP: en `auth`, en el header Authorization o en ?token=
+    if isinstance(auth, dict) and auth.get('token'):
+        return auth['token']
+    header = environ.get('HTTP_AUTHORIZATION', '')
+    if header.startswith('Bearer '):
+        return header.split(' ')[1]
+    return parse_qs(environ.get('QUERY_STRING', '')).get('token', [None])[0]
+
+
+def _approved_roles(user_id: UUID):
+    with Session(engine) as session:
+        statuses = role_cache.statuses(session, user_id)
+    return [role for role, status in statuses.items() if status == RoleStatus.APPROVED.value]
+
+
+def _load_trip_parties(id_client_request: UUID) -> Optional[Parties]:
+    with Session(engine) as session:
+        row = session.query(ClientRequest.id_client, ClientRequest.id_driver_assigned).filter(
+            ClientRequest.id == id_client_request).first()
+    return (row[0], row[1]) if row else None
+
+
+def _has_offer(id_driver: UUID, id_client_request: UUID) -> bool:
+    with Session(engine) as session:
+        return session.query(DriverTripOffer.id).filter(
+            DriverTripOffer.id_driver == id_driver,
+            DriverTripOffer.id_client_request == id_client_request).first() is not None
+
+
+def _load_driver_trip(id_driver: UUID) -> Optional[UUID]:
+    with Session(engine) as session:
+        row = session.query(ClientRequest.id).filter(
+            ClientRequest.id_driver_assigned == id_driver,
+            ClientRequest.status.in_(ACTIVE_TRIP_STATUSES)
+        ).order_by(ClientRequest.updated_at.desc()).first()
+    return row[0] if row else None
+
+
+def _load_user_name(user_id: UUID) -> Optional[str]:
+    with Session(engine) as session:
+        row = session.query(User.full_name).filter(User.id == user_id).first()
+    return row[0] if row else None
+
+
+async def display_name(user_id: UUID) -> Optional[str]:
+    name = user_names.get(user_id)
+    if name is None:
+        name = await run_in_threadpool(_load_user_name, user_id)
+        if name is not None:
+            user_names.set(user_id, name)
+    return name
+
+
+async def message_recipient(sid, id_client_request, sender_is_client: bool) -> Optional[Tuple[UUID, UUID]]:
+    """
+    (remitente, destinatario) de un mensaje del chat del viaje: el remitente es el
+    usuario del socket y el destinatario la otra parte del viaje, ambos según la
+    base de datos. None si el socket no es el cliente (o el conductor asignado).
+    """
+    parties = await authorize_trip(sid, id_client_request)
+    if parties is None:
+        return None
+    id_client, id_driver = parties
+    sender, recipient = (id_client, id_driver) if sender_is_client else (id_driver, id_client)
+    if socket_registry.user_id(sid) != sender or recipient is None:
+        print(f'[WARN] Mensaje rechazado en el viaje {id_client_request}: {sid} no es '
+              f'{"el cliente" if sender_is_client else "el conductor asignado"} o no hay destinatario')
+        return None
+    return sender, recipient
+
+
+async def has_role(sid, role: str) -> bool:
+    """Rol aprobado del usuario del socket, consultado en role_cache al momento de usarlo."""
+    user_id = socket_registry.user_id(sid)
+    if user_id is None:
+        return False
+    return role in await run_in_threadpool(_approved_roles, user_id)
+
+
+async def authorize_trip(sid, id_client_request, refresh: bool = False,
+                         allow_offering_driver: bool = False) -> Optional[Parties]:
+    """
+    (id_client, id_driver_assigned) del viaje si el usuario del socket es su cliente o
+    su conductor asignado (o, con `allow_offering_driver`, un conductor con oferta en
+    el viaje); None si no lo es o el viaje no existe. `refresh` obliga a leer la
+    base de datos, para eventos que dependen de una asignación recién hecha.
+    """
+    user_id = current_user(sid)
+    if user_id is None:
+        return None
+    try:
+        id_client_request = UUID(str(id_client_request))
+    except (TypeError, ValueError):
+        print(f'[WARN] id_client_request inválido de {user_id}: {id_client_request}')
+        return None
+    parties = None if refresh else trip_parties.get(id_client_request)
+    if parties is None or user_id not in parties:
+        parties = await run_in_threadpool(_load_trip_parties, id_client_request)
+        if parties is None:
+            print(f'[WARN] Viaje inexistente {id_client_request} en evento de {user_id}')
+            return None
+        trip_parties.set(id_client_request, parties)
+    if user_id in parties:
+        return parties
+    if allow_offering_driver and await run_in_threadpool(_has_offer, user_id, id_client_request):
+        return parties
+    print(f'[WARN] {user_id} no participa en el viaje {id_client_request}')
+    return None
+
+
+async def active_trip_of(id_driver: UUID) -> Optional[UUID]:
+    """
+    Viaje activo del conductor. "Sin viaje" se recuerda NO_TRIP_TTL_SECONDS, así una
+    asignación hecha en otro worker se ve en pocos segundos.
+    """
+    id_client_request = driver_trips.get(id_driver)
+    if id_client_request is None:
+        id_client_request = await run_in_threadpool(_load_driver_trip, id_driver)
+        if id_client_request is None:
+            driver_trips.set(id_driver, False, ttl=NO_TRIP_TTL_SECONDS)
+        else:
+            driver_trips.set(id_driver, id_client_request)
+    return id_client_request or None
+
+
+def current_user(sid) -> Optional[UUID]:
+    """Usuario autenticado del socket; los ids que envía el cliente no se usan para identificarlo."""
+    user_id = socket_registry.user_id(sid)
+    if user_id is None:
+        print(f'[WARN] Evento de un socket sin usuario registrado: {sid}')
+    return user_id
+
+
+def _forget_sid(user_id: UUID, sid: str) -> None:
+    remaining = socket_registry.sids(user_id)
+    if remaining:
+        user_sids.set(str(user_id), next(iter(remaining)))
+    elif user_sids.get(str(user_id)) == sid:
+        user_sids.delete(str(user_id))
 
-# Configura Redis como message manager
-mgr = socketio.AsyncRedisManager('redis://localhost:6379/0')
-# sio = socketio.AsyncServer(
-#     async_mode='asgi',
-#     client_manager=mgr,
-#     cors_allowed_origins='*'
-# )
-sio = socketio.AsyncServer(async_mode='asgi')
 
 @sio.event
-async def connect(sid, environ):
-    print(f'Cliente conectado: {sid}')
+async def connect(sid, environ, auth=None):
+    token = _connect_token(environ, auth)
+    if not token:
+        raise socketio.exceptions.ConnectionRefusedError('No se proporcionó token de autenticación')
+    try:
+        claims = decode_token(token)
+        user_id = UUID(claims.get('sub'))
+    except (JWTError, TypeError, ValueError):
+        raise socketio.exceptions.ConnectionRefusedError('Token inválido o expirado')
+
+    roles = await run_in_threadpool(_approved_roles, user_id)
+    sockets = socket_registry.register(sid, user_id)
+    if sockets > 1:
+        print(f'[INFO] {user_id} tiene {sockets} sockets abiertos')
+    await sio.enter_room(sid, user_room(user_id))
+    if _is_distributed():
+        await run_in_threadpool(user_sids.set, str(user_id), sid)
+    if 'DRIVER' in roles:
+        driver_presence.heartbeat(user_id)
+        position_ingestor.touch(user_id)
+    print(f'Cliente conectado: {sid} ({user_id}, {roles})')
+
+
+@sio.event
+async def subscribe(sid, data):
+    """
+    Une el socket a la sala de un viaje: {"id_client_request": "..."}.
+    La sala del usuario se asigna al conectar, según el token.
+    """
+    data = _load(data) or {}
+    if not data.get('id_client_request'):
+        return
+    if await authorize_trip(sid, data['id_client_request']) is None:
+        return
+    await join_trip(sid, data['id_client_request'])
+
+
+@sio.event
+async def unsubscribe(sid, data):
+    data = _load(data) or {}
+    if data.get('id_client_request'):
+        await sio.leave_room(sid, trip_room(data['id_client_request']))
+
+
+@sio.event
+async def heartbeat(sid, data=None):
+    """
+    Heartbeat del conductor, con una frecuencia menor que PRESENCE_TTL_SECONDS.
+    Opcional {"lat": ..., "lng": ...}: si viene, se registra también como posición.
+    Sin heartbeats ni posiciones el conductor sale de las búsquedas al vencer el TTL.
+    """
+    data = _load(data) or {}
+    id_driver = current_user(sid)
+    if id_driver is None or not await has_role(sid, 'DRIVER'):
+        return
+    if _is_distributed():
+        # Renueva el TTL del sid del conductor en Redis
+        await run_in_threadpool(user_sids.set, str(id_driver), sid)
+    if data.get('lat') is not None and data.get('lng') is not None:
+        try:
+            position_ingestor.submit(id_driver, float(data['lat']), float(data['lng']), verified=True)
+            return
+        except (ValueError, TypeError) as e:
+            print(f'[WARN] Heartbeat con posición inválida de {id_driver}: {e}')
+    driver_presence.heartbeat(id_driver)
+    position_ingestor.touch(id_driver)
 
 
 @sio.event
 async def disconnect(sid):
+    # Solo se avisa a los viajes del socket. Si era un conductor, sigue en línea hasta
+    # que venza su TTL de presencia (una reconexión breve no lo saca de las búsquedas).
+    for room in sio.rooms(sid):
+        if room.startswith('trip:'):
+            await sio.emit('driver_disconnected', {'id_socket': sid}, room=room, skip_sid=sid)
+    user_id = socket_registry.unregister(sid)
+    if user_id is not None and _is_distributed():
+        await run_in_threadpool(_forget_sid, user_id, sid)
     print(f'Cliente desconectado: {sid}')
-    await sio.emit( 'driver_disconnected',{'id_socket':sid})
 
 @sio.event
 async def message(sid, data):
@@ -32,26 +360,43 @@ async def message(sid, data):
 
 @sio.event
 async def change_driver_position(sid, data):
-    # Si data es string, conviértelo a dict
-    if isinstance(data, str):
-        data = json.loads(data)
+    data = _load(data)
     print(f'Emitio nueva posicion en socket: {sid}: {data}')
-    await sio.emit(
-        'new_driver_position',
-        {
-            'id_socket': sid,
-            'id': data['id'],
-            'lat': data['lat'],
-            'lng': data['lng']
-        }
-    ) 
+    id_driver = current_user(sid)
+    if id_driver is None or not await has_role(sid, 'DRIVER'):
+        return
+    # Registrar la posición en el pipeline de ingesta (el conductor es el usuario del socket):
+    # actualiza el índice de cercanía y se persiste en el siguiente flush
+    try:
+        position_ingestor.submit(id_driver, float(data['lat']), float(data['lng']), verified=True)
+    except (ValueError, TypeError) as e:
+        print(f'[WARN] Posición no indexada para {id_driver}: {e}')
+    payload = {
+        'id_socket': sid,
+        'id': str(id_driver),
+        'lat': data['lat'],
+        'lng': data['lng']
+    }
+    if settings.DRIVER_POSITION_LEGACY_BROADCAST:
+        await sio.emit('new_driver_position', payload)
+        return
+    # Solo le interesa al viaje activo del conductor; sin viaje no se emite
+    id_client_request = await active_trip_of(id_driver)
+    if id_client_request is not None:
+        await sio.emit('new_driver_position', payload, room=trip_room(id_client_request))
 
 @sio.event
 async def new_client_request(sid, data):
-    # Si data es string, conviértelo a dict
-    if isinstance(data, str):
-        data = json.loads(data)
+    data = _load(data)
     print(f'El cliente emitio una nueva solicitud de servicio en socket: {sid}: {data}')
+    if await authorize_trip(sid, data.get('id_client_request')) is None:
+        return
+    # El cliente recibe las ofertas y cambios de estado por la sala del viaje
+    await join_trip(sid, data.get('id_client_request'))
+    if settings.DISPATCH_ENABLED and not settings.DISPATCH_LEGACY_BROADCAST:
+        # La solicitud ya se ofrece a los conductores cercanos desde el despacho
+        # (dispatch_service) al crearla; no se difunde a todos los sockets.
+        return
     await sio.emit(
         'created_client_request',
         {
@@ -62,73 +407,104 @@ async def new_client_request(sid, data):
 
 @sio.event
 async def new_driver_offer(sid, data):
-    # Si data es string, conviértelo a dict
-    if isinstance(data, str):
-        data = json.loads(data)
+    data = _load(data)
     print(f'El conductor emitio una nueva oferta de servicio en socket: {sid}: {data}')
-    await sio.emit(
-        f'created_driver_offer/{data["id_client_request"]}',
+    # El conductor aún no está asignado: basta con que tenga una oferta en el viaje
+    if await authorize_trip(sid, data.get('id_client_request'), allow_offering_driver=True) is None:
+        return
+    await join_trip(sid, data['id_client_request'])
+    await emit_to_trip(
+        data['id_client_request'],
+        'created_driver_offer',
         {
             'id_socket': sid
         }
-    ) 
+    )
 
 @sio.event
 async def new_driver_assigned(sid, data):
-    # Si data es string, conviértelo a dict
-    if isinstance(data, str):
-        data = json.loads(data)
+    data = _load(data)
     print(f'El cliente emitio una nueva asignacion de conductor en socket: {sid}: {data}')
-    await sio.emit(
-        f'driver_assigned/{data["id_driver"]}',
+    # La asignación acaba de hacerse por HTTP: se lee el viaje de la base de datos
+    parties = await authorize_trip(sid, data.get('id_client_request'), refresh=True)
+    if parties is None:
+        return
+    id_driver = parties[1]
+    if id_driver is None:
+        print(f'[WARN] El viaje {data["id_client_request"]} no tiene conductor asignado')
+        return
+    if str(data.get('id_driver')) != str(id_driver):
+        print(f'[WARN] id_driver {data.get("id_driver")} no es el asignado al viaje; se usa {id_driver}')
+    driver_trips.delete(id_driver)
+    await join_trip(sid, data['id_client_request'])
+    await join_user_to_trip(id_driver, data['id_client_request'])
+    await emit_to_user(
+        id_driver,
+        'driver_assigned',
         {
             'id_socket': sid,
             "id_client_request": data["id_client_request"]
         }
-    ) 
+    )
 
 @sio.event
 async def trip_change_driver_position(sid, data):
-    # Si data es string, conviértelo a dict
-    if isinstance(data, str):
-        data = json.loads(data)
+    data = _load(data)
     print(f'El conductor actualizo su posicion en el socket: {sid}: {data}')
-    await sio.emit(
-        f'trip_new_driver_position/{data["id_client"]}',
+    id_driver = current_user(sid)
+    if id_driver is None:
+        return
+    # Solo el conductor asignado publica posiciones del viaje, y solo a su cliente
+    id_client_request = data.get('id_client_request') or await active_trip_of(id_driver)
+    if id_client_request is None:
+        print(f'[WARN] {id_driver} no tiene un viaje activo')
+        return
+    parties = await authorize_trip(sid, id_client_request)
+    if parties is None or parties[1] != id_driver:
+        return
+    # Registrar el punto en el recorrido del viaje en curso (si está abierto)
+    try:
+        trip_trace_store.append_for_driver(id_driver, float(data['lat']), float(data['lng']))
+    except (ValueError, TypeError, KeyError) as e:
+        print(f'[WARN] Punto de recorrido no registrado: {e}')
+    await emit_to_user(
+        parties[0],
+        'trip_new_driver_position',
         {
             'id_socket': sid,
             'lat': data['lat'],
             'lng': data['lng']
         }
-    ) 
+    )
 
 @sio.event
 async def update_status_trip(sid, data):
-    # Si data es string, conviértelo a dict
-    if isinstance(data, str):
-        data = json.loads(data)
+    data = _load(data)
     print(f'Se actualizo el estado de la viaje en el socket: {sid}: {data}')
-    await sio.emit(
-        f'new_status_trip/{data["id_client_request"]}',
+    if await authorize_trip(sid, data.get('id_client_request')) is None:
+        return
+    await join_trip(sid, data['id_client_request'])
+    await emit_to_trip(
+        data['id_client_request'],
+        'new_status_trip',
         {
             'id_socket': sid,
             'status': data['status'],
             'id_client_request': data['id_client_request']
         }
-    ) 
+    )
 
 @sio.event
 async def client_to_driver_message(sid, data):
     """
-    Cliente envía mensaje al conductor.
+    Cliente envía mensaje al conductor asignado a su viaje.
     - Evento: client_to_driver_message
     - El conductor debe escuchar: client_message/{id_driver} (reemplaza {id_driver} por el ID real del conductor)
+    - El conductor y el nombre se toman del viaje y del usuario del socket; si el JSON
+      trae id_driver, client_id o client_name se ignoran.
     - JSON de ejemplo para enviar:
         {
-            "id_driver": 20,
             "message": "te demoras mucho?",
-            "client_id": 5,
-            "client_name": "Cliente Ejemplo",
             "id_client_request": "req_456"
         }
     - El conductor recibe:
@@ -141,18 +517,21 @@ async def client_to_driver_message(sid, data):
             "timestamp": "2025-06-06T16:10:43.170016"  # Formato ISO 8601
         }
     """
-    # Si data es string, conviértelo a dict
-    if isinstance(data, str):
-        data = json.loads(data)
+    data = _load(data)
     print(f'Mensaje del cliente al conductor: {sid}: {data}')
-    # Emitir el mensaje al conductor específico
-    await sio.emit(
-        f'client_message/{data["id_driver"]}',
+    parties = await message_recipient(sid, data.get('id_client_request'), sender_is_client=True)
+    if parties is None:
+        return
+    client_id, id_driver = parties
+    # Emitir el mensaje al conductor del viaje
+    await emit_to_user(
+        id_driver,
+        'client_message',
         {
             'id_socket': sid,
             'message': data['message'],
-            'client_id': data['client_id'],
-            'client_name': data['client_name'],
+            'client_id': str(client_id),
+            'client_name': await display_name(client_id),
             'id_client_request': data['id_client_request'],
             'timestamp': datetime.utcnow().isoformat()
         }
@@ -161,15 +540,14 @@ async def client_to_driver_message(sid, data):
 @sio.event
 async def driver_to_client_message(sid, data):
     """
-    Conductor envía mensaje al cliente.
+    Conductor asignado envía mensaje al cliente del viaje.
     - Evento: driver_to_client_message
     - El cliente debe escuchar: driver_message/{id_client} (reemplaza {id_client} por el ID real del cliente)
+    - El cliente y el nombre se toman del viaje y del usuario del socket; si el JSON
+      trae id_client, driver_id o driver_name se ignoran.
     - JSON de ejemplo para enviar:
         {
-            "id_client": 5,
             "message": "estoy a 5 minutos",
-            "driver_id": 20,
-            "driver_name": "Conductor Ejemplo",
             "id_client_request": "req_456"
         }
     - El cliente recibe:
@@ -182,20 +560,22 @@ async def driver_to_client_message(sid, data):
             "timestamp": "2025-06-06T16:13:14.784023"  # Formato ISO 8601
         }
     """
-    # Si data es string, conviértelo a dict
-    if isinstance(data, str):
-        data = json.loads(data)
+    data = _load(data)
     print(f'Mensaje del conductor al cliente: {sid}: {data}')
-    # Emitir el mensaje al cliente específico
-    await sio.emit(
-        f'driver_message/{data["id_client"]}',
+    parties = await message_recipient(sid, data.get('id_client_request'), sender_is_client=False)
+    if parties is None:
+        return
+    driver_id, id_client = parties
+    # Emitir el mensaje al cliente del viaje
+    await emit_to_user(
+        id_client,
+        'driver_message',
         {
             'id_socket': sid,
             'message': data['message'],
-            'driver_id': data['driver_id'],
-            'driver_name': data['driver_name'],
+            'driver_id': str(driver_id),
+            'driver_name': await display_name(driver_id),
             'id_client_request': data['id_client_request'],
             'timestamp': datetime.utcnow().isoformat()
         }
     )
-
@@ -0,0 +1,64 @@
+import threading
+from typing import Dict, Optional, Set
+from uuid import UUID
+
+
+class SocketRegistry:
+    """
+    Registro en memoria de las conexiones Socket.IO de este proceso: el usuario de
+    cada sid y los sids de cada usuario.
+
+    Un usuario puede tener varios sockets a la vez (otro dispositivo, o una
+    reconexión que llega antes del disconnect de la anterior); cada uno queda
+    registrado hasta su propio disconnect. Los roles no se guardan aquí: se
+    consultan en role_cache al usarlos, así un cambio de rol aplica sin reconectar.
+    Los eventos de un socket que no está registrado no tienen identidad y se ignoran.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users: Dict[str, UUID] = {}
+        self._sids: Dict[UUID, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def register(self, sid: str, user_id: UUID) -> int:
+        """Asocia `sid` al usuario. Retorna cuántos sockets tiene el usuario en este proceso."""
+        with self._lock:
+            previous = self._users.get(sid)
+            if previous is not None and previous != user_id:
+                self._discard(sid, previous)
+            self._users[sid] = user_id
+            sids = self._sids.setdefault(user_id, set())
+            sids.add(sid)
+            return len(sids)
+
+    def _discard(self, sid: str, user_id: UUID) -> None:
+        sids = self._sids.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._sids[user_id]
+
+    def unregister(self, sid: str) -> Optional[UUID]:
+        """Quita `sid`; retorna su usuario, o None si no estaba registrado."""
+        with self._lock:
+            user_id = self._users.pop(sid, None)
+            if user_id is not None:
+                self._discard(sid, user_id)
+            return user_id
+
+    def user_id(self, sid: str) -> Optional[UUID]:
+        return self._users.get(sid)
+
+    def sids(self, user_id: UUID) -> Set[str]:
+        """Copia de los sids del usuario en este proceso."""
+        with self._lock:
+            return set(self._sids.get(user_id, ()))
+
+    def is_connected(self, user_id: UUID) -> bool:
+        return user_id in self._sids
+
+
+socket_registry = SocketRegistry()
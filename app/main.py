@@ -4,16 +4,27 @@ from contextlib import asynccontextmanager
 
 from fastapi.staticfiles import StaticFiles
 
-from app.routers import config_service_value_admin, project_settings
+from app.routers import config_service_value_admin, project_settings, metrics_admin
 from app.routers.transaction import router as transaction_router
 from app.routers.bank_accounts import router as bank_accounts_router
 
-from .core.db import create_all_tables
+from .core.db import create_all_tables, engine, dispose_async_engine
 from .routers import config_service_value, referrals, users, drivers, auth, verify_docs, driver_position, driver_trip_offer, client_request, login_admin, withdrawal, driver_savings, withdrawal_admin
 from .core.config import settings
 from .core.init_data import init_data
 from .core.middleware.auth import JWTAuthMiddleware
 from .core.sio_events import sio
+from .services.driver_position_service import load_driver_position_index
+from .services.client_requests_service import load_open_request_index
+from .services.distance_matrix_service import distance_matrix_client
+from .services.eta_service import eta_estimator
+from .services.index_reload_service import index_reloader
+from .services.position_ingest_service import position_ingestor
+from .services.presence_service import driver_presence
+from .services.rating_service import ensure_rating_aggregates
+from .services.trip_trace_service import trip_trace_store
+from .services.reference_data_service import reference_data
+from sqlmodel import Session
 import socketio
 
 
@@ -22,8 +33,25 @@ async def lifespan(app: FastAPI):
     print("Iniciando la aplicación...")
     create_all_tables()
     init_data()
+    with Session(engine) as session:
+        if settings.GEO_INDEX_ENABLED:
+            load_driver_position_index(session)
+            load_open_request_index(session)
+        eta_estimator.calibrate(session)
+        ensure_rating_aggregates(session)
+        reference_data.load(session)
+    position_ingestor.start()
+    driver_presence.start()
+    index_reloader.start()
+    trip_trace_store.start_flusher()
     yield
     print("Cerrando la aplicación...")
+    await trip_trace_store.stop_flusher()
+    await index_reloader.stop()
+    await driver_presence.stop()
+    await position_ingestor.stop()
+    await distance_matrix_client.aclose()
+    await dispose_async_engine()
 
 fastapi_app = FastAPI(
     lifespan=lifespan,
@@ -64,6 +92,7 @@ fastapi_app.include_router(verify_docs.router)
 fastapi_app.include_router(config_service_value_admin.router)
 fastapi_app.include_router(withdrawal_admin.router)
 fastapi_app.include_router(project_settings.router)
+fastapi_app.include_router(metrics_admin.router)
 
 # Socket.IO debe ser lo último
 app = socketio.ASGIApp(sio, other_asgi_app=fastapi_app)
@@ -25,3 +25,5 @@ from .verify_mount import VerifyMount
 from .type_service import TypeService, TypeServiceCreate, TypeServiceRead
 from .config_service_value import ConfigServiceValue, VehicleTypeConfigurationCreate, VehicleTypeConfigurationUpdate, VehicleTypeConfigurationResponse
 from .withdrawal import Withdrawal, WithdrawalStatus
+from .trip_trace import TripTrace, TripTraceChunk
+from .rating_aggregate import RatingAggregate
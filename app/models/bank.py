@@ -12,4 +12,7 @@ class Bank(SQLModel, table=True):
     created_at: datetime = Field(
         default_factory=datetime.utcnow, nullable=False)
     updated_at: datetime = Field(
-        default_factory=datetime.utcnow, nullable=False)
+        default_factory=datetime.utcnow,
+        nullable=False,
+        sa_column_kwargs={"onupdate": datetime.utcnow}
+    )
@@ -27,6 +27,8 @@ class ClientRequestCreate(SQLModel):
     payment_method_id: Optional[int] = Field(
         # Nuevo campo con valor por defecto
         default=1, description="ID del método de pago (1=cash, 2=nequi, 3=daviplata). Por defecto es 1 (cash)")
+    quote_id: Optional[str] = Field(
+        default=None, description="Cotización de /distance-value/quote; si no se envía fare_offered se usa la tarifa cotizada (o se recalcula si la cotización venció)")
 
 
 class StatusEnum(str, enum.Enum):
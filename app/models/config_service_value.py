@@ -46,6 +46,25 @@ class FareCalculationResponse(BaseModel):
     duration: str
 
 
+class FareQuoteItem(BaseModel):
+    type_service_id: int
+    type_service_name: str
+    vehicle_type_id: int
+    recommended_value: float
+
+
+class FareQuoteResponse(BaseModel):
+    quote_id: str
+    expires_in: int  # segundos
+    origin_addresses: str
+    destination_addresses: str
+    distance: str
+    duration: str
+    distance_value: int  # metros
+    duration_value: int  # segundos
+    fares: List[FareQuoteItem]
+
+
 class VehicleTypeConfigurationCreate(BaseModel):
     km_value: float
     min_value: float
@@ -0,0 +1,17 @@
+from sqlmodel import SQLModel, Field
+from datetime import datetime
+from uuid import UUID
+
+
+class RatingAggregate(SQLModel, table=True):
+    """
+    Suma y cantidad de calificaciones recibidas por un usuario en un rol
+    ("driver" o "passenger"), para leer el promedio sin recorrer client_request.
+    """
+    __tablename__ = "rating_aggregate"
+    id_user: UUID = Field(foreign_key="user.id", primary_key=True)
+    role: str = Field(primary_key=True, max_length=20)
+    rating_sum: float = Field(default=0.0, nullable=False)
+    rating_count: int = Field(default=0, nullable=False)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow, nullable=False)
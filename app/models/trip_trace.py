@@ -0,0 +1,41 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, LargeBinary
+from typing import Optional
+from datetime import datetime
+from uuid import UUID
+
+
+class TripTrace(SQLModel, table=True):
+    """
+    Recorrido de un viaje, una fila por solicitud. `samples` guarda los puntos
+    (timestamp, lat, lng) ya simplificados en un blob binario empaquetado
+    (ver app/utils/trace_codec.py).
+    """
+    __tablename__ = "trip_trace"
+    id_client_request: UUID = Field(
+        foreign_key="client_request.id", primary_key=True)
+    id_driver: Optional[UUID] = Field(default=None, foreign_key="user.id")
+    samples: bytes = Field(sa_column=Column(LargeBinary(length=16777215), nullable=False))
+    point_count: int = Field(default=0)
+    raw_point_count: int = Field(default=0)
+    distance_m: float = Field(default=0.0)
+    started_at: Optional[datetime] = Field(default=None)
+    finished_at: Optional[datetime] = Field(default=None)
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow, nullable=False)
+
+
+class TripTraceChunk(SQLModel, table=True):
+    """
+    Puntos crudos de un viaje en curso, escritos por bloques por cada worker que
+    recibe posiciones del viaje. Al terminar el viaje se unen, se simplifican en
+    la fila de trip_trace y se borran.
+    """
+    __tablename__ = "trip_trace_chunk"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    id_client_request: UUID = Field(
+        foreign_key="client_request.id", index=True)
+    samples: bytes = Field(sa_column=Column(LargeBinary(length=16777215), nullable=False))
+    point_count: int = Field(default=0)
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow, nullable=False)
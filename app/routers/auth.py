@@ -75,7 +75,7 @@ Verifica el código recibido vía WhatsApp para el número de teléfono proporci
 Devuelve un mensaje indicando si la verificación fue exitosa, junto con el token de acceso y la información del usuario si aplica.
 """
 )
-async def verify_code(
+def verify_code(
     country_code: str,
     phone_number: str,                                   # ID del usuario
     # Datos de la solicitud (el código)
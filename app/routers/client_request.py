@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Request, Query, Body, Path
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Query, Body, Path, BackgroundTasks
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.core.db import get_session
 from app.models.client_request import ClientRequest, ClientRequestCreate, StatusEnum
 from app.models.type_service import TypeService
-from app.core.db import SessionDep
+from app.core.db import SessionDep, AsyncSessionDep, get_async_session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.services.client_requests_service import (
     create_client_request,
     get_time_and_distance_service,
@@ -20,8 +21,16 @@ from app.services.client_requests_service import (
     update_review_service,
     get_driver_requests_by_status_service
 )
+from app.services.distance_matrix_service import get_distance_matrix, DistanceMatrixError
+from app.services.eta_service import eta_estimator
+from app.services.dispatch_service import dispatch_client_request
+from app.services.trip_trace_service import get_trip_trace_stream_service
+from app.services.reference_data_service import reference_data
+from app.services.fare_quote_service import resolve_quoted_fare
+from app.core.config import settings
 from sqlalchemy.orm import Session
 import traceback
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from app.models.user_has_roles import UserHasRole, RoleStatus
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -31,6 +40,7 @@ from datetime import datetime
 from app.utils.geo import wkb_to_coords
 from uuid import UUID
 from app.core.dependencies.auth import get_current_user
+from app.core.dependencies.roles import require_role, require_role_async
 
 bearer_scheme = HTTPBearer()
 
@@ -126,26 +136,18 @@ def get_nearby_client_requests(
                               description="Latitud del conductor"),
     driver_lng: float = Query(..., example=-74.076542,
                               description="Longitud del conductor"),
-    session=Depends(get_session)
+    exact_eta: bool = Query(
+        False, description="Si es true, consulta Google Distance Matrix para todas las solicitudes; si no, solo para las más cercanas. Todas llevan `eta_estimate` (modelo local); `google_distance_matrix` es null en las que no se consultaron a Google"),
+    session=Depends(get_session),
+    user_id: UUID = Depends(require_role(
+        "DRIVER", status_code=400, detail="El usuario no tiene el rol de conductor aprobado."))
 ):
     try:
         print("[DEBUG] Entrando a /nearby")
         print(f"[DEBUG] Headers: {request.headers}")
         print(f"[DEBUG] state: {request.state.__dict__}")
-        user_id = getattr(request.state, 'user_id', None)
+        # 1. El rol DRIVER aprobado ya lo validó require_role
         print(f"[DEBUG] user_id extraído: {user_id}")
-        if user_id is None:
-            raise Exception("user_id no está presente en request.state")
-        # 1. Verificar que el usuario es DRIVER
-        from app.models.user_has_roles import UserHasRole, RoleStatus
-        user_role = session.query(UserHasRole).filter(
-            UserHasRole.id_user == user_id,
-            UserHasRole.id_rol == "DRIVER"
-        ).first()
-        print(f"[DEBUG] user_role: {user_role}")
-        if not user_role or user_role.status != RoleStatus.APPROVED:
-            raise HTTPException(
-                status_code=400, detail="El usuario no tiene el rol de conductor aprobado.")
         # 2. Obtener el DriverInfo del conductor
         from app.models.driver_info import DriverInfo
         driver_info = session.query(DriverInfo).filter(
@@ -163,9 +165,8 @@ def get_nearby_client_requests(
             raise HTTPException(
                 status_code=400, detail="El conductor no tiene un vehículo registrado")
         # 3. Obtener los tipos de servicio para ese tipo de vehículo
-        from app.models.type_service import TypeService
-        type_services = session.query(TypeService).filter(
-            TypeService.vehicle_type_id == driver_vehicle.vehicle_type_id).all()
+        type_services = reference_data.get(session).type_services_for_vehicle(
+            driver_vehicle.vehicle_type_id)
         print(f"[DEBUG] type_services: {type_services}")
         if not type_services:
             raise HTTPException(
@@ -184,38 +185,26 @@ def get_nearby_client_requests(
                     "data": []
                 }
             )
-        # Google Distance Matrix
+        # Tiempos estimados con el modelo local; Google solo para las más cercanas
+        eta_estimator.ensure_calibrated(session)
+        estimates = eta_estimator.estimate_elements(
+            [r['distance'] for r in results], driver_vehicle.vehicle_type_id)
+        for result, estimate in zip(results, estimates):
+            result['eta_estimate'] = estimate
+            # Solo datos reales de Google; las que quedan fuera del top-N llevan None
+            result['google_distance_matrix'] = None
+        exact = results if exact_eta else results[:settings.ETA_GOOGLE_TOP_N]
         pickup_positions = [
-            f"{r['pickup_position']['lat']},{r['pickup_position']['lng']}" for r in results]
-        origins = f"{driver_lat},{driver_lng}"
-        destinations = '|'.join(pickup_positions)
-        import requests
-        from app.core.config import settings
-        url = 'https://maps.googleapis.com/maps/api/distancematrix/json'
-        params = {
-            'destinations': destinations,
-            'origins': origins,
-            'units': 'metric',
-            'key': settings.GOOGLE_API_KEY,
-            'mode': 'driving'
-        }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            return JSONResponse(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                content={
-                    "message": f"Error en el API de Google Distance Matrix: {response.status_code}"}
-            )
-        google_data = response.json()
-        if google_data.get('status') != 'OK':
-            return JSONResponse(
-                status_code=status.HTTP_200_OK,
-                content={
-                    "message": f"Error en la respuesta del API de Google Distance Matrix: {google_data.get('status')}"}
-            )
-        elements = google_data['rows'][0]['elements']
-        for index, element in enumerate(elements):
-            results[index]['google_distance_matrix'] = element
+            (r['pickup_position']['lat'], r['pickup_position']['lng']) for r in exact]
+        try:
+            google_data = get_distance_matrix(
+                [(driver_lat, driver_lng)], pickup_positions)
+            elements = google_data['rows'][0]['elements']
+            for index, element in enumerate(elements):
+                exact[index]['google_distance_matrix'] = element
+        except DistanceMatrixError as e:
+            # Sin Google se responde igual, con los tiempos estimados
+            print(f"[WARN] /nearby sin Distance Matrix: {e}")
         return JSONResponse(content=results, status_code=200)
     except Exception as e:
         print("[ERROR] Exception en /nearby:")
@@ -260,6 +249,7 @@ def get_client_requests_by_status(
         )
 
     # Obtener las solicitudes filtradas por status y user_id
+    # (síncrono: los métodos de pago salen de reference_data, que puede consultar Redis)
     return get_client_requests_by_status_service(session, status, user_id)
 
 
@@ -281,9 +271,9 @@ Devuelve una lista de solicitudes de viaje asociadas a un conductor filtradas po
 **Respuesta:**
 Devuelve una lista de solicitudes de viaje asociadas al conductor con el estado especificado.
 """)
-def get_driver_requests_by_status(
+async def get_driver_requests_by_status(
     request: Request,
-    session: SessionDep,
+    session: AsyncSessionDep,
     status: str = Path(..., description="Estado por el cual filtrar las solicitudes. Estados válidos: CREATED, ACCEPTED, ON_THE_WAY, ARRIVED, TRAVELLING, FINISHED, PAID, CANCELLED")
 ):
     """
@@ -301,7 +291,7 @@ def get_driver_requests_by_status(
         )
 
     # Obtener las solicitudes filtradas por id_driver_assigned y status
-    return get_driver_requests_by_status_service(session, user_id, status)
+    return await session.run_sync(get_driver_requests_by_status_service, user_id, status)
 
 
 
@@ -321,9 +311,13 @@ Crea una nueva solicitud de viaje para un cliente.
 
 **Respuesta:**
 Devuelve la solicitud de viaje creada con toda su información.
+
+Después de responder, la solicitud se ofrece en segundo plano a los conductores elegibles más cercanos,
+en oleadas de radio creciente, con el evento de socket `created_client_request/{id_driver}`.
 """)
-def create_request(
+async def create_request(
     request: Request,
+    background_tasks: BackgroundTasks,
     request_data: ClientRequestCreate = Body(
         ...,
         example={
@@ -338,25 +332,29 @@ def create_request(
             "payment_method_id": 1  # 1 cash, 2 nequi, 3 daviplata
         }
     ),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session),
+    user_id: UUID = Depends(require_role_async(
+        "CLIENT", status_code=400,
+        detail="El usuario no tiene el rol de cliente aprobado. No puede crear solicitudes."))
 ):
+    quoted_fare = None
+    if request_data.quote_id:
+        # Antes de la transacción: si la cotización no está en este worker se consulta la ruta
+        quoted_fare = await resolve_quoted_fare(
+            None, request_data.quote_id, user_id, request_data.type_service_id,
+            (request_data.pickup_lat, request_data.pickup_lng),
+            (request_data.destination_lat, request_data.destination_lng),
+            fare_offered=request_data.fare_offered)
+
     try:
-        user_id = request.state.user_id
-        user_role = session.query(UserHasRole).filter(
-            UserHasRole.id_user == user_id,
-            UserHasRole.id_rol == "CLIENT"
-        ).first()
-        if not user_role or user_role.status != RoleStatus.APPROVED:
-            raise HTTPException(
-                status_code=400,
-                detail="El usuario no tiene el rol de cliente aprobado. No puede crear solicitudes."
-            )
-        db_obj = create_client_request(
-            session, request_data, id_client=user_id)
-        # Obtener el nombre del tipo de servicio
-        from app.models.type_service import TypeService
-        type_service = session.query(TypeService).filter(
-            TypeService.id == db_obj.type_service_id).first()
+        # En run_sync solo el INSERT; reference_data (que puede ir a Redis) se lee en el threadpool
+        db_obj = await session.run_sync(
+            create_client_request, request_data, id_client=user_id, quoted_fare=quoted_fare)
+        refs = await run_in_threadpool(reference_data.get)
+        type_service = refs.type_services.get(db_obj.type_service_id)
+        if settings.DISPATCH_ENABLED:
+            # Ofrecer la solicitud a los conductores más cercanos después de responder
+            background_tasks.add_task(dispatch_client_request, db_obj.id)
         response = {
             "id": db_obj.id,
             "id_client": db_obj.id_client,
@@ -404,6 +402,11 @@ def assign_driver(
     ),
     session: Session = Depends(get_session)
 ):
+    # Síncrono: valida el rol del conductor con role_cache
+    return _assign_driver(session, request_data)
+
+
+def _assign_driver(session: Session, request_data: AssignDriverRequest):
     try:
         import traceback as tb
         print("[DEBUG] request_data:", request_data)
@@ -417,8 +420,8 @@ def assign_driver(
                 status_code=404, detail="Solicitud no encontrada")
 
         # 2. Obtener el tipo de servicio de la solicitud
-        type_service = session.query(TypeService).filter(
-            TypeService.id == client_request.type_service_id).first()
+        type_service = reference_data.get(session).type_services.get(
+            client_request.type_service_id)
         print("[DEBUG] type_service:", type_service)
         if not type_service:
             print("[ERROR] Tipo de servicio no encontrado")
@@ -520,13 +523,13 @@ Solo se permite calificar cuando el viaje está en estado PAID.
 **Respuesta:**
 Devuelve un mensaje de éxito o error.
 """)
-def update_client_rating(
+async def update_client_rating(
     request: Request,
     id_client_request: UUID = Body(...,
                                    description="ID de la solicitud de viaje"),
     client_rating: float = Body(...,
                                 description="Nueva calificación del cliente"),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Actualiza la calificación del cliente para una solicitud de viaje.
@@ -534,7 +537,7 @@ def update_client_rating(
     Solo se permite calificar cuando el viaje está en estado PAID.
     """
     user_id = request.state.user_id
-    return update_client_rating_service(session, id_client_request, client_rating, user_id)
+    return await session.run_sync(update_client_rating_service, id_client_request, client_rating, user_id)
 
 
 @router.patch("/updateDriverRating", tags=["Passengers"], description="""
@@ -548,13 +551,13 @@ Solo se permite calificar cuando el viaje está en estado PAID.
 **Respuesta:**
 Devuelve un mensaje de éxito o error.
 """)
-def update_driver_rating(
+async def update_driver_rating(
     request: Request,
     id_client_request: UUID = Body(...,
                                    description="ID de la solicitud de viaje"),
     driver_rating: float = Body(...,
                                 description="Nueva calificación del conductor"),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Actualiza la calificación del conductor para una solicitud de viaje.
@@ -562,7 +565,7 @@ def update_driver_rating(
     Solo se permite calificar cuando el viaje está en estado PAID.
     """
     user_id = request.state.user_id
-    return update_driver_rating_service(session, id_client_request, driver_rating, user_id)
+    return await session.run_sync(update_driver_rating_service, id_client_request, driver_rating, user_id)
 
 
 # @router.get("/nearby-drivers", description="""
@@ -589,38 +592,27 @@ def get_nearby_drivers(
                               description="Longitud del cliente"),
     type_service_id: int = Query(..., example=1,
                                  description="ID del tipo de servicio solicitado"),
-    session: Session = Depends(get_session)
+    exact_eta: bool = Query(
+        False, description="Si es true, consulta Google Distance Matrix para todos los conductores; si no, solo para los más cercanos. Todos llevan `eta_estimate` (modelo local); `google_distance_matrix` es null en los que no se consultaron a Google"),
+    session: Session = Depends(get_session),
+    user_id: UUID = Depends(require_role(
+        "CLIENT", status_code=400, detail="El usuario no tiene el rol de cliente aprobado"))
 ):
     """
     Endpoint para obtener conductores cercanos a un cliente.
     """
     import traceback as tb
     try:
-        # Verificar que el usuario es CLIENT
-        user_id = request.state.user_id
+        # El rol CLIENT aprobado ya lo validó require_role
         print(f"[DEBUG] user_id: {user_id}")
-        user_role = session.query(UserHasRole).filter(
-            UserHasRole.id_user == user_id,
-            UserHasRole.id_rol == "CLIENT"
-        ).first()
-        print(f"[DEBUG] user_role: {user_role}")
-        if user_role:
-            print(f"[DEBUG] user_role.status: {user_role.status}")
-
-        if not user_role or user_role.status != RoleStatus.APPROVED:
-            print("[ERROR] El usuario no tiene el rol de cliente aprobado")
-            tb.print_stack()
-            raise HTTPException(
-                status_code=400,
-                detail="El usuario no tiene el rol de cliente aprobado"
-            )
 
         results = get_nearby_drivers_service(
             client_lat=client_lat,
             client_lng=client_lng,
             type_service_id=type_service_id,
             session=session,
-            wkb_to_coords=wkb_to_coords
+            wkb_to_coords=wkb_to_coords,
+            exact_eta=exact_eta
         )
 
         if not results:
@@ -683,6 +675,22 @@ def get_client_request_detail(
     return get_client_request_detail_service(session, client_request_id, user_id)
 
 
+@router.get("/{client_request_id}/trace", tags=["Passengers"], description="""
+Devuelve el recorrido del viaje como NDJSON (una línea `{"t": epoch_s, "lat": ..., "lng": ...}` por punto).
+
+Durante el viaje (TRAVELLING) devuelve los puntos recibidos hasta el momento; al terminar, el recorrido
+simplificado que quedó guardado. Solo el cliente dueño de la solicitud o el conductor asignado pueden verlo.
+""")
+def get_client_request_trace(
+    request: Request,
+    client_request_id: UUID,
+    session: SessionDep
+):
+    user_id = request.state.user_id
+    stream = get_trip_trace_stream_service(session, client_request_id, user_id)
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+
 @router.patch("/updateStatusByDriver", tags=["Drivers"], description="""
 Actualiza el estado de una solicitud de viaje, solo permitido para conductores (DRIVER).
 
@@ -747,17 +755,17 @@ Solo se permite agregar un review cuando el viaje está en estado PAID.
 **Respuesta:**
 Devuelve un mensaje de éxito o error.
 """)
-def update_review(
+async def update_review(
     request: Request,
     id_client_request: UUID = Body(...,
                                    description="ID de la solicitud de viaje"),
     review: str = Body(...,
                        description="Review a agregar (máximo 255 caracteres)"),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Permite al cliente agregar un review a su solicitud de viaje.
     Solo se permite cuando el viaje está en estado PAID.
     """
     user_id = request.state.user_id
-    return update_review_service(session, id_client_request, review, user_id)
+    return await session.run_sync(update_review_service, id_client_request, review, user_id)
@@ -1,10 +1,10 @@
 from fastapi import APIRouter, status, Depends, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 # Importación absoluta
 from app.services.config_service_value_service import ConfigServiceValueService
 from app.core.db import SessionDep  # Importación absoluta
-from app.models.config_service_value import VehicleTypeConfigurationCreate, FareCalculationResponse
+from app.models.config_service_value import VehicleTypeConfigurationCreate, FareCalculationResponse, FareQuoteResponse
 from app.core.config import settings
 from app.core.dependencies.auth import get_current_user
 
@@ -61,16 +61,14 @@ async def calculate_fare_unique(
     try:
         user_id = request.state.user_id
         service = ConfigServiceValueService(session)
-        # 1. Llama a Google Distance Matrix
-        google_data = service.get_google_distance_data(
+        # Tarifa desde la caché por recorrido o, si no está, con Google Distance Matrix
+        result = await service.get_fare(
+            type_service_id,
             origin_lat,
             origin_lng,
             destination_lat,
-            destination_lng,
-            settings.GOOGLE_API_KEY
+            destination_lng
         )
-        # 2. Calcula la tarifa
-        result = await service.calculate_total_value(type_service_id, google_data)
 
         if result is None:
             return JSONResponse(
@@ -85,3 +83,36 @@ async def calculate_fare_unique(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"message": f"Error en el servidor: {str(e)}"}
         )
+
+
+@router.get("/quote", response_model=FareQuoteResponse, description="""
+Cotiza un viaje para todos los tipos de servicio (o los indicados) con una sola consulta de ruta. (toma id_user desde el token)
+
+**Parámetros:**
+- `origin_lat`, `origin_lng`: Coordenadas de origen.
+- `destination_lat`, `destination_lng`: Coordenadas de destino.
+- `type_service_ids`: Opcional, tipos de servicio a cotizar (por defecto todos los que tienen tarifa).
+
+**Respuesta:**
+Devuelve un `quote_id`, la distancia y duración del recorrido y la tarifa recomendada por tipo de servicio.
+El `quote_id` se puede enviar al crear la solicitud para usar la tarifa cotizada sin recalcularla.
+""")
+async def quote_fares(
+    request: Request,
+    session: SessionDep,
+    origin_lat: float = Query(..., description="Latitud de origen"),
+    origin_lng: float = Query(..., description="Longitud de origen"),
+    destination_lat: float = Query(..., description="Latitud de destino"),
+    destination_lng: float = Query(..., description="Longitud de destino"),
+    type_service_ids: Optional[List[int]] = Query(None, description="Tipos de servicio a cotizar"),
+    current_user=Depends(get_current_user)
+):
+    service = ConfigServiceValueService(session)
+    return await service.create_quote(
+        request.state.user_id,
+        origin_lat,
+        origin_lng,
+        destination_lat,
+        destination_lng,
+        type_service_ids
+    )
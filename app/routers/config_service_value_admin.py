@@ -9,7 +9,7 @@ router = APIRouter(prefix="/config-service-value", tags=["ADMIN"])
 
 
 @router.patch("/{vehicle_type_id}", response_model=VehicleTypeConfigurationResponse)
-async def update_config_service_value(
+def update_config_service_value(
     db: SessionDep,
     vehicle_type_id: int,
     km_value: Optional[float] = Query(None, description="Valor por kilómetro"),
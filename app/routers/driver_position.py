@@ -2,14 +2,15 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, S
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.models.driver_position import DriverPositionCreate, DriverPositionRead
-from app.core.db import get_session
+from app.core.db import get_session, AsyncSessionDep
 from app.services.driver_position_service import DriverPositionService
-from app.models.project_settings import ProjectSettings
+from app.services.project_settings_service import project_settings_cache
 from uuid import UUID
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from app.models.driver_info import DriverInfo
-from app.models.user_has_roles import UserHasRole, RoleStatus
 from app.core.dependencies.auth import get_current_user
+from app.core.dependencies.roles import require_role_async
+from app.services.role_cache_service import role_cache
 
 router = APIRouter(prefix="/drivers-position", tags=["drivers-position"])
 
@@ -31,31 +32,15 @@ Registra o actualiza la posición actual del conductor autenticado (se toma el u
 Devuelve la posición registrada del conductor.
 """
 )
-def create_driver_position(
+async def create_driver_position(
     request: Request,
     data: DriverPositionCreate,
-    session: Session = Depends(get_session),
-    current_user=Depends(get_current_user)
+    current_user=Depends(get_current_user),
+    user_id: UUID = Depends(require_role_async(
+        "DRIVER", detail="El usuario no tiene el rol de conductor aprobado"))
 ):
-    # Obtener el user_id desde el token
-    user_id = request.state.user_id
-
-    # Validar que el usuario tenga el rol DRIVER aprobado
-    driver_role = session.query(UserHasRole).filter(
-        UserHasRole.id_user == user_id,
-        UserHasRole.id_rol == "DRIVER",
-        UserHasRole.status == RoleStatus.APPROVED
-    ).first()
-
-    if not driver_role:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="El usuario no tiene el rol de conductor aprobado"
-        )
-
-    service = DriverPositionService(session)
-    obj = service.create_driver_position(data, user_id)
-    return DriverPositionRead.from_orm_with_point(obj)
+    # La posición va al pipeline de ingesta en memoria; solo la validación de rol usa la base de datos
+    return DriverPositionService(None).create_driver_position(data, user_id)
 
 
 @router.get(
@@ -68,27 +53,29 @@ Devuelve la posición actual del conductor autenticado (toma el user_id desde el
 Incluye la latitud, longitud y (si aplica) la distancia al punto de búsqueda.
 """
 )
-def get_driver_position(
+async def get_driver_position(
     request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSessionDep,
     current_user=Depends(get_current_user)
 ):
     # Obtener el user_id desde el token
     user_id = request.state.user_id
-    # Buscar el driver_info correspondiente a este usuario
-    driver_info = session.query(DriverInfo).filter(
-        DriverInfo.user_id == user_id).first()
-    if not driver_info:
-        raise HTTPException(
-            status_code=404, detail="No se encontró información de conductor para este usuario.")
-    id_driver = driver_info.id
-    # Usar el servicio existente para obtener la posición
-    service = DriverPositionService(session)
-    obj = service.get_driver_position(id_driver)
-    if not obj:
+
+    def find_position(sync_session: Session):
+        # Buscar el driver_info correspondiente a este usuario
+        driver_info = sync_session.query(DriverInfo).filter(
+            DriverInfo.user_id == user_id).first()
+        if not driver_info:
+            raise HTTPException(
+                status_code=404, detail="No se encontró información de conductor para este usuario.")
+        # driver_position se indexa por el user_id del conductor
+        return DriverPositionService(sync_session).get_driver_position(driver_info.user_id)
+
+    position = await session.run_sync(find_position)
+    if not position:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Conductor no encontrado o sin posición registrada")
-    return DriverPositionRead.from_orm_with_point(obj)
+    return position
 
 
 @router.delete(
@@ -101,24 +88,26 @@ Elimina la posición registrada del conductor autenticado (toma el user_id desde
 No retorna contenido si la eliminación fue exitosa.
 """
 )
-def delete_my_driver_position(
+async def delete_my_driver_position(
     request: Request,
-    session: Session = Depends(get_session),
+    session: AsyncSessionDep,
     current_user=Depends(get_current_user)
 ):
     # Obtener el user_id desde el token
     user_id = request.state.user_id
     print(f"user_id: {user_id}")
-    # Buscar el driver_info correspondiente a este usuario
-    driver_info = session.query(DriverInfo).filter(
-        DriverInfo.user_id == user_id).first()
-    if not driver_info:
-        raise HTTPException(
-            status_code=404, detail="No se encontró información de conductor para este usuario.")
-    id_driver = driver_info.user_id
-    # Usar el servicio existente para eliminar la posición
-    service = DriverPositionService(session)
-    success = service.delete_driver_position(id_driver)
+
+    def delete_position(sync_session: Session):
+        # Buscar el driver_info correspondiente a este usuario
+        driver_info = sync_session.query(DriverInfo).filter(
+            DriverInfo.user_id == user_id).first()
+        if not driver_info:
+            raise HTTPException(
+                status_code=404, detail="No se encontró información de conductor para este usuario.")
+        # Usar el servicio existente para eliminar la posición
+        return DriverPositionService(sync_session).delete_driver_position(driver_info.user_id)
+
+    success = await session.run_sync(delete_position)
     if not success:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Conductor no encontrado o sin posición registrada")
@@ -151,9 +140,10 @@ def get_nearby_drivers(
         None, description="Distancia máxima en kilómetros (por defecto: valor de configuración)"),
     session: Session = Depends(get_session)
 ):
-    # Si no se especifica max_distance, obtener el valor de ProjectSettings id=1
+    # Síncrono: project_settings_cache (Redis) y el cálculo sobre el índice corren en el threadpool
+    # Si no se especifica max_distance, usar driver_dist de la configuración del proyecto
     if max_distance is None:
-        setting = session.get(ProjectSettings, 1)
+        setting = project_settings_cache.get(session)
         if setting is not None:
             try:
                 max_distance = float(setting.driver_dist)
@@ -178,17 +168,14 @@ def get_drivers_by_client_request(
     session: Session = Depends(get_session),
     current_user=Depends(get_current_user)
 ):
+    # Síncrono: role_cache y reference_data pueden ir a Redis
     user_id = request.state.user_id
-    # Consultar el rol real del usuario en la base de datos
-    user_has_role = session.query(UserHasRole).filter(
-        UserHasRole.id_user == user_id,
-        UserHasRole.status == RoleStatus.APPROVED
-    ).first()
-    if not user_has_role:
+    # Rol aprobado del usuario (desde la caché de roles)
+    user_role = role_cache.approved_role(session, user_id)  # 'DRIVER' o 'CLIENT'
+    if not user_role:
         print(f"[ERROR] El usuario {user_id} no tiene rol aprobado")
         raise HTTPException(
             status_code=403, detail="No tiene rol asignado o aprobado")
-    user_role = user_has_role.id_rol  # 'DRIVER' o 'CLIENT'
     print(f"[DEBUG] user_id: {user_id}, user_role: {user_role}")
     service = DriverPositionService(session)
     return service.get_nearby_drivers_by_client_request(id_client_request, user_id, user_role)
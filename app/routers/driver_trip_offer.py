@@ -6,7 +6,7 @@ from app.services.driver_trip_offer_service import DriverTripOfferService
 from uuid import UUID
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from app.core.dependencies.auth import get_current_user
-from app.models.user_has_roles import UserHasRole, RoleStatus
+from app.services.role_cache_service import role_cache
 
 router = APIRouter(prefix="/driver-trip-offers", tags=["driver-trip-offers"])
 
@@ -31,6 +31,7 @@ def create_driver_trip_offer(
     session: Session = Depends(get_session),
     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
 ):
+    # Síncrono a propósito: create_offer consulta role_cache e invalida offers_cache (Redis)
     user_id = request.state.user_id
     # Creamos un nuevo objeto con el id_driver del token
     data_dict = data.dict()
@@ -54,17 +55,14 @@ def get_offers_by_client_request(
     session: Session = Depends(get_session),
     current_user=Depends(get_current_user)
 ):
+    # Síncrono a propósito: offers_cache (Redis), índice de posiciones y numpy en el threadpool
     user_id = request.state.user_id
-    # Consultar el rol real del usuario en la base de datos
-    user_has_role = session.query(UserHasRole).filter(
-        UserHasRole.id_user == user_id,
-        UserHasRole.status == RoleStatus.APPROVED
-    ).first()
-    if not user_has_role:
+    # Rol aprobado del usuario (desde la caché de roles)
+    user_role = role_cache.approved_role(session, user_id)  # 'DRIVER' o 'CLIENT'
+    if not user_role:
         print(f"[ERROR] El usuario {user_id} no tiene rol aprobado")
         raise HTTPException(
             status_code=403, detail="No tiene rol asignado o aprobado")
-    user_role = user_has_role.id_rol  # 'DRIVER' o 'CLIENT'
     print(f"[DEBUG] user_id: {user_id}, user_role: {user_role}")
     service = DriverTripOfferService(session)
     return service.get_offers_by_client_request(id_client_request, user_id, user_role)
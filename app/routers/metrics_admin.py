@@ -0,0 +1,90 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from app.core.db import async_engine_if_created, engine
+from app.core.dependencies.admin_auth import get_current_admin
+from app.core.pool_metrics import pool_stats
+from app.services.distance_matrix_service import distance_cache_stats
+from app.services.driver_trip_offer_service import offers_cache
+from app.services.fare_quote_service import fare_cache, quote_cache
+from app.services.presence_service import driver_presence
+from app.services.reference_data_service import reference_data
+from app.services.role_cache_service import role_cache
+
+router = APIRouter(prefix="/metrics", tags=["ADMIN"])
+
+
+@router.get("/cache", description="""
+Estadísticas de las cachés de este worker: aciertos, fallos y tasa de aciertos.
+
+**Respuesta:**
+- `distance_matrix`: caché de Google Distance Matrix (incluye llamadas reales y coalescidas).
+- `fare`: tarifas por (celda origen, celda destino, tipo de servicio, versión de tarifas).
+- `fare_quote`: cotizaciones emitidas por quote_id.
+- `offers`: ofertas por solicitud.
+- `roles`: roles y estado de aprobación por usuario.
+- `reference_data`: versión de tarifas vigente y cantidad de recargas.
+""")
+def get_cache_metrics(current_admin=Depends(get_current_admin)):
+    refs = reference_data.get()
+    return {
+        "distance_matrix": distance_cache_stats(),
+        "fare": fare_cache.stats(),
+        "fare_quote": quote_cache.stats(),
+        "offers": offers_cache.stats(),
+        "roles": role_cache.stats(),
+        "reference_data": {
+            "version": refs.version,
+            "tariff_version": refs.tariff_version,
+            "loads": reference_data.loads
+        }
+    }
+
+
+@router.get("/db-pool", description="""
+Estado de los pools de conexiones de este worker y tiempos de espera por una conexión.
+
+**Respuesta (por engine, `sync` y `async`):**
+- `size`, `checked_out`, `checked_in`, `overflow`: conexiones del pool en este momento.
+- `checkouts`, `timeouts`: conexiones entregadas y esperas que superaron DB_POOL_TIMEOUT_SECONDS.
+- `wait_avg_ms`, `wait_max_ms`: espera por una conexión (incluye abrir una nueva).
+- `checkout_latency_ms`: histograma acumulado de esa espera (clave = límite superior en ms).
+""")
+def get_db_pool_metrics(current_admin=Depends(get_current_admin)):
+    async_engine = async_engine_if_created()
+    return {
+        "sync": pool_stats(engine),
+        "async": pool_stats(async_engine.sync_engine) if async_engine is not None else None
+    }
+
+
+@router.get("/presence", description="""
+Conductores en línea en este worker (heartbeat o posición dentro de PRESENCE_TTL_SECONDS).
+
+**Parámetros opcionales:**
+- `lat`, `lng`: devuelve además los conductores en línea en la celda de ese punto.
+- `vehicle_type_id`: filtra los conteos por tipo de vehículo.
+
+**Respuesta:**
+- `online`, `by_vehicle_type`: conductores en línea, en total y por tipo de vehículo.
+- `cells`, `busiest_cells`: celdas con conductores y las de más oferta (esquina suroeste).
+- `heartbeats`, `evicted`: heartbeats recibidos y conductores retirados por TTL.
+- `cell`: conteo en la celda de (`lat`, `lng`), si se enviaron.
+""")
+def get_presence_metrics(
+    lat: Optional[float] = Query(None),
+    lng: Optional[float] = Query(None),
+    vehicle_type_id: Optional[int] = Query(None),
+    current_admin=Depends(get_current_admin)
+):
+    stats = driver_presence.stats()
+    if vehicle_type_id is not None:
+        stats["online_vehicle_type"] = driver_presence.online_count(vehicle_type_id)
+    if lat is not None and lng is not None:
+        stats["cell"] = {
+            "lat": lat,
+            "lng": lng,
+            "online": driver_presence.online_in_cell(lat, lng, vehicle_type_id)
+        }
+    return stats
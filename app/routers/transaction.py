@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, Request, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.core.db import SessionDep
+from app.core.db import AsyncSessionDep
 from app.services.transaction_service import TransactionService
 from app.models.transaction import TransactionType, TransactionCreate
 
@@ -13,23 +13,21 @@ bearer_scheme = HTTPBearer()
 
 
 @router.get("/balance/me", description="Consulta el saldo (available, withdrawable y mount) del usuario autenticado.")
-def get_my_balance(request: Request,
-                    session: SessionDep,
+async def get_my_balance(request: Request,
+                    session: AsyncSessionDep,
                     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
                     ):
     user_id = request.state.user_id  # <-- lo tomas del token
-    service = TransactionService(session)
-    return service.get_user_balance(user_id)
+    return await session.run_sync(lambda s: TransactionService(s).get_user_balance(user_id))
 
 
 
 
 
 @router.get("/list/me", description="Lista todas las transacciones del usuario autenticado.")
-def list_my_transactions(request: Request,
-                        session: SessionDep,
+async def list_my_transactions(request: Request,
+                        session: AsyncSessionDep,
                         credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
                         ):
     user_id = request.state.user_id  # <-- lo tomas del token
-    service = TransactionService(session)
-    return service.list_transactions(user_id)
+    return await session.run_sync(lambda s: TransactionService(s).list_transactions(user_id))
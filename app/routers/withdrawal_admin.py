@@ -36,7 +36,7 @@ Actualiza el estado de un retiro (withdrawal) por su ID. Este endpoint está sep
 **Respuesta:**
 Devuelve el objeto de retiro actualizado.
 """)
-async def update_withdrawal_status(
+def update_withdrawal_status(
     withdrawal_id: UUID,
     data: UpdateWithdrawalStatusRequest,
     request: Request,
@@ -76,7 +76,7 @@ Lista los retiros filtrados por status.
 **Respuesta:**
 Devuelve una lista de retiros con información detallada del usuario y la cuenta bancaria.
 """)
-async def list_withdrawals(
+def list_withdrawals(
     filters: ListWithdrawalsRequest,
     session: SessionDep,
     current_admin=Depends(get_current_admin)
@@ -2,6 +2,7 @@ from sqlmodel import Session, select
 from app.models.bank import Bank
 from typing import List, Optional
 from fastapi import HTTPException
+from app.services.reference_data_service import reference_data
 
 
 class BankService:
@@ -22,6 +23,7 @@ class BankService:
         self.session.add(bank)
         self.session.commit()
         self.session.refresh(bank)
+        reference_data.invalidate()
         return bank
 
     def update_bank(self, bank_id: int, bank_data: dict) -> Bank:
@@ -32,10 +34,12 @@ class BankService:
         self.session.add(bank)
         self.session.commit()
         self.session.refresh(bank)
+        reference_data.invalidate()
         return bank
 
     def delete_bank(self, bank_id: int) -> dict:
         bank = self.get_bank(bank_id)
         self.session.delete(bank)
         self.session.commit()
+        reference_data.invalidate()
         return {"message": "Bank deleted successfully"}
@@ -12,7 +12,10 @@ from app.core.config import settings
 from app.models.user_has_roles import UserHasRole, RoleStatus
 from app.models.driver_info import DriverInfo
 from app.models.vehicle_info import VehicleInfo
-from app.services.driver_trip_offer_service import get_average_rating
+from app.services.rating_service import apply_rating, get_average_rating
+from app.services.enrichment_service import Enrichment
+from app.services.reference_data_service import reference_data
+from app.services.role_cache_service import role_cache
 from sqlalchemy.orm import selectinload
 import traceback
 from app.utils.geo_utils import wkb_to_coords
@@ -20,16 +23,116 @@ from app.models.type_service import TypeService
 from uuid import UUID
 from typing import Dict, Set
 from app.models.payment_method import PaymentMethod
+from app.services.driver_position_service import find_nearby_driver_positions
+from app.utils.geo_query import within_radius, distance_sphere
+from app.utils.geo_index import PartitionedGridIndex
+from app.utils.geo_array import coords_from_wkb
+from app.services.distance_matrix_service import get_distance_matrix, DistanceMatrixError
+from app.services.eta_service import eta_estimator
+from app.services.trip_trace_service import sync_trip_trace
+import time
+
+
+OPEN_REQUEST_MAX_AGE = timedelta(minutes=10080)  # 7 días
+
+# Índice en memoria de las solicitudes en estado CREATED, particionado por type_service_id
+open_request_index = PartitionedGridIndex(cell_deg=settings.GEO_INDEX_CELL_DEG)
+
+
+def load_open_request_index(session: Session):
+    """Carga (o recarga) el índice de solicitudes abiertas desde client_request."""
+    started_at = time.time()
+    time_limit = datetime.utcnow() - OPEN_REQUEST_MAX_AGE
+    rows = session.query(
+        ClientRequest.id,
+        ClientRequest.type_service_id,
+        func.ST_Y(ClientRequest.pickup_position),
+        func.ST_X(ClientRequest.pickup_position),
+        ClientRequest.updated_at
+    ).filter(
+        ClientRequest.status == StatusEnum.CREATED,
+        ClientRequest.updated_at > time_limit
+    ).all()
+    open_request_index.load(
+        ((type_service_id, id, lat, lng, {"request_updated_at": updated_at})
+         for id, type_service_id, lat, lng, updated_at in rows),
+        started_at=started_at
+    )
+
+
+def ensure_open_request_index(session: Session):
+    """
+    Carga el índice si está frío. Las recargas periódicas (GEO_INDEX_RELOAD_SECONDS)
+    corren en segundo plano (index_reloader), no dentro de las peticiones.
+    """
+    if open_request_index.needs_reload(None):
+        load_open_request_index(session)
+
+
+def find_nearby_open_requests(session: Session, lat: float, lng: float, radius_m: float, type_service_ids=None):
+    """
+    Solicitudes en CREATED de los últimos 7 días a `radius_m` metros o menos del punto.
+    Usa el índice en memoria; si está deshabilitado (GEO_INDEX_ENABLED=False) consulta
+    client_request prefiltrando por el envolvente del radio (pickup_position es nullable y no
+    lleva índice SPATIAL; el prefiltro igual evita calcular la distancia en cada fila).
+
+    Returns:
+        Diccionario {id_client_request: distancia_m}
+    """
+    time_limit = datetime.utcnow() - OPEN_REQUEST_MAX_AGE
+    if settings.GEO_INDEX_ENABLED:
+        ensure_open_request_index(session)
+        candidates = open_request_index.nearby(
+            lat,
+            lng,
+            radius_m,
+            partitions=type_service_ids,
+            predicate=lambda entry: entry.data.get("request_updated_at") is None or entry.data["request_updated_at"] > time_limit
+        )
+        return {entry.key: distance for entry, distance in candidates}
+    distance = distance_sphere(ClientRequest.pickup_position, lat, lng)
+    query = session.query(ClientRequest.id, distance).filter(
+        ClientRequest.status == StatusEnum.CREATED,
+        ClientRequest.updated_at > time_limit,
+        within_radius(ClientRequest.pickup_position, lat, lng, radius_m)
+    )
+    if type_service_ids:
+        query = query.filter(ClientRequest.type_service_id.in_(type_service_ids))
+    return {id: float(dist) for id, dist in query.all()}
+
+
+def sync_open_request_index(client_request: ClientRequest, lat: float = None, lng: float = None):
+    """
+    Refleja en el índice el estado actual de una solicitud: se indexa mientras
+    esté en CREATED y se retira en cuanto cambia a cualquier otro estado.
+    """
+    if client_request.status != StatusEnum.CREATED:
+        open_request_index.remove(client_request.id)
+        return
+    if lat is None or lng is None:
+        coords = wkb_to_coords(client_request.pickup_position)
+        if not coords:
+            return
+        lat, lng = coords["lat"], coords["lng"]
+    open_request_index.upsert(
+        client_request.type_service_id,
+        client_request.id,
+        lat,
+        lng,
+        request_updated_at=client_request.updated_at
+    )
 
 
-def create_client_request(db: Session, data: ClientRequestCreate, id_client: UUID):
+def create_client_request(db: Session, data: ClientRequestCreate, id_client: UUID, quoted_fare: float = None):
+    # quoted_fare viene de fare_quote_service.resolve_quoted_fare (la cotización o la tarifa recalculada)
+    fare_offered = data.fare_offered if data.fare_offered is not None else quoted_fare
     pickup_point = from_shape(
         Point(data.pickup_lng, data.pickup_lat), srid=4326)
     destination_point = from_shape(
         Point(data.destination_lng, data.destination_lat), srid=4326)
     db_obj = ClientRequest(
         id_client=id_client,
-        fare_offered=data.fare_offered,
+        fare_offered=fare_offered,
         fare_assigned=data.fare_assigned,
         pickup_description=data.pickup_description,
         destination_description=data.destination_description,
@@ -43,66 +146,57 @@ def create_client_request(db: Session, data: ClientRequestCreate, id_client: UUI
     db.add(db_obj)
     db.commit()
     db.refresh(db_obj)
+    sync_open_request_index(db_obj, data.pickup_lat, data.pickup_lng)
     return db_obj
 
 
 def get_time_and_distance_service(origin_lat, origin_lng, destination_lat, destination_lng):
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    params = {
-        "origins": f"{origin_lat},{origin_lng}",
-        "destinations": f"{destination_lat},{destination_lng}",
-        "units": "metric",
-        "key": settings.GOOGLE_API_KEY
-    }
-    response = requests.get(url, params=params)
-    if response.status_code != 200:
-        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
-                            detail=f"Error en el API de Google Distance Matrix: {response.status_code}")
-    data = response.json()
-    if data.get("status") != "OK":
-        raise HTTPException(status_code=status.HTTP_200_OK,
-                            detail=f"Error en la respuesta del API de Google Distance Matrix: {data.get('status')}")
-    return data
+    try:
+        return get_distance_matrix([(origin_lat, origin_lng)], [(destination_lat, destination_lng)])
+    except DistanceMatrixError as e:
+        if e.status_code is not None:
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+        raise HTTPException(status_code=status.HTTP_200_OK, detail=str(e))
 
 
 def get_nearby_client_requests_service(driver_lat, driver_lng, session: Session, wkb_to_coords, type_service_ids=None):
-    driver_point = func.ST_GeomFromText(
-        f'POINT({driver_lng} {driver_lat})', 4326)
-    time_limit = datetime.now(timezone.utc) - \
-        timedelta(minutes=10080)  # 7 días
+    time_limit = datetime.utcnow() - OPEN_REQUEST_MAX_AGE
     distance_limit = 5000
-    base_query = (
+    # 1. Candidatos dentro del radio (índice en memoria o prefiltro espacial en MySQL)
+    distances = find_nearby_open_requests(
+        session, driver_lat, driver_lng, distance_limit, type_service_ids)
+    if not distances:
+        return []
+
+    # 2. Traer solo esas filas por clave primaria, revalidando el estado
+    query_results = (
         session.query(
             ClientRequest,
             User.full_name,
             User.country_code,
             User.phone_number,
-            TypeService.name.label("type_service_name"),
-            ST_Distance_Sphere(ClientRequest.pickup_position,
-                               driver_point).label("distance"),
-            func.timestampdiff(
-                text('MINUTE'),
-                ClientRequest.updated_at,
-                func.utc_timestamp()
-            ).label("time_difference")
+            TypeService.name.label("type_service_name")
         )
         .join(User, User.id == ClientRequest.id_client)
         .join(TypeService, TypeService.id == ClientRequest.type_service_id)
         .filter(
+            ClientRequest.id.in_(list(distances.keys())),
             ClientRequest.status == "CREATED",
             ClientRequest.updated_at > time_limit
         )
+        .all()
     )
-    if type_service_ids:
-        base_query = base_query.filter(
-            ClientRequest.type_service_id.in_(type_service_ids))
-    base_query = base_query.having(text(f"distance < {distance_limit}"))
+    now = datetime.utcnow()
+    # Decodificar todas las posiciones en lote en lugar de una por una con shapely
+    pickups = coords_from_wkb([row[0].pickup_position for row in query_results])
+    destinations = coords_from_wkb(
+        [row[0].destination_position for row in query_results])
+    enrichment = Enrichment(session).with_ratings(
+        "passenger", [row[0].id_client for row in query_results])
     results = []
-    query_results = base_query.all()
-    for row in query_results:
-        cr, full_name, country_code, phone_number, type_service_name, distance, time_difference = row
-        average_rating = get_average_rating(
-            session, "passenger", cr.id_client) if cr.id_client else 0.0
+    for row, pickup, destination in zip(query_results, pickups, destinations):
+        cr, full_name, country_code, phone_number, type_service_name = row
+        average_rating = enrichment.rating("passenger", cr.id_client)
         result = {
             "id": str(cr.id),
             "id_client": str(cr.id_client),
@@ -111,10 +205,10 @@ def get_nearby_client_requests_service(driver_lat, driver_lng, session: Session,
             "destination_description": cr.destination_description,
             "status": cr.status,
             "updated_at": cr.updated_at.isoformat(),
-            "pickup_position": wkb_to_coords(cr.pickup_position),
-            "destination_position": wkb_to_coords(cr.destination_position),
-            "distance": float(distance) if distance is not None else None,
-            "time_difference": int(time_difference) if time_difference is not None else None,
+            "pickup_position": pickup,
+            "destination_position": destination,
+            "distance": float(distances[cr.id]),
+            "time_difference": int((now - cr.updated_at).total_seconds() // 60),
             "type_service_id": cr.type_service_id,
             "type_service_name": type_service_name,
             "client": {
@@ -125,22 +219,14 @@ def get_nearby_client_requests_service(driver_lat, driver_lng, session: Session,
             }
         }
         results.append(result)
+    results.sort(key=lambda r: r["distance"])
     return results
 
 
 def assign_driver_service(session: Session, id: UUID, id_driver_assigned: UUID, fare_assigned: float = None):
     # Validación: El conductor debe tener el rol DRIVER y status APPROVED
     try:
-        user_role = session.query(UserHasRole).filter(
-            UserHasRole.id_user == id_driver_assigned,
-            UserHasRole.id_rol == "DRIVER"
-        ).first()
-
-        print("DEBUG user_role:", user_role)
-        if user_role:
-            print("DEBUG user_role.status:", user_role.status)
-
-        if not user_role or user_role.status != RoleStatus.APPROVED:
+        if not role_cache.has_role(session, id_driver_assigned, "DRIVER"):
             print("DEBUG: No tiene rol DRIVER aprobado")
             raise HTTPException(
                 status_code=400,
@@ -157,6 +243,7 @@ def assign_driver_service(session: Session, id: UUID, id_driver_assigned: UUID,
         if fare_assigned is not None:
             client_request.fare_assigned = fare_assigned
         session.commit()
+        sync_open_request_index(client_request)
         return {"success": True, "message": "Conductor asignado correctamente"}
     except Exception as e:
         print("TRACEBACK:")
@@ -172,6 +259,8 @@ def update_status_service(session: Session, id_client_request: UUID, status: str
     client_request.status = status
     client_request.updated_at = datetime.utcnow()
     session.commit()
+    sync_open_request_index(client_request)
+    sync_trip_trace(session, client_request)
     return {"success": True, "message": "Status actualizado correctamente"}
 
 
@@ -238,16 +327,9 @@ def get_client_request_detail_service(session: Session, client_request_id: UUID,
                     "vehicle_type_id": vi.vehicle_type_id
                 }
 
-    # Buscar información del método de pago si existe
-    payment_method = None
-    if cr.payment_method_id:
-        pm = session.query(PaymentMethod).filter(
-            PaymentMethod.id == cr.payment_method_id).first()
-        if pm:
-            payment_method = {
-                "id": pm.id,
-                "name": pm.name
-            }
+    # Método de pago y tipo de servicio salen de los datos de referencia en memoria
+    refs = reference_data.get(session)
+    payment_method = refs.payment_method(cr.payment_method_id)
 
     # Construir la respuesta completa
     response = {
@@ -271,8 +353,7 @@ def get_client_request_detail_service(session: Session, client_request_id: UUID,
     }
 
     # Obtener el nombre del tipo de servicio
-    type_service = session.query(TypeService).filter(
-        TypeService.id == cr.type_service_id).first()
+    type_service = refs.type_services.get(cr.type_service_id)
     if type_service:
         response["type_service_name"] = type_service.name
 
@@ -293,17 +374,9 @@ def get_client_requests_by_status_service(session: Session, status: str, user_id
         ClientRequest.id_client == user_id  # Filtrar por el usuario autenticado
     ).all()
 
-    # Crear un diccionario de métodos de pago para evitar múltiples consultas
-    payment_methods = {}
-    for cr in results:
-        if cr.payment_method_id and cr.payment_method_id not in payment_methods:
-            pm = session.query(PaymentMethod).filter(
-                PaymentMethod.id == cr.payment_method_id).first()
-            if pm:
-                payment_methods[cr.payment_method_id] = {
-                    "id": pm.id,
-                    "name": pm.name
-                }
+    # Métodos de pago de todas las solicitudes en una sola consulta
+    enrichment = Enrichment(session).with_payment_methods(
+        cr.payment_method_id for cr in results)
 
     # Construir la respuesta
     return [
@@ -323,7 +396,7 @@ def get_client_requests_by_status_service(session: Session, status: str, user_id
             "created_at": cr.created_at.isoformat(),
             "updated_at": cr.updated_at.isoformat(),
             "review": cr.review,
-            "payment_method": payment_methods.get(cr.payment_method_id) if cr.payment_method_id else None
+            "payment_method": enrichment.payment_method(cr.payment_method_id)
         }
         for cr in results
     ]
@@ -408,6 +481,8 @@ def update_client_rating_service(session: Session, id_client_request: UUID, clie
             detail="No tienes permiso para calificar esta solicitud. Solo el conductor asignado a esta solicitud puede calificar al cliente."
         )
 
+    apply_rating(session, "passenger", client_request.id_client,
+                 client_rating, client_request.client_rating)
     client_request.client_rating = client_rating
     client_request.updated_at = datetime.utcnow()
     session.commit()
@@ -462,6 +537,8 @@ def update_driver_rating_service(session: Session, id_client_request: UUID, driv
             detail="No tienes permiso para calificar esta solicitud. Solo el cliente que creó esta solicitud puede calificar al conductor."
         )
 
+    apply_rating(session, "driver", client_request.id_driver_assigned,
+                 driver_rating, client_request.driver_rating)
     client_request.driver_rating = driver_rating
     client_request.updated_at = datetime.utcnow()
     session.commit()
@@ -525,9 +602,8 @@ def get_nearby_requests(self, driver_id: UUID, lat: float, lng: float, max_dista
         )
 
     # Obtener el tipo de servicio que puede manejar el conductor
-    type_services = self.session.query(TypeService).filter(
-        TypeService.vehicle_type_id == driver_vehicle.vehicle_type_id
-    ).all()
+    type_services = reference_data.get(self.session).type_services_for_vehicle(
+        driver_vehicle.vehicle_type_id)
 
     if not type_services:
         raise HTTPException(
@@ -556,7 +632,8 @@ def get_nearby_drivers_service(
     client_lng: float,
     type_service_id: int,
     session: Session,
-    wkb_to_coords
+    wkb_to_coords,
+    exact_eta: bool = False
 ) -> list:
     """
     Obtiene los conductores cercanos a un cliente en un radio de 5km.
@@ -567,15 +644,16 @@ def get_nearby_drivers_service(
         type_service_id: ID del tipo de servicio solicitado
         session: Sesión de base de datos
         wkb_to_coords: Función para convertir WKB a coordenadas
+        exact_eta: Si es True, consulta Google para todos los conductores; si no,
+            solo para los ETA_GOOGLE_TOP_N más cercanos. Todos llevan `eta_estimate`;
+            `google_distance_matrix` es None en los que no se consultaron a Google
 
     Returns:
         Lista de conductores cercanos con su información
     """
     try:
         # 1. Obtener el tipo de servicio para validar el tipo de vehículo
-        type_service = session.query(TypeService).filter(
-            TypeService.id == type_service_id
-        ).first()
+        type_service = reference_data.get(session).type_services.get(type_service_id)
 
         if not type_service:
             raise HTTPException(
@@ -583,49 +661,39 @@ def get_nearby_drivers_service(
                 detail="Tipo de servicio no encontrado"
             )
 
-        # 2. Crear punto del cliente
-        client_point = func.ST_GeomFromText(
-            f'POINT({client_lng} {client_lat})', 4326)
-
-        # 3. Consulta base para obtener conductores cercanos
-        base_query = (
-            session.query(
-                User,
-                DriverInfo,
-                VehicleInfo,
-                ST_Distance_Sphere(DriverInfo.current_position,
-                                   client_point).label("distance")
-            )
+        # 2. Candidatos dentro de 5km, ya ordenados por distancia
+        distance_limit = 5000  # 5km en metros
+        candidates = find_nearby_driver_positions(
+            session, client_lat, client_lng, distance_limit)
+        if not candidates:
+            return []
+        candidate_positions = {
+            id_driver: (lat, lng, distance) for id_driver, lat, lng, distance in candidates}
+
+        # 3. Validar rol, estado y tipo de vehículo solo para los candidatos
+        query_results = (
+            session.query(User, DriverInfo, VehicleInfo)
             .join(UserHasRole, UserHasRole.id_user == User.id)
             .join(DriverInfo, DriverInfo.user_id == User.id)
             .join(VehicleInfo, VehicleInfo.driver_info_id == DriverInfo.id)
             .filter(
+                User.id.in_(list(candidate_positions.keys())),
                 UserHasRole.id_rol == "DRIVER",
                 UserHasRole.status == RoleStatus.APPROVED,
-                DriverInfo.is_active == True,
-                DriverInfo.current_position.isnot(None),
+                User.is_active == True,
                 VehicleInfo.vehicle_type_id == type_service.vehicle_type_id
             )
+            .all()
         )
 
-        # 4. Filtrar por distancia (5km)
-        distance_limit = 5000  # 5km en metros
-        base_query = base_query.having(text(f"distance < {distance_limit}"))
-
-        # 5. Ejecutar consulta
+        # 4. Construir la respuesta
+        enrichment = Enrichment(session).with_ratings(
+            "driver", [row[0].id for row in query_results])
         results = []
-        query_results = base_query.all()
+        for user, driver_info, vehicle_info in query_results:
+            driver_lat, driver_lng, distance = candidate_positions[user.id]
 
-        for row in query_results:
-            user, driver_info, vehicle_info, distance = row
-
-            # Calcular calificación promedio del conductor
-            avg_rating = session.query(
-                func.avg(ClientRequest.driver_rating)
-            ).filter(
-                ClientRequest.id_driver_assigned == user.id,
-                ClientRequest.driver_rating.isnot(None)
-            ).scalar() or 0.0
+            avg_rating = enrichment.rating("driver", user.id)
 
             result = {
                 "id": user.id,
@@ -634,8 +702,8 @@ def get_nearby_drivers_service(
                     "first_name": driver_info.first_name,
                     "last_name": driver_info.last_name,
                     "email": driver_info.email,
-                    "selfie_url": driver_info.selfie_url,
-                    "current_position": wkb_to_coords(driver_info.current_position)
+                    "selfie_url": user.selfie_url,
+                    "current_position": {"lat": driver_lat, "lng": driver_lng}
                 },
                 "vehicle_info": {
                     "id": vehicle_info.id,
@@ -646,39 +714,40 @@ def get_nearby_drivers_service(
                     "plate": vehicle_info.plate,
                     "vehicle_type_id": vehicle_info.vehicle_type_id
                 },
-                "distance": float(distance) if distance is not None else None,
+                "distance": float(distance),
                 "rating": float(avg_rating),
                 "phone_number": user.phone_number,
                 "country_code": user.country_code
             }
             results.append(result)
 
-        # 6. Obtener tiempos estimados de Google Distance Matrix
+        # 5. Mantener el orden por cercanía
+        results.sort(key=lambda r: r["distance"])
+
+        # 6. Tiempos estimados: modelo local para todos, Google solo para los primeros
         if results:
+            eta_estimator.ensure_calibrated(session)
+            estimates = eta_estimator.estimate_elements(
+                [r["distance"] for r in results], type_service.vehicle_type_id)
+            for result, estimate in zip(results, estimates):
+                result['eta_estimate'] = estimate
+                # Solo datos reales de Google; los que quedan fuera del top-N llevan None
+                result['google_distance_matrix'] = None
+
+            exact = results if exact_eta else results[:settings.ETA_GOOGLE_TOP_N]
             driver_positions = [
-                f"{r['driver_info']['current_position']['lat']},{r['driver_info']['current_position']['lng']}"
-                for r in results
+                (r['driver_info']['current_position']['lat'],
+                 r['driver_info']['current_position']['lng'])
+                for r in exact
             ]
-            origins = '|'.join(driver_positions)
-            destination = f"{client_lat},{client_lng}"
-
-            url = 'https://maps.googleapis.com/maps/api/distancematrix/json'
-            params = {
-                'origins': origins,
-                'destinations': destination,
-                'units': 'metric',
-                'key': settings.GOOGLE_API_KEY,
-                'mode': 'driving'
-            }
-
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                google_data = response.json()
-                if google_data.get('status') == 'OK':
-                    elements = google_data['rows']
-                    for i, element in enumerate(elements):
-                        if i < len(results):
-                            results[i]['google_distance_matrix'] = element['elements'][0]
+            try:
+                if driver_positions:
+                    google_data = get_distance_matrix(
+                        driver_positions, [(client_lat, client_lng)])
+                    for result, row in zip(exact, google_data['rows']):
+                        result['google_distance_matrix'] = row['elements'][0]
+            except DistanceMatrixError as e:
+                print(f"[WARN] get_nearby_drivers_service: {e}")
 
         return results
 
@@ -758,12 +827,7 @@ def update_status_by_driver_service(session: Session, id_client_request: int, st
             status_code=400, detail=f"Estado inválido. Estados válidos: {[s.value for s in StatusEnum]}")
 
     # Validar rol del conductor
-    user_role = session.query(UserHasRole).filter(
-        UserHasRole.id_user == user_id,
-        UserHasRole.id_rol == "DRIVER",
-        UserHasRole.status == RoleStatus.APPROVED
-    ).first()
-    if not user_role:
+    if not role_cache.has_role(session, user_id, "DRIVER"):
         raise HTTPException(
             status_code=403, detail="Solo conductores aprobados pueden cambiar este estado")
 
@@ -798,6 +862,8 @@ def update_status_by_driver_service(session: Session, id_client_request: int, st
         client_request.status = new_status
         client_request.updated_at = datetime.utcnow()
         session.commit()
+        sync_open_request_index(client_request)
+        sync_trip_trace(session, client_request)
         return {"success": True, "message": "Status actualizado correctamente"}
     except Exception as e:
         session.rollback()
@@ -810,12 +876,7 @@ def client_canceled_service(session: Session, id_client_request: int, user_id: i
     Permite al cliente (dueño de la solicitud) cancelar su solicitud (cambiando su estado a CANCELLED) únicamente si la solicitud está en CREATED o ACCEPTED.
     """
     # Validar rol del cliente (que sea CLIENT y esté aprobado)
-    user_role = session.query(UserHasRole).filter(
-        UserHasRole.id_user == user_id,
-        UserHasRole.id_rol == "CLIENT",
-        UserHasRole.status == RoleStatus.APPROVED
-    ).first()
-    if not user_role:
+    if not role_cache.has_role(session, user_id, "CLIENT"):
         raise HTTPException(
             status_code=403, detail="Solo clientes aprobados pueden cancelar su solicitud.")
 
@@ -839,6 +900,7 @@ def client_canceled_service(session: Session, id_client_request: int, user_id: i
     client_request.status = StatusEnum.CANCELLED
     client_request.updated_at = datetime.utcnow()
     session.commit()
+    sync_open_request_index(client_request)
     return {"success": True, "message": "Solicitud cancelada (estado actualizado a CANCELLED) correctamente."}
 
 
@@ -848,12 +910,7 @@ def update_status_to_paid_service(session: Session, id_client_request: int, user
     Solo se puede cambiar a PAID desde FINISHED y solo por el cliente dueño de la solicitud.
     """
     # Validar rol del cliente
-    user_role = session.query(UserHasRole).filter(
-        UserHasRole.id_user == user_id,
-        UserHasRole.id_rol == "CLIENT",
-        UserHasRole.status == RoleStatus.APPROVED
-    ).first()
-    if not user_role:
+    if not role_cache.has_role(session, user_id, "CLIENT"):
         raise HTTPException(
             status_code=403, detail="Solo clientes aprobados pueden realizar pagos")
 
@@ -879,6 +936,7 @@ def update_status_to_paid_service(session: Session, id_client_request: int, user
     client_request.status = StatusEnum.PAID
     client_request.updated_at = datetime.utcnow()
     session.commit()
+    sync_open_request_index(client_request)
     return {"success": True, "message": "Pago registrado correctamente"}
 
 
@@ -1,8 +1,17 @@
 from typing import Optional, Dict, Any,List
 from datetime import datetime
 from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
 from app.models.config_service_value import ConfigServiceValue, FareCalculationResponse 
-import requests
+from app.services.distance_matrix_service import get_distance_matrix_async, DistanceMatrixError
+from app.services.reference_data_service import reference_data
+from app.services.fare_quote_service import compute_fares, create_fare_quote, fare_cache, fare_cache_key
+
+
+def _invalidate_tariffs():
+    reference_data.invalidate()
+    # Las claves viejas ya no se consultan (llevan la versión anterior); se limpian para no esperar el TTL
+    fare_cache.clear()
 
 
 class ConfigServiceValueService:
@@ -28,6 +37,7 @@ class ConfigServiceValueService:
         self.session.add(config_service_value)
         self.session.commit()
         self.session.refresh(config_service_value)
+        _invalidate_tariffs()
         return config_service_value
 
     def get_config_service_value_by_id(self, id: int) -> Optional[ConfigServiceValue]:
@@ -67,6 +77,7 @@ class ConfigServiceValueService:
         config_service_value.updated_at = datetime.utcnow()
         self.session.commit()
         self.session.refresh(config_service_value)
+        _invalidate_tariffs()
         return config_service_value
 
     def update_by_vehicle_type_id(self, vehicle_type_id: int, update_data: dict):
@@ -85,23 +96,47 @@ class ConfigServiceValueService:
         config.updated_at = datetime.utcnow()
         self.session.commit()
         self.session.refresh(config)
+        _invalidate_tariffs()
         return config
 
-    def get_google_distance_data(self, origin_lat, origin_lng, destination_lat, destination_lng, api_key):
-        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-        params = {
-            "origins": f"{origin_lat},{origin_lng}",
-            "destinations": f"{destination_lat},{destination_lng}",
-            "units": "metric",
-            "key": api_key
-        }
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            raise Exception(f"Error en el API de Google Distance Matrix: {response.status_code}")
-        data = response.json()
-        if data.get("status") != "OK":
-            raise Exception(f"Error en la respuesta del API de Google Distance Matrix: {data.get('status')}")
-        return data  
+    async def get_google_distance_data(self, origin_lat, origin_lng, destination_lat, destination_lng, api_key):
+        # api_key se mantiene por compatibilidad; la consulta usa settings.GOOGLE_API_KEY
+        try:
+            return await get_distance_matrix_async([(origin_lat, origin_lng)], [(destination_lat, destination_lng)])
+        except DistanceMatrixError as e:
+            raise Exception(str(e))
+
+    async def create_quote(self, user_id, origin_lat, origin_lng, destination_lat, destination_lng, type_service_ids=None) -> dict:
+        """
+        Cotiza todos los tipos de servicio (o `type_service_ids`) con una sola
+        consulta de ruta; ver fare_quote_service.create_fare_quote.
+        """
+        return await create_fare_quote(
+            self.session, user_id, (origin_lat, origin_lng), (destination_lat, destination_lng), type_service_ids)
+
+    async def get_fare(self, type_service_id: int, origin_lat, origin_lng, destination_lat, destination_lng) -> Optional[FareCalculationResponse]:
+        """
+        Tarifa de un recorrido para un tipo de servicio. Se reutiliza la calculada
+        para otro recorrido entre las mismas celdas de origen y destino, con el
+        mismo tipo de servicio y la misma versión de tarifas (ver fare_cache).
+        Los datos de referencia y la caché (que puede ser Redis síncrono) se
+        consultan en el threadpool, fuera del event loop.
+        """
+        refs = await run_in_threadpool(reference_data.get, self.session)
+        if type_service_id not in refs.config_values:
+            return None
+        key = fare_cache_key((origin_lat, origin_lng), (destination_lat, destination_lng),
+                             type_service_id, refs.tariff_version)
+        cached = await run_in_threadpool(fare_cache.get, key)
+        if cached is not None:
+            return FareCalculationResponse(**cached)
+
+        google_data = await self.get_google_distance_data(
+            origin_lat, origin_lng, destination_lat, destination_lng, None)
+        result = await self.calculate_total_value(type_service_id, google_data)
+        if result is not None:
+            await run_in_threadpool(fare_cache.set, key, result.model_dump())
+        return result
 
     async def calculate_total_value(self, id: int, google_data: Dict) -> FareCalculationResponse:
         """
@@ -110,30 +145,21 @@ class ConfigServiceValueService:
 
         
         try:
-            # Obtener el registro de tarifas
-            config_service_value = self.get_config_service_value_by_id(id)
+            # Obtener el registro de tarifas (desde los datos de referencia en memoria)
+            refs = await run_in_threadpool(reference_data.get, self.session)
+            config_service_value = refs.config_values.get(id)
             if not config_service_value:
                 return None
 
             # Extraer los datos usando el modelo Pydantic
             element = google_data["rows"][0]["elements"][0]
 
-            # Cálculos
-            distance_km = element["distance"]["value"] / 1000.0
-            time_minutes = element["duration"]["value"] / 60.00
-
-            # Calcular el costo
-            distance_cost = distance_km * config_service_value.km_value
-            time_cost = time_minutes * config_service_value.min_value
-          
-            total_cost = distance_cost + time_cost
-
-            # Aplicar tarifa mínima si existe
-            if config_service_value.tarifa_value is not None:
-                total_cost = max(total_cost, config_service_value.tarifa_value)
+            # Calcular el costo (misma fórmula que las cotizaciones, con tarifa mínima)
+            total_cost = float(compute_fares(
+                element["distance"]["value"], element["duration"]["value"], [config_service_value])[0])
 
             return FareCalculationResponse(
-                recommended_value=round(total_cost, 2),
+                recommended_value=total_cost,
                 destination_addresses=google_data["destination_addresses"][0],
                 origin_addresses=google_data["origin_addresses"][0],
                 distance=element["distance"]["text"],
@@ -0,0 +1,146 @@
+import asyncio
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
+
+import anyio
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.sio_events import emit_to_user
+from app.models.client_request import ClientRequest, StatusEnum
+from app.models.driver_info import DriverInfo
+from app.models.driver_trip_offer import DriverTripOffer
+from app.models.type_service import TypeService
+from app.models.user import User
+from app.models.user_has_roles import UserHasRole, RoleStatus
+from app.models.vehicle_info import VehicleInfo
+from app.services.driver_position_service import find_nearby_driver_positions
+from app.services.eta_service import eta_estimator
+from app.utils.geo_array import points_from_wkb
+
+
+def eligible_driver_ids(session: Session, driver_ids: Sequence[UUID], vehicle_type_id: int) -> Set[UUID]:
+    """Conductores de `driver_ids` con rol DRIVER aprobado, activos y con vehículo del tipo pedido."""
+    if not driver_ids:
+        return set()
+    rows = (
+        session.query(User.id)
+        .join(UserHasRole, UserHasRole.id_user == User.id)
+        .join(DriverInfo, DriverInfo.user_id == User.id)
+        .join(VehicleInfo, VehicleInfo.driver_info_id == DriverInfo.id)
+        .filter(
+            User.id.in_(list(driver_ids)),
+            UserHasRole.id_rol == "DRIVER",
+            UserHasRole.status == RoleStatus.APPROVED,
+            User.is_active == True,
+            VehicleInfo.vehicle_type_id == vehicle_type_id
+        )
+        .all()
+    )
+    return {row[0] for row in rows}
+
+
+def select_dispatch_candidates(
+    session: Session,
+    id_client_request: UUID,
+    radius_m: float,
+    k: int,
+    exclude: Iterable[UUID] = ()
+) -> Optional[List[Tuple[UUID, float, int]]]:
+    """
+    Los `k` conductores elegibles más cercanos a la recogida dentro de `radius_m`,
+    sin repetir los de `exclude`, como tuplas (id_driver, distancia_m, vehicle_type_id).
+
+    Devuelve None si la solicitud ya no necesita despacho (no existe, no está en
+    CREATED o ya recibió alguna oferta).
+    """
+    row = (
+        session.query(ClientRequest, TypeService.vehicle_type_id)
+        .join(TypeService, TypeService.id == ClientRequest.type_service_id)
+        .filter(ClientRequest.id == id_client_request)
+        .first()
+    )
+    if row is None:
+        return None
+    client_request, vehicle_type_id = row
+    if client_request.status != StatusEnum.CREATED:
+        return None
+    has_offer = session.query(DriverTripOffer.id).filter(
+        DriverTripOffer.id_client_request == id_client_request).first()
+    if has_offer:
+        return None
+
+    lats, lngs = points_from_wkb([client_request.pickup_position])
+    exclude = set(exclude)
+    nearby = [
+        (id_driver, distance)
+        for id_driver, _, _, distance in find_nearby_driver_positions(session, lats[0], lngs[0], radius_m)
+        if id_driver not in exclude
+    ]
+    # Validar por bloques en orden de distancia hasta completar k
+    selected = []
+    step = max(k * 4, 50)
+    for start in range(0, len(nearby), step):
+        block = nearby[start:start + step]
+        eligible = eligible_driver_ids(
+            session, [id_driver for id_driver, _ in block], vehicle_type_id)
+        for id_driver, distance in block:
+            if id_driver in eligible:
+                selected.append((id_driver, distance, vehicle_type_id))
+                if len(selected) == k:
+                    return selected
+    return selected
+
+
+def _select_in_thread(id_client_request: UUID, radius_m: float, k: int, exclude: Set[UUID]):
+    with Session(engine) as session:
+        eta_estimator.ensure_calibrated(session)
+        return select_dispatch_candidates(session, id_client_request, radius_m, k, exclude)
+
+
+async def dispatch_client_request(
+    id_client_request: UUID,
+    radii_m: Optional[Sequence[float]] = None,
+    k: Optional[int] = None,
+    wave_seconds: Optional[float] = None
+) -> Set[UUID]:
+    """
+    Ofrece una solicitud recién creada a los conductores más cercanos, por oleadas.
+
+    En cada oleada se notifica a los `k` mejores conductores elegibles que aún no
+    la recibieron dentro del radio de esa oleada y se espera `wave_seconds`; si en
+    ese tiempo nadie ofertó (y la solicitud sigue en CREATED), se pasa al siguiente
+    radio. Se ejecuta como tarea en segundo plano después de crear la solicitud.
+
+    Returns:
+        Conductores notificados
+    """
+    radii_m = radii_m or settings.DISPATCH_RADII_M
+    k = k or settings.DISPATCH_TOP_K
+    wave_seconds = settings.DISPATCH_WAVE_SECONDS if wave_seconds is None else wave_seconds
+    notified: Set[UUID] = set()
+    for wave, radius_m in enumerate(radii_m, start=1):
+        try:
+            candidates = await anyio.to_thread.run_sync(
+                _select_in_thread, id_client_request, radius_m, k, set(notified))
+        except Exception as e:
+            print(f"[ERROR] dispatch_client_request {id_client_request}: {e}")
+            return notified
+        if candidates is None:
+            break
+        if candidates:
+            road_m, seconds = eta_estimator.estimate(
+                [distance for _, distance, _ in candidates], candidates[0][2])
+            for (id_driver, distance, _), eta_m, eta_s in zip(candidates, road_m.tolist(), seconds.tolist()):
+                await emit_to_user(id_driver, 'created_client_request', {
+                    'id_client_request': str(id_client_request),
+                    'distance': float(distance),
+                    'eta_seconds': int(round(eta_s)),
+                    'eta_distance': int(round(eta_m)),
+                    'wave': wave
+                })
+                notified.add(id_driver)
+        if wave < len(radii_m):
+            await asyncio.sleep(wave_seconds)
+    return notified
@@ -0,0 +1,255 @@
+import asyncio
+import math
+import weakref
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import anyio.from_thread
+import anyio.to_thread
+import httpx
+
+from app.core.cache import build_cache
+from app.core.config import settings
+
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+Coord = Tuple[float, float]
+
+distance_cache = build_cache(
+    "distance_matrix",
+    maxsize=settings.DISTANCE_CACHE_MAXSIZE,
+    ttl=settings.DISTANCE_CACHE_TTL_SECONDS
+)
+
+
+class DistanceMatrixError(Exception):
+    """Error de Google Distance Matrix: respuesta HTTP distinta de 200 o status distinto de OK."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, api_status: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.api_status = api_status
+
+
+def snap(lat: float, lng: float, cell_deg: Optional[float] = None) -> str:
+    """Celda (fila, columna) que contiene el punto, como texto para usar en claves de caché."""
+    cell_deg = cell_deg or settings.DISTANCE_CACHE_CELL_DEG
+    return f"{math.floor(float(lat) / cell_deg)},{math.floor(float(lng) / cell_deg)}"
+
+
+def cache_key(origin: Coord, destination: Coord, mode: str) -> str:
+    return f"{mode}:{snap(*origin)}:{snap(*destination)}"
+
+
+class DistanceMatrixClient:
+    """
+    Cliente asíncrono de Google Distance Matrix.
+
+    - Un httpx.AsyncClient por event loop, con conexiones keep-alive y timeout.
+    - Divide las listas grandes en bloques que respetan los límites del API
+      (25 orígenes, 25 destinos y 100 elementos por petición) y los consulta
+      en paralelo.
+    - Si llega una petición idéntica a otra que sigue en curso, espera el mismo
+      resultado en lugar de repetir la llamada a Google.
+    """
+
+    MAX_ORIGINS = 25
+    MAX_DESTINATIONS = 25
+    MAX_ELEMENTS = 100
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.transport = transport
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, asyncio.Future]]" = weakref.WeakKeyDictionary()
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=settings.DISTANCE_MATRIX_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=settings.DISTANCE_MATRIX_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.DISTANCE_MATRIX_MAX_CONNECTIONS
+                )
+            )
+            self._clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Cierra el cliente del event loop actual (se llama al apagar la aplicación)."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def chunks(self, origins: Sequence[Coord], destinations: Sequence[Coord]) -> List[Tuple[range, range]]:
+        """Rangos (orígenes, destinos) de cada petición dentro de los límites del API."""
+        destination_step = min(self.MAX_DESTINATIONS, max(len(destinations), 1))
+        origin_step = min(self.MAX_ORIGINS, self.MAX_ELEMENTS // destination_step)
+        return [
+            (range(i, min(i + origin_step, len(origins))),
+             range(j, min(j + destination_step, len(destinations))))
+            for i in range(0, len(origins), origin_step)
+            for j in range(0, len(destinations), destination_step)
+        ]
+
+    async def _request(self, origins: Tuple[Coord, ...], destinations: Tuple[Coord, ...], mode: str) -> dict:
+        self.upstream_calls += 1
+        params = {
+            "origins": "|".join(f"{lat},{lng}" for lat, lng in origins),
+            "destinations": "|".join(f"{lat},{lng}" for lat, lng in destinations),
+            "units": "metric",
+            "mode": mode,
+            "key": settings.GOOGLE_API_KEY
+        }
+        try:
+            response = await self._client().get(DISTANCE_MATRIX_URL, params=params)
+        except httpx.HTTPError as e:
+            raise DistanceMatrixError(
+                f"Error de conexión con Google Distance Matrix: {e}", status_code=503)
+        if response.status_code != 200:
+            raise DistanceMatrixError(
+                f"Error en el API de Google Distance Matrix: {response.status_code}",
+                status_code=response.status_code)
+        data = response.json()
+        if data.get("status") != "OK":
+            raise DistanceMatrixError(
+                f"Error en la respuesta del API de Google Distance Matrix: {data.get('status')}",
+                api_status=data.get("status"))
+        return data
+
+    async def _request_coalesced(self, origins: Tuple[Coord, ...], destinations: Tuple[Coord, ...], mode: str) -> dict:
+        inflight = self._inflight.setdefault(asyncio.get_running_loop(), {})
+        key = (mode, origins, destinations)
+        future = inflight.get(key)
+        if future is not None:
+            self.coalesced_calls += 1
+            return await asyncio.shield(future)
+        future = asyncio.ensure_future(self._request(origins, destinations, mode))
+        inflight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                inflight.pop(key, None)
+            else:
+                future.add_done_callback(lambda _: inflight.pop(key, None))
+
+    async def fetch(self, origins: Sequence[Coord], destinations: Sequence[Coord], mode: str = "driving") -> dict:
+        """Matriz completa de `origins` x `destinations`, armada a partir de los bloques."""
+        blocks = self.chunks(origins, destinations)
+        responses = await asyncio.gather(*[
+            self._request_coalesced(
+                tuple(origins[i] for i in origin_range),
+                tuple(destinations[j] for j in destination_range),
+                mode
+            )
+            for origin_range, destination_range in blocks
+        ])
+        origin_addresses = [""] * len(origins)
+        destination_addresses = [""] * len(destinations)
+        rows = [[None] * len(destinations) for _ in origins]
+        for (origin_range, destination_range), data in zip(blocks, responses):
+            for row_pos, i in enumerate(origin_range):
+                origin_addresses[i] = data["origin_addresses"][row_pos]
+                elements = data["rows"][row_pos]["elements"]
+                for col_pos, j in enumerate(destination_range):
+                    destination_addresses[j] = data["destination_addresses"][col_pos]
+                    rows[i][j] = elements[col_pos]
+        return {
+            "status": "OK",
+            "origin_addresses": origin_addresses,
+            "destination_addresses": destination_addresses,
+            "rows": [{"elements": elements} for elements in rows]
+        }
+
+
+distance_matrix_client = DistanceMatrixClient()
+
+
+async def get_distance_matrix_async(origins: Sequence[Coord], destinations: Sequence[Coord], mode: str = "driving") -> dict:
+    """
+    Distance Matrix de `origins` x `destinations` ((lat, lng)) con la misma forma
+    que la respuesta de Google (status, origin_addresses, destination_addresses, rows).
+
+    Cada par se busca primero en la caché, con origen y destino ajustados a celdas
+    de DISTANCE_CACHE_CELL_DEG; solo se consulta a Google la submatriz de los
+    orígenes y destinos que tienen algún par sin cachear. Solo se cachean los
+    elementos con status OK. La caché (Redis síncrono si hay REDIS_URL) se lee y
+    se escribe en lote, una vez por consulta, en un hilo fuera del event loop.
+    """
+    origins = [(float(lat), float(lng)) for lat, lng in origins]
+    destinations = [(float(lat), float(lng)) for lat, lng in destinations]
+    keys = {
+        (i, j): cache_key(origin, destination, mode)
+        for i, origin in enumerate(origins)
+        for j, destination in enumerate(destinations)
+    }
+    cached = await anyio.to_thread.run_sync(distance_cache.get_many, set(keys.values()))
+    cells: Dict[Tuple[int, int], Optional[dict]] = {
+        pair: cached.get(key) for pair, key in keys.items()}
+
+    missing = [pair for pair, value in cells.items() if value is None]
+    if missing:
+        origin_idx = sorted({i for i, _ in missing})
+        destination_idx = sorted({j for _, j in missing})
+        to_cache = {}
+        data = await distance_matrix_client.fetch(
+            [origins[i] for i in origin_idx],
+            [destinations[j] for j in destination_idx], mode)
+        for row_pos, i in enumerate(origin_idx):
+            elements = data["rows"][row_pos]["elements"]
+            for col_pos, j in enumerate(destination_idx):
+                value = {
+                    "element": elements[col_pos],
+                    "origin_address": data["origin_addresses"][row_pos],
+                    "destination_address": data["destination_addresses"][col_pos]
+                }
+                if cells[(i, j)] is None:
+                    cells[(i, j)] = value
+                if value["element"].get("status") == "OK":
+                    to_cache[keys[(i, j)]] = value
+        await anyio.to_thread.run_sync(distance_cache.set_many, to_cache)
+
+    return {
+        "status": "OK",
+        "origin_addresses": [
+            cells[(i, 0)]["origin_address"] if destinations else ""
+            for i in range(len(origins))
+        ],
+        "destination_addresses": [
+            cells[(0, j)]["destination_address"] if origins else ""
+            for j in range(len(destinations))
+        ],
+        "rows": [
+            {"elements": [cells[(i, j)]["element"] for j in range(len(destinations))]}
+            for i in range(len(origins))
+        ]
+    }
+
+
+def get_distance_matrix(origins: Sequence[Coord], destinations: Sequence[Coord], mode: str = "driving") -> dict:
+    """
+    Versión síncrona de get_distance_matrix_async para los endpoints `def`.
+    Desde el threadpool de FastAPI ejecuta la corrutina en el event loop principal
+    (así se comparte el cliente y la coalescencia); fuera de él usa un loop propio.
+    """
+    if hasattr(anyio.from_thread.threadlocals, "current_token"):
+        return anyio.from_thread.run(get_distance_matrix_async, origins, destinations, mode)
+    return asyncio.run(_run_standalone(origins, destinations, mode))
+
+
+async def _run_standalone(origins, destinations, mode):
+    try:
+        return await get_distance_matrix_async(origins, destinations, mode)
+    finally:
+        await distance_matrix_client.aclose()
+
+
+def distance_cache_stats() -> dict:
+    stats = distance_cache.stats()
+    stats["upstream_calls"] = distance_matrix_client.upstream_calls
+    stats["coalesced_calls"] = distance_matrix_client.coalesced_calls
+    return stats
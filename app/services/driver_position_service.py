@@ -8,80 +8,151 @@ from sqlalchemy import select, text, func
 from app.models.user_has_roles import UserHasRole, RoleStatus
 from app.models.role import Role
 from app.utils.geo import wkb_to_coords
+from app.utils.geo_index import GridIndex
+from app.utils.geo_query import within_radius, distance_sphere
+from app.core.config import settings
 from uuid import UUID
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+import time
 import traceback
 
 
+# Índice en memoria de la última posición conocida de cada conductor (clave: user_id)
+driver_position_index = GridIndex(cell_deg=settings.GEO_INDEX_CELL_DEG)
+
+
+def fresh_positions_since() -> Optional[datetime]:
+    """Posiciones anteriores a este momento son de conductores fuera de línea (PRESENCE_TTL_SECONDS)."""
+    if not settings.PRESENCE_TTL_SECONDS:
+        return None
+    return datetime.utcnow() - timedelta(seconds=settings.PRESENCE_TTL_SECONDS)
+
+
+def load_driver_position_index(session: Session):
+    """
+    Carga (o recarga) el índice de posiciones desde la tabla driver_position.
+    La base de datos solo se usa como fuente en el arranque en frío y en las
+    recargas periódicas; las lecturas de cercanía se resuelven en memoria.
+
+    Cada entrada conserva el updated_at de su fila, así el barrido de presencia
+    la retira con la misma regla (PRESENCE_TTL_SECONDS) que a las posiciones
+    recibidas en este worker.
+    """
+    started_at = time.time()
+    query = session.query(
+        DriverPosition.id_driver,
+        func.ST_Y(DriverPosition.position),
+        func.ST_X(DriverPosition.position),
+        DriverPosition.updated_at
+    )
+    since = fresh_positions_since()
+    if since is not None:
+        query = query.filter(DriverPosition.updated_at >= since)
+    rows = query.all()
+    driver_position_index.load(
+        ((id_driver, lat, lng, {}, _epoch(updated_at)) for id_driver, lat, lng, updated_at in rows),
+        started_at=started_at
+    )
+    # Las posiciones recibidas poco antes de la lectura pueden no estar escritas aún
+    from app.services.position_ingest_service import position_ingestor
+    margin = 2 * settings.POSITION_FLUSH_INTERVAL_MS / 1000
+    for id_driver, (lat, lng, ts) in position_ingestor.recent(started_at - margin).items():
+        current = driver_position_index.get(id_driver)
+        if current is None or current.updated_at < ts:
+            driver_position_index.upsert(id_driver, lat, lng, updated_at=ts)
+
+
+def _epoch(updated_at: Optional[datetime]) -> Optional[float]:
+    # driver_position.updated_at se guarda en UTC sin zona horaria (datetime.utcnow)
+    if updated_at is None:
+        return None
+    return updated_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def ensure_driver_position_index(session: Session):
+    """
+    Carga el índice si está frío. Las recargas periódicas (GEO_INDEX_RELOAD_SECONDS)
+    corren en segundo plano (index_reloader), no dentro de las peticiones.
+    """
+    if driver_position_index.needs_reload(None):
+        load_driver_position_index(session)
+
+
+def update_driver_position_index(id_driver: UUID, lat: float, lng: float):
+    """Registra en el índice la posición más reciente de un conductor."""
+    driver_position_index.upsert(id_driver, lat, lng)
+
+
+def find_nearby_driver_positions(session: Session, lat: float, lng: float, radius_m: float):
+    """
+    Posiciones de conductores a `radius_m` metros o menos, de la más cercana a la más lejana.
+    Usa el índice en memoria; si está deshabilitado (GEO_INDEX_ENABLED=False) consulta
+    driver_position prefiltrando por el envolvente del radio para usar el índice SPATIAL.
+
+    Returns:
+        Lista de tuplas (id_driver, lat, lng, distancia_m)
+    """
+    if settings.GEO_INDEX_ENABLED:
+        ensure_driver_position_index(session)
+        return [
+            (entry.key, entry.lat, entry.lng, distance)
+            for entry, distance in driver_position_index.nearby(lat, lng, radius_m)
+        ]
+    distance = distance_sphere(DriverPosition.position, lat, lng)
+    query = (
+        session.query(
+            DriverPosition.id_driver,
+            func.ST_Y(DriverPosition.position),
+            func.ST_X(DriverPosition.position),
+            distance.label("distance")
+        )
+        .filter(within_radius(DriverPosition.position, lat, lng, radius_m))
+    )
+    since = fresh_positions_since()
+    if since is not None:
+        query = query.filter(DriverPosition.updated_at >= since)
+    rows = query.order_by(distance).all()
+    return [(id_driver, lat_, lng_, float(dist)) for id_driver, lat_, lng_, dist in rows]
+
+
 class DriverPositionService:
     def __init__(self, session: Session):
         self.session = session
 
-    def create_driver_position(self, data: DriverPositionCreate, user_id: UUID) -> DriverPosition:
-        user = self.session.get(User, user_id)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
-
-        # Validar que el usuario tenga el rol DRIVER aprobado
-        driver_role = self.session.exec(
-            select(UserHasRole).where(
-                UserHasRole.id_user == user_id,
-                UserHasRole.id_rol == "DRIVER",
-            )
-        ).first()
-        if not driver_role:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                                detail="El usuario no tiene el rol de conductor aprobado")
-
-        # Verifica si ya existe una posición para este driver
-        existing = self.session.get(DriverPosition, user_id)
-        point = from_shape(Point(data.lng, data.lat), srid=4326)
-        if existing:
-            existing.position = point
-            self.session.add(existing)
-            self.session.commit()
-            self.session.refresh(existing)
-            return existing
-
-        driver_position = DriverPosition(
-            id_driver=user_id,
-            position=point
-        )
-        self.session.add(driver_position)
-        self.session.commit()
-        self.session.refresh(driver_position)
-        return driver_position
+    def create_driver_position(self, data: DriverPositionCreate, user_id: UUID) -> DriverPositionRead:
+        """
+        Registra la posición del conductor en el pipeline de ingesta: queda disponible
+        de inmediato en memoria y se persiste en el siguiente flush masivo.
+        El llamador debe haber validado que el usuario es un conductor aprobado.
+        """
+        from app.services.position_ingest_service import position_ingestor
+        lat, lng, _ = position_ingestor.submit(
+            user_id, data.lat, data.lng, verified=True)
+        return DriverPositionRead(id_driver=user_id, lat=lat, lng=lng)
 
     def get_nearby_drivers(self, lat: float, lng: float, max_distance_km: float):
         max_distance_m = max_distance_km * 1000  # Convertir a metros
-        driver_point = func.ST_GeomFromText(f'POINT({lng} {lat})', 4326)
-        query = (
-            self.session.query(
-                DriverPosition.id_driver,
-                func.ST_X(DriverPosition.position).label("lng"),
-                func.ST_Y(DriverPosition.position).label("lat"),
-                (func.ST_Distance_Sphere(DriverPosition.position,
-                 driver_point) / 1000).label("distance_km")
+        matches = find_nearby_driver_positions(
+            self.session, lat, lng, max_distance_m)
+        return [
+            DriverPositionRead(
+                id_driver=id_driver,
+                lat=driver_lat,
+                lng=driver_lng,
+                distance_km=round(distance / 1000, 3)
             )
-            .filter(
-                func.ST_Distance_Sphere(
-                    DriverPosition.position, driver_point) <= max_distance_m
-            )
-            .order_by("distance_km")
-        )
-        results = query.all()
-        drivers = []
-        for row in results:
-            drivers.append(DriverPositionRead(
-                id_driver=row[0],
-                lat=row[2],
-                lng=row[1],
-                distance_km=round(row[3], 3)
-            ))
-        return drivers
-
-    def get_driver_position(self, id_driver: UUID):
-        return self.session.get(DriverPosition, id_driver)
+            for id_driver, driver_lat, driver_lng, distance in matches
+        ]
+
+    def get_driver_position(self, id_driver: UUID) -> Optional[DriverPositionRead]:
+        """Última posición del conductor: la pendiente en memoria o, si no hay, la guardada."""
+        from app.services.position_ingest_service import position_ingestor
+        latest = position_ingestor.latest(id_driver)
+        if latest is not None:
+            return DriverPositionRead(id_driver=id_driver, lat=latest[0], lng=latest[1])
+        obj = self.session.get(DriverPosition, id_driver)
+        return DriverPositionRead.from_orm_with_point(obj) if obj else None
 
     def delete_driver_position(self, id_driver: UUID):
         # Buscar la posición usando el user_id directamente
@@ -90,13 +161,16 @@ class DriverPositionService:
         ).first()
         if not obj:
             return False
+        from app.services.position_ingest_service import position_ingestor
+        position_ingestor.discard(id_driver)
         self.session.delete(obj)
         self.session.commit()
+        driver_position_index.remove(id_driver)
         return True
 
     def get_nearby_drivers_by_client_request(self, id_client_request: UUID, user_id: UUID, user_role: str):
         from app.models.client_request import ClientRequest
-        from app.models.type_service import TypeService
+        from app.services.reference_data_service import reference_data
         from app.models.vehicle_info import VehicleInfo
         from app.models.driver_info import DriverInfo
         from app.models.user import User
@@ -111,8 +185,8 @@ class DriverPositionService:
                 status_code=404, detail="Client request no encontrada")
 
         # 2. Obtener el tipo de servicio
-        type_service = self.session.query(TypeService).filter(
-            TypeService.id == client_request.type_service_id).first()
+        type_service = reference_data.get(self.session).type_services.get(
+            client_request.type_service_id)
         if not type_service:
             raise HTTPException(
                 status_code=404, detail="Tipo de servicio no encontrado")
@@ -122,7 +196,7 @@ class DriverPositionService:
 
         # 4. Buscar todos los conductores con vehículo compatible y posición actual
         allowed_role = type_service.allowed_role
-        results = (
+        query = (
             self.session.query(User, DriverInfo, VehicleInfo, DriverPosition)
             .join(DriverInfo, DriverInfo.user_id == User.id)
             .join(VehicleInfo, VehicleInfo.driver_info_id == DriverInfo.id)
@@ -133,8 +207,12 @@ class DriverPositionService:
                 UserHasRole.id_rol == allowed_role,
                 UserHasRole.status == RoleStatus.APPROVED
             )
-            .all()
         )
+        # Solo conductores en línea (posición renovada dentro de PRESENCE_TTL_SECONDS)
+        since = fresh_positions_since()
+        if since is not None:
+            query = query.filter(DriverPosition.updated_at >= since)
+        results = query.all()
 
         drivers = []
         for user, driver_info, vehicle_info, driver_position in results:
@@ -223,11 +301,12 @@ class DriverPositionService:
         vehicle_info = self.session.query(VehicleInfo).filter(
             VehicleInfo.driver_info_id == driver_info.id).first() if driver_info else None
 
-        if not driver_info or not driver_info.current_position:
+        position = self.get_driver_position(driver_id)
+        if not driver_info or position is None:
             raise HTTPException(
                 status_code=404, detail="El conductor no tiene posición registrada")
 
-        driver_position = wkb_to_coords(driver_info.current_position)
+        driver_position = {"lat": position.lat, "lng": position.lng}
 
         return {
             "driver_id": user.id,
@@ -2,10 +2,10 @@ from sqlmodel import Session, select
 from app.models.driver_savings import DriverSavings, SavingsType
 from datetime import datetime
 from app.models.transaction import Transaction, TransactionType
-from app.models.project_settings import ProjectSettings
+from app.services.project_settings_service import project_settings_cache
+from app.services.role_cache_service import role_cache
 from fastapi import HTTPException
 from app.models.user import User
-from app.models.user_has_roles import UserHasRole, RoleStatus
 
 
 class DriverSavingsService:
@@ -24,9 +24,9 @@ class DriverSavingsService:
         self._update_minimum_withdrawal_amount()
 
     def _get_current_minimum_amount(self) -> int:
-        """Obtiene el valor mínimo actual desde la base de datos"""
+        """Obtiene el valor mínimo actual (configuración del proyecto en memoria)"""
         try:
-            settings = self.session.exec(select(ProjectSettings)).first()
+            settings = project_settings_cache.get(self.session)
             if settings and settings.amount:
                 return int(settings.amount)
         except Exception:
@@ -67,12 +67,7 @@ class DriverSavingsService:
 
     def transfer_saving_to_balance(self, user_id: str, amount: float):
         # Validar rol DRIVER aprobado
-        user_role = self.session.query(UserHasRole).filter(
-            UserHasRole.id_user == user_id,
-            UserHasRole.id_rol == "DRIVER",
-            UserHasRole.status == RoleStatus.APPROVED
-        ).first()
-        if not user_role:
+        if not role_cache.has_role(self.session, user_id, "DRIVER"):
             raise HTTPException(
                 status_code=403, detail="Solo conductores aprobados pueden transferir ahorros.")
 
@@ -1,7 +1,8 @@
 from sqlmodel import Session, select
 from fastapi import HTTPException, status, UploadFile
 from app.models.driver_documents import DriverDocuments, DriverDocumentsCreate
-from app.models.project_settings import ProjectSettings
+from app.services.project_settings_service import project_settings_cache
+from app.services.role_cache_service import role_cache
 from app.models.user import User, UserCreate, UserRead
 from app.models.role import Role
 from app.models.driver_info import DriverInfo, DriverInfoCreate
@@ -104,6 +105,8 @@ class DriverService:
                     session.add(user)
                     session.commit()
                     session.refresh(user)
+                # El usuario puede haber ganado el rol DRIVER
+                role_cache.invalidate(user.id)
 
                 # --- SELFIE OBLIGATORIA Y GUARDADO ---
                 if not selfie:
@@ -328,8 +331,7 @@ class DriverService:
                             vehicle_tech_doc.expiration_date) if vehicle_tech_doc and vehicle_tech_doc.expiration_date else None
                     )
                 )
-                existing_user = session.exec(select(ProjectSettings).where(ProjectSettings.id == 1)).first()
-                bonus= Decimal(existing_user.bonus)
+                bonus = project_settings_cache.get(session).bonus
                 # Crear transacción de bono y actualizar mount
                 bonus_transaction = Transaction(
                     user_id=user.id,
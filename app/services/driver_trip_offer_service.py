@@ -3,15 +3,32 @@ from fastapi import HTTPException, status
 from app.models.driver_trip_offer import DriverTripOffer, DriverTripOfferCreate
 from app.models.client_request import ClientRequest, StatusEnum
 from app.models.user import User
-from app.models.user_has_roles import UserHasRole
 from app.models.driver_info import DriverInfo
 from app.models.vehicle_info import VehicleInfo
 from app.models.driver_trip_offer import DriverTripOfferResponse
 from app.models.driver_response import UserResponse, DriverInfoResponse, VehicleInfoResponse
+from app.models.driver_position import DriverPosition
+from app.models.rating_aggregate import RatingAggregate
+from app.core.cache import build_cache
+from app.core.config import settings
+from app.utils.geo_array import haversine_array, points_from_wkb, top_k
+from app.services.driver_position_service import driver_position_index, ensure_driver_position_index
+from app.services.rating_service import get_average_rating
+from app.services.role_cache_service import role_cache
 from sqlalchemy.orm import selectinload
 from sqlalchemy import func
 from datetime import datetime
 from uuid import UUID
+import numpy as np
+
+# Ofertas por solicitud ya serializadas: {"id_client", "pickup", "offers"}.
+# Con Redis la capa local dura 1 s para que la invalidación llegue pronto a todos los workers.
+offers_cache = build_cache(
+    "offers_by_request",
+    maxsize=settings.OFFERS_CACHE_MAXSIZE,
+    ttl=settings.OFFERS_CACHE_TTL_SECONDS,
+    local_ttl=1
+)
 
 
 class DriverTripOfferService:
@@ -24,13 +41,7 @@ class DriverTripOfferService:
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Conductor no encontrado")
-        driver_role = self.session.exec(
-            select(UserHasRole).where(
-                UserHasRole.id_user == data["id_driver"],
-                UserHasRole.id_rol == "DRIVER"
-            )
-        ).first()
-        if not driver_role:
+        if not role_cache.has_role(self.session, data["id_driver"], "DRIVER", approved=False):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                                 detail="El usuario no tiene el rol de conductor")
 
@@ -48,24 +59,63 @@ class DriverTripOfferService:
         self.session.add(offer)
         self.session.commit()
         self.session.refresh(offer)
+        offers_cache.delete(str(offer.id_client_request))
         return offer
 
     def get_offers_by_client_request(self, id_client_request: UUID, user_id: UUID, user_role: str):
-        offers = self.session.query(DriverTripOffer).filter(
-            DriverTripOffer.id_client_request == id_client_request
-        ).all()
-        result = []
-        for offer in offers:
-            user = self.session.query(User).options(
-                selectinload(User.driver_info).selectinload(
-                    DriverInfo.vehicle_info),
-                selectinload(User.roles)
-            ).filter(User.id == offer.id_driver).first()
-
-            driver_info_obj = user.driver_info if user else None
-            vehicle_info_obj = driver_info_obj.vehicle_info if driver_info_obj and hasattr(
-                driver_info_obj, 'vehicle_info') else None
+        """
+        Ofertas de una solicitud, de la más cercana a la recogida a la más lejana.
+        El cliente dueño ve todas; un conductor, solo la suya.
+
+        La autorización se valida antes de cargar las ofertas. La lista completa
+        (conductor, vehículo y calificación) se arma con una sola consulta y se
+        guarda en offers_cache hasta que llegue una oferta nueva.
+        """
+        if user_role not in ("DRIVER", "CLIENT"):
+            raise HTTPException(status_code=403, detail="No autorizado")
+
+        cached = offers_cache.get(str(id_client_request))
+        if cached is None:
+            client_request = self.session.get(ClientRequest, id_client_request)
+            if not client_request:
+                raise HTTPException(
+                    status_code=404, detail="Solicitud de cliente no encontrada")
+            self._check_can_view(client_request.id_client, user_id, user_role)
+            cached = self._load_offers(client_request)
+            offers_cache.set(str(id_client_request), cached)
+        else:
+            self._check_can_view(UUID(cached["id_client"]), user_id, user_role)
 
+        result = [DriverTripOfferResponse(**offer) for offer in cached["offers"]]
+        if user_role == "DRIVER":
+            # Solo ve su propia oferta
+            result = [r for r in result if r.user and r.user.id == user_id]
+        return self._rank_by_pickup_distance(result, cached["pickup"])
+
+    @staticmethod
+    def _check_can_view(id_client: UUID, user_id: UUID, user_role: str) -> None:
+        # Solo el cliente dueño puede ver todas; el conductor solo la suya (se filtra después)
+        if user_role == "CLIENT" and id_client != user_id:
+            raise HTTPException(
+                status_code=403, detail="No autorizado para ver las ofertas de esta solicitud")
+
+    def _load_offers(self, client_request: ClientRequest) -> dict:
+        """Lista completa de ofertas en una sola consulta, serializada para offers_cache."""
+        rows = (
+            self.session.query(
+                DriverTripOffer, User, DriverInfo, VehicleInfo,
+                RatingAggregate.rating_sum, RatingAggregate.rating_count
+            )
+            .outerjoin(User, User.id == DriverTripOffer.id_driver)
+            .outerjoin(DriverInfo, DriverInfo.user_id == DriverTripOffer.id_driver)
+            .outerjoin(VehicleInfo, VehicleInfo.driver_info_id == DriverInfo.id)
+            .outerjoin(RatingAggregate, (RatingAggregate.id_user == DriverTripOffer.id_driver) &
+                       (RatingAggregate.role == "driver"))
+            .filter(DriverTripOffer.id_client_request == client_request.id)
+            .all()
+        )
+        offers = []
+        for offer, user, driver_info_obj, vehicle_info_obj, rating_sum, rating_count in rows:
             vehicle_info_response = VehicleInfoResponse(
                 brand=vehicle_info_obj.brand,
                 model=vehicle_info_obj.model,
@@ -90,9 +140,9 @@ class DriverTripOfferService:
                 selfie_url=user.selfie_url
             ) if user else None
 
-            average_rating =get_average_rating(self.session,"driver", user.id) if user else 0.0
+            average_rating = rating_sum / rating_count if rating_count else 0.0
 
-            result.append(DriverTripOfferResponse(
+            offers.append(DriverTripOfferResponse(
                 id=offer.id,
                 fare_offer=offer.fare_offer,
                 time=offer.time,
@@ -103,51 +153,33 @@ class DriverTripOfferService:
                 driver_info=driver_info_response,
                 vehicle_info=vehicle_info_response,
                 average_rating=average_rating
-            ))
-
-        # Filtrado según el rol
-        from app.models.client_request import ClientRequest
-        client_request = self.session.query(ClientRequest).filter(
-            ClientRequest.id == id_client_request).first()
-        if not client_request:
-            raise HTTPException(
-                status_code=404, detail="Solicitud de cliente no encontrada")
-
-        if user_role == "DRIVER":
-            # Solo ve su propia oferta
-            result = [r for r in result if r.user.id == user_id]
-        elif user_role == "CLIENT":
-            # Solo el cliente dueño puede ver todas
-            if client_request.id_client != user_id:
-                raise HTTPException(
-                    status_code=403, detail="No autorizado para ver las ofertas de esta solicitud")
-            # El cliente dueño ve todas
+            ).model_dump(mode="json"))
+
+        pickup = None
+        if client_request.pickup_position is not None:
+            lats, lngs = points_from_wkb([client_request.pickup_position])
+            pickup = [float(lats[0]), float(lngs[0])]
+        return {"id_client": str(client_request.id_client), "pickup": pickup, "offers": offers}
+
+    def _rank_by_pickup_distance(self, offers: list, pickup) -> list:
+        """
+        Ordena las ofertas por la distancia actual del conductor al punto de recogida
+        (`pickup` = [lat, lng]). Las posiciones salen del índice en memoria, así que
+        el orden sigue al día aunque la lista venga de la caché. Las ofertas sin
+        posición conocida del conductor quedan al final.
+        """
+        if len(offers) < 2 or pickup is None:
+            return offers
+        driver_ids = [offer.user.id if offer.user else None for offer in offers]
+        if settings.GEO_INDEX_ENABLED:
+            ensure_driver_position_index(self.session)
+            entries = [driver_position_index.get(i) if i else None for i in driver_ids]
+            lats = np.array([entry.lat if entry else np.nan for entry in entries])
+            lngs = np.array([entry.lng if entry else np.nan for entry in entries])
         else:
-            raise HTTPException(status_code=403, detail="No autorizado")
-
-        return result
-
-def get_average_rating(session, role: str, id_user: UUID) -> float:
-        if role not in ["driver", "passenger"]:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El parámetro 'role' debe ser 'driver' o 'passenger'"
-            )
-
-        if role == "passenger":
-            # Buscar por id_client y calcular promedio de client_rating
-            avg_rating = session.query(func.avg(ClientRequest.client_rating))\
-                .filter(
-                    ClientRequest.id_client == id_user,
-                    ClientRequest.status == StatusEnum.PAID
-                ).scalar()
-        else:  # role == "driver"
-            # Buscar por id_driver_assigned y calcular promedio de driver_rating
-            avg_rating = session.query(func.avg(ClientRequest.driver_rating))\
-                .filter(
-                    ClientRequest.id_driver_assigned == id_user,
-                    ClientRequest.status == StatusEnum.PAID
-                ).scalar()
-
-        # Si no hay calificaciones, devolver 0 o None según prefieras
-        return avg_rating if avg_rating is not None else 0.0
\ No newline at end of file
+            positions = dict(self.session.query(DriverPosition.id_driver, DriverPosition.position).filter(
+                DriverPosition.id_driver.in_([i for i in driver_ids if i is not None])
+            ).all())
+            lats, lngs = points_from_wkb([positions.get(i) for i in driver_ids])
+        distances = haversine_array(pickup[0], pickup[1], lats, lngs)
+        return [offers[i] for i in top_k(distances).tolist()]
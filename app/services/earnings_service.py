@@ -5,7 +5,7 @@ from sqlmodel import select, SQLModel, Field, Session
 from app.models.client_request import ClientRequest, StatusEnum
 from app.models.referral_chain import Referral
 from app.models.transaction import Transaction
-from app.models.project_settings import ProjectSettings
+from app.services.project_settings_service import project_settings_cache
 from app.models.user import User
 from app.models.driver_savings import DriverSavings
 from app.models.company_account import CompanyAccount
@@ -22,27 +22,14 @@ COMPANY_ID: int | None = None
 
 def get_config_percentages(session: SQLAlchemySession):
     """
-    Devuelve un diccionario con los porcentajes configurados en la tabla project_settings.
-    Ahora busca la configuración con ID = 1.
+    Devuelve los porcentajes configurados en project_settings (ya como Decimal),
+    desde la copia en memoria de project_settings_cache. Es de solo lectura.
     """
-    config = session.query(ProjectSettings).get(
-        1)  # Asume que la configuración está en la fila con ID 1
+    config = project_settings_cache.get(session)
     if not config:
         raise ValueError(
-            "No se encontró la configuración del proyecto con ID 1")
-
-    config_dict = {
-        "driver_dist": Decimal(config.driver_dist),
-        "referral_1": Decimal(config.referral_1),
-        "referral_2": Decimal(config.referral_2),
-        "referral_3": Decimal(config.referral_3),
-        "referral_4": Decimal(config.referral_4),
-        "referral_5": Decimal(config.referral_5),
-        "driver_saving": Decimal(config.driver_saving),
-        "company": Decimal(config.company),
-        "bonus": Decimal(config.bonus),
-    }
-    return config_dict
+            "No se encontró la configuración del proyecto")
+    return config.percentages
 
 
 def _get_referral_chain(session: SQLAlchemySession, user_id: UUID, levels: int) -> List[UUID]:
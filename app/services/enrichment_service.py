@@ -0,0 +1,92 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from sqlmodel import Session
+
+from app.models.driver_info import DriverInfo
+from app.models.payment_method import PaymentMethod
+from app.models.user import User
+from app.models.vehicle_info import VehicleInfo
+from app.services.rating_service import get_average_ratings
+from app.services.reference_data_service import reference_data
+
+
+def _ids(values: Iterable) -> List:
+    return list({value for value in values if value is not None})
+
+
+class Enrichment:
+    """
+    Datos relacionados de un conjunto de resultados, resueltos con una sola
+    consulta IN (...) por tipo de entidad y unidos luego en memoria.
+
+    Uso:
+        enrichment = Enrichment(session).with_users(ids).with_ratings("driver", ids)
+        user = enrichment.users.get(id_user)
+
+    Cada `with_*` hace a lo sumo una consulta, sin importar cuántas filas tenga
+    el resultado; los ids que ya se cargaron no se vuelven a pedir. Métodos de
+    pago y tipos de servicio salen de reference_data, sin ir a la base de datos.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.users: Dict[UUID, User] = {}
+        self.drivers: Dict[UUID, Tuple[DriverInfo, Optional[VehicleInfo]]] = {}
+        self.payment_methods: Dict[int, PaymentMethod] = {}
+        self.type_service_names: Dict[int, str] = {}
+        self.ratings: Dict[str, Dict[UUID, float]] = {"driver": {}, "passenger": {}}
+
+    def with_users(self, user_ids: Iterable[UUID]) -> "Enrichment":
+        missing = [i for i in _ids(user_ids) if i not in self.users]
+        if missing:
+            for user in self.session.query(User).filter(User.id.in_(missing)).all():
+                self.users[user.id] = user
+        return self
+
+    def with_drivers(self, user_ids: Iterable[UUID]) -> "Enrichment":
+        """DriverInfo y VehicleInfo (si tiene) de cada conductor, indexados por id de usuario."""
+        missing = [i for i in _ids(user_ids) if i not in self.drivers]
+        if missing:
+            rows = (
+                self.session.query(DriverInfo, VehicleInfo)
+                .outerjoin(VehicleInfo, VehicleInfo.driver_info_id == DriverInfo.id)
+                .filter(DriverInfo.user_id.in_(missing))
+                .all()
+            )
+            for driver_info, vehicle_info in rows:
+                self.drivers[driver_info.user_id] = (driver_info, vehicle_info)
+        return self
+
+    def with_payment_methods(self, payment_method_ids: Iterable[int]) -> "Enrichment":
+        # Tabla de referencia: se resuelve en memoria, sin consulta
+        refs = reference_data.get(self.session)
+        for i in _ids(payment_method_ids):
+            if i in refs.payment_methods:
+                self.payment_methods[i] = refs.payment_methods[i]
+        return self
+
+    def with_type_services(self, type_service_ids: Iterable[int]) -> "Enrichment":
+        refs = reference_data.get(self.session)
+        for i in _ids(type_service_ids):
+            if i in refs.type_services:
+                self.type_service_names[i] = refs.type_services[i].name
+        return self
+
+    def with_ratings(self, role: str, user_ids: Iterable[UUID]) -> "Enrichment":
+        """Promedios desde rating_aggregate; los usuarios sin calificaciones quedan en 0.0."""
+        cache = self.ratings[role]
+        missing = [i for i in _ids(user_ids) if i not in cache]
+        if missing:
+            cache.update(get_average_ratings(self.session, role, missing))
+        return self
+
+    def driver(self, id_user: UUID) -> Tuple[Optional[DriverInfo], Optional[VehicleInfo]]:
+        return self.drivers.get(id_user, (None, None))
+
+    def rating(self, role: str, id_user: Optional[UUID]) -> float:
+        return self.ratings[role].get(id_user, 0.0)
+
+    def payment_method(self, payment_method_id: Optional[int]) -> Optional[dict]:
+        pm = self.payment_methods.get(payment_method_id)
+        return {"id": pm.id, "name": pm.name} if pm else None
@@ -0,0 +1,166 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.models.client_request import ClientRequest, StatusEnum
+from app.models.driver_trip_offer import DriverTripOffer
+from app.models.type_service import TypeService
+from app.utils.geo_array import haversine_array, points_from_wkb
+
+HOURS_PER_WEEK = 168
+
+
+def hour_of_week(when: datetime) -> int:
+    """Franja horaria de la semana (0 = lunes 00:00 UTC ... 167 = domingo 23:00 UTC)."""
+    return when.weekday() * 24 + when.hour
+
+
+def estimate_element(distance_m: float, duration_s: float) -> dict:
+    """Elemento con la misma forma que los de Google Distance Matrix, marcado como estimado."""
+    minutes = max(1, int(round(duration_s / 60)))
+    return {
+        "distance": {"text": f"{distance_m / 1000:.1f} km", "value": int(round(distance_m))},
+        "duration": {"text": f"{minutes} min" if minutes == 1 else f"{minutes} mins", "value": int(round(duration_s))},
+        "status": "OK",
+        "source": "estimate"
+    }
+
+
+class EtaEstimator:
+    """
+    Estimador local de distancia por vía y tiempo de viaje, para ordenar candidatos
+    sin esperar a Google.
+
+    distancia_vía = distancia_haversine * factor_desvío[vehicle_type]
+    tiempo = distancia_vía / velocidad[vehicle_type][hora_de_la_semana]
+
+    Ambos parámetros se calibran con los viajes terminados (FINISHED/PAID) y la
+    oferta aceptada de cada uno, que trae la distancia y el tiempo por vía. Las
+    franjas con pocas muestras usan la velocidad promedio del tipo de vehículo y,
+    si no hay datos, los valores por defecto de la configuración.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._detour: Dict[int, float] = {}
+        self._speeds: Dict[int, np.ndarray] = {}  # km/h por hora de la semana
+        self._default_detour = settings.ETA_DEFAULT_DETOUR
+        self._default_speeds = np.full(HOURS_PER_WEEK, settings.ETA_DEFAULT_SPEED_KMH)
+        self._calibrated_at: Optional[float] = None
+        self.samples = 0
+
+    def fit(self, rows: Sequence[Tuple[int, float, float, float, datetime]]) -> None:
+        """
+        Calibra a partir de filas (vehicle_type_id, distancia_haversine_m, distancia_vía_m,
+        tiempo_s, fecha). Separado de `calibrate` para poder probarlo sin base de datos.
+        """
+        min_samples = settings.ETA_MIN_SAMPLES
+        valid = [
+            row for row in rows
+            if row[1] >= 200 and row[2] > 0 and row[3] > 0
+        ]
+        detour: Dict[int, float] = {}
+        speeds: Dict[int, np.ndarray] = {}
+        default_detour = settings.ETA_DEFAULT_DETOUR
+        if len(valid) >= min_samples:
+            default_detour = float(np.clip(
+                np.median([row[2] / row[1] for row in valid]), 1.0, 3.0))
+
+        for vehicle_type_id in {row[0] for row in valid}:
+            samples = [row for row in valid if row[0] == vehicle_type_id]
+            if len(samples) < min_samples:
+                continue
+            ratios = np.array([row[2] / row[1] for row in samples])
+            detour[vehicle_type_id] = float(np.clip(np.median(ratios), 1.0, 3.0))
+
+            road_km = np.array([row[2] / 1000 for row in samples])
+            hours = np.array([row[3] / 3600 for row in samples])
+            buckets = np.array([hour_of_week(row[4]) for row in samples])
+            overall = road_km.sum() / hours.sum()
+            km_by_hour = np.bincount(buckets, weights=road_km, minlength=HOURS_PER_WEEK)
+            h_by_hour = np.bincount(buckets, weights=hours, minlength=HOURS_PER_WEEK)
+            count_by_hour = np.bincount(buckets, minlength=HOURS_PER_WEEK)
+            profile = np.full(HOURS_PER_WEEK, overall)
+            enough = (count_by_hour >= min_samples) & (h_by_hour > 0)
+            profile[enough] = km_by_hour[enough] / h_by_hour[enough]
+            speeds[vehicle_type_id] = np.clip(profile, 3.0, 120.0)
+
+        with self._lock:
+            self._detour = detour
+            self._speeds = speeds
+            self._default_detour = default_detour
+            self.samples = len(valid)
+            self._calibrated_at = time.time()
+
+    def calibrate(self, session: Session) -> None:
+        """Lee los viajes terminados recientes con su oferta aceptada y recalibra."""
+        since = datetime.utcnow() - timedelta(days=settings.ETA_CALIBRATION_DAYS)
+        try:
+            query_results = (
+                session.query(
+                    TypeService.vehicle_type_id,
+                    ClientRequest.pickup_position,
+                    ClientRequest.destination_position,
+                    DriverTripOffer.distance,
+                    DriverTripOffer.time,
+                    DriverTripOffer.created_at
+                )
+                .join(TypeService, TypeService.id == ClientRequest.type_service_id)
+                .join(DriverTripOffer, (DriverTripOffer.id_client_request == ClientRequest.id) &
+                      (DriverTripOffer.id_driver == ClientRequest.id_driver_assigned))
+                .filter(
+                    ClientRequest.status.in_([StatusEnum.FINISHED, StatusEnum.PAID]),
+                    ClientRequest.updated_at > since
+                )
+                .limit(settings.ETA_CALIBRATION_MAX_ROWS)
+                .all()
+            )
+        except Exception as e:
+            print(f"[WARN] No se pudo calibrar el estimador de ETA: {e}")
+            session.rollback()
+            self._calibrated_at = time.time()
+            return
+
+        if query_results:
+            pickup_lats, pickup_lngs = points_from_wkb([row[1] for row in query_results])
+            dest_lats, dest_lngs = points_from_wkb([row[2] for row in query_results])
+            straight = haversine_array(pickup_lats, pickup_lngs, dest_lats, dest_lngs)
+        else:
+            straight = np.empty(0)
+        # DriverTripOffer.distance está en km y DriverTripOffer.time en minutos
+        rows = [
+            (row[0], float(gc), row[3] * 1000, row[4] * 60, row[5])
+            for row, gc in zip(query_results, straight)
+            if not np.isnan(gc)
+        ]
+        self.fit(rows)
+        print(f"[INFO] Estimador de ETA calibrado con {self.samples} viajes")
+
+    def ensure_calibrated(self, session: Session) -> None:
+        if self._calibrated_at is None or time.time() - self._calibrated_at > settings.ETA_CALIBRATION_SECONDS:
+            self.calibrate(session)
+
+    def estimate(self, distances_m, vehicle_type_id: Optional[int], when: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distancia por vía (m) y tiempo (s) estimados para un arreglo de distancias
+        en línea recta, en la franja horaria de `when` (UTC, por defecto ahora).
+        """
+        distances_m = np.asarray(distances_m, dtype=np.float64)
+        when = when or datetime.utcnow()
+        with self._lock:
+            detour = self._detour.get(vehicle_type_id, self._default_detour)
+            speed_kmh = self._speeds.get(vehicle_type_id, self._default_speeds)[hour_of_week(when)]
+        road_m = distances_m * detour
+        return road_m, road_m / (speed_kmh / 3.6)
+
+    def estimate_elements(self, distances_m, vehicle_type_id: Optional[int], when: Optional[datetime] = None) -> List[dict]:
+        road_m, seconds = self.estimate(distances_m, vehicle_type_id, when)
+        return [estimate_element(d, s) for d, s in zip(road_m.tolist(), seconds.tolist())]
+
+
+eta_estimator = EtaEstimator()
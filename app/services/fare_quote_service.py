@@ -0,0 +1,189 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+from uuid import UUID, uuid4
+
+import numpy as np
+from fastapi import HTTPException
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.cache import build_cache
+from app.core.config import settings
+from app.models.config_service_value import ConfigServiceValue
+from app.services.distance_matrix_service import DistanceMatrixError, get_distance_matrix_async, snap
+from app.services.reference_data_service import reference_data
+from app.utils.geo_index import haversine_m
+
+Coord = Tuple[float, float]
+
+# Cotizaciones emitidas, por quote_id. Con Redis las ve cualquier worker.
+quote_cache = build_cache(
+    "fare_quote",
+    maxsize=settings.FARE_QUOTE_MAXSIZE,
+    ttl=settings.FARE_QUOTE_TTL_SECONDS
+)
+
+# Tarifa calculada por recorrido y tipo de servicio, compartida entre pasajeros.
+# La clave lleva la versión de tarifas: un cambio de tarifas nunca sirve un valor viejo.
+fare_cache = build_cache(
+    "fare",
+    maxsize=settings.FARE_CACHE_MAXSIZE,
+    ttl=settings.FARE_CACHE_TTL_SECONDS
+)
+
+
+def fare_cache_key(origin: Coord, destination: Coord, type_service_id: int, tariff_version: str) -> str:
+    cell_deg = settings.FARE_CACHE_CELL_DEG
+    return f"{snap(*origin, cell_deg)}:{snap(*destination, cell_deg)}:{type_service_id}:{tariff_version}"
+
+
+def compute_fares(distance_m: float, duration_s: float, configs: Sequence[ConfigServiceValue]) -> np.ndarray:
+    """
+    Tarifa recomendada de un mismo recorrido para varias configuraciones, en una
+    sola pasada: max(km * km_value + minutos * min_value, tarifa_value), redondeada
+    a 2 decimales. Una tarifa mínima nula no aplica.
+    """
+    km_values = np.array([c.km_value for c in configs], dtype=np.float64)
+    min_values = np.array([c.min_value for c in configs], dtype=np.float64)
+    minimums = np.array([c.tarifa_value if c.tarifa_value is not None else 0.0 for c in configs],
+                        dtype=np.float64)
+    totals = (distance_m / 1000.0) * km_values + (duration_s / 60.0) * min_values
+    return np.round(np.maximum(totals, minimums), 2)
+
+
+async def create_fare_quote(
+    session: Session,
+    user_id: UUID,
+    origin: Coord,
+    destination: Coord,
+    type_service_ids: Optional[Iterable[int]] = None
+) -> dict:
+    """
+    Cotiza un recorrido para todos los tipos de servicio con tarifa configurada
+    (o solo `type_service_ids`) con una única consulta de ruta, y guarda la
+    cotización para que create_client_request la use por su quote_id.
+    Las cachés (que pueden ser Redis síncrono) se consultan en el threadpool.
+    """
+    refs = await run_in_threadpool(reference_data.get, session)
+    wanted = set(type_service_ids) if type_service_ids else None
+    services = [
+        ts for ts in refs.type_services.values()
+        if ts.id in refs.config_values and (wanted is None or ts.id in wanted)
+    ]
+    if not services:
+        raise HTTPException(
+            status_code=400, detail="No hay tarifas configuradas para los tipos de servicio solicitados")
+
+    try:
+        google_data = await get_distance_matrix_async([origin], [destination])
+    except DistanceMatrixError as e:
+        raise HTTPException(status_code=502, detail=f"No se pudo calcular la ruta: {e}")
+    element = google_data["rows"][0]["elements"][0]
+    if element.get("status") != "OK":
+        raise HTTPException(
+            status_code=400, detail=f"No se encontró una ruta entre los puntos ({element.get('status')})")
+
+    distance_m = element["distance"]["value"]
+    duration_s = element["duration"]["value"]
+    fares = compute_fares(distance_m, duration_s, [refs.config_values[ts.id] for ts in services])
+
+    quote = {
+        "quote_id": uuid4().hex,
+        "expires_in": settings.FARE_QUOTE_TTL_SECONDS,
+        "origin_addresses": google_data["origin_addresses"][0],
+        "destination_addresses": google_data["destination_addresses"][0],
+        "distance": element["distance"]["text"],
+        "duration": element["duration"]["text"],
+        "distance_value": int(distance_m),
+        "duration_value": int(duration_s),
+        "fares": [
+            {
+                "type_service_id": ts.id,
+                "type_service_name": ts.name,
+                "vehicle_type_id": ts.vehicle_type_id,
+                "recommended_value": fare
+            }
+            for ts, fare in zip(services, fares.tolist())
+        ]
+    }
+    await run_in_threadpool(quote_cache.set, quote["quote_id"], {
+        **quote,
+        "id_user": str(user_id),
+        "origin": list(origin),
+        "destination": list(destination),
+        "created_at": datetime.utcnow().isoformat()
+    })
+    return quote
+
+
+def get_quoted_fare(quote_id: str, user_id: UUID, type_service_id: int, origin: Coord, destination: Coord) -> Optional[float]:
+    """
+    Tarifa cotizada para `type_service_id`, validando que la cotización sea del
+    mismo usuario y corresponda al mismo recorrido (a menos de
+    FARE_QUOTE_MAX_DRIFT_M en origen y destino). None si la cotización no está:
+    vencida, o emitida por otro worker sin caché compartida.
+    """
+    quote = quote_cache.get(quote_id)
+    if quote is None or quote["id_user"] != str(user_id):
+        return None
+    drift = max(haversine_m(*quote["origin"], *origin), haversine_m(*quote["destination"], *destination))
+    if drift > settings.FARE_QUOTE_MAX_DRIFT_M:
+        raise HTTPException(status_code=400, detail="La cotización no corresponde a este recorrido")
+    fares: Dict[int, float] = {f["type_service_id"]: f["recommended_value"] for f in quote["fares"]}
+    if type_service_id not in fares:
+        raise HTTPException(status_code=400, detail="La cotización no incluye este tipo de servicio")
+    return fares[type_service_id]
+
+
+async def recompute_fare(session: Optional[Session], type_service_id: int, origin: Coord, destination: Coord) -> float:
+    """
+    Tarifa recomendada de un recorrido sin cotización, con la misma fórmula y la
+    misma caché por celdas (fare_cache) que ConfigServiceValueService.get_fare.
+    """
+    refs = await run_in_threadpool(reference_data.get, session)
+    config = refs.config_values.get(type_service_id)
+    if config is None:
+        raise HTTPException(status_code=400, detail="No hay tarifa configurada para este tipo de servicio")
+    key = fare_cache_key(origin, destination, type_service_id, refs.tariff_version)
+    cached = await run_in_threadpool(fare_cache.get, key)
+    if cached is not None:
+        return cached["recommended_value"]
+
+    try:
+        google_data = await get_distance_matrix_async([origin], [destination])
+    except DistanceMatrixError as e:
+        raise HTTPException(status_code=502, detail=f"No se pudo calcular la ruta: {e}")
+    element = google_data["rows"][0]["elements"][0]
+    if element.get("status") != "OK":
+        raise HTTPException(
+            status_code=400, detail=f"No se encontró una ruta entre los puntos ({element.get('status')})")
+    fare = float(compute_fares(element["distance"]["value"], element["duration"]["value"], [config])[0])
+    await run_in_threadpool(fare_cache.set, key, {
+        "recommended_value": fare,
+        "destination_addresses": google_data["destination_addresses"][0],
+        "origin_addresses": google_data["origin_addresses"][0],
+        "distance": element["distance"]["text"],
+        "duration": element["duration"]["text"]
+    })
+    return fare
+
+
+async def resolve_quoted_fare(
+    session: Optional[Session],
+    quote_id: str,
+    user_id: UUID,
+    type_service_id: int,
+    origin: Coord,
+    destination: Coord,
+    fare_offered: Optional[float] = None
+) -> Optional[float]:
+    """
+    Tarifa de la cotización `quote_id`. Si la cotización no está en este worker
+    (quote_cache sin Redis es por proceso) y el cliente no ofreció tarifa, se
+    recalcula para el recorrido en lugar de rechazar la solicitud.
+    """
+    fare = await run_in_threadpool(get_quoted_fare, quote_id, user_id, type_service_id, origin, destination)
+    if fare is None and fare_offered is None:
+        print(f"[WARN] Cotización {quote_id} no encontrada; se recalcula la tarifa del recorrido")
+        fare = await recompute_fare(session, type_service_id, origin, destination)
+    return fare
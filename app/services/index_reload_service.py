@@ -0,0 +1,59 @@
+import asyncio
+from typing import Callable, List, Optional, Tuple
+
+import anyio
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+from app.services.client_requests_service import load_open_request_index
+from app.services.driver_position_service import load_driver_position_index
+
+
+class IndexReloader:
+    """
+    Recarga periódica de los índices en memoria desde la base de datos, en un hilo
+    aparte cada GEO_INDEX_RELOAD_SECONDS. Acota el desfase con lo que escriben los
+    demás workers sin que ninguna petición pague una recarga completa.
+    """
+
+    def __init__(self, loaders: List[Tuple[str, Callable[[Session], None]]]):
+        self.loaders = loaders
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+
+    def reload_all(self, session_engine=None) -> None:
+        for name, loader in self.loaders:
+            try:
+                with Session(session_engine or engine) as session:
+                    loader(session)
+            except Exception as e:
+                print(f"[ERROR] Recarga del índice {name}: {e}")
+        self.reloads += 1
+
+    async def run(self, interval_seconds: Optional[float] = None) -> None:
+        interval = interval_seconds or settings.GEO_INDEX_RELOAD_SECONDS
+        while True:
+            await asyncio.sleep(interval)
+            await anyio.to_thread.run_sync(self.reload_all)
+
+    def start(self) -> None:
+        if not settings.GEO_INDEX_ENABLED or not settings.GEO_INDEX_RELOAD_SECONDS:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+index_reloader = IndexReloader([
+    ("driver_position", load_driver_position_index),
+    ("open_request", load_open_request_index),
+])
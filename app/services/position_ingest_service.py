@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+from uuid import UUID
+
+import anyio
+from geoalchemy2.shape import from_shape
+from shapely.geometry import Point
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models.driver_position import DriverPosition
+from app.models.user_has_roles import UserHasRole, RoleStatus
+from app.services.driver_position_service import driver_position_index, update_driver_position_index
+from app.services.presence_service import driver_presence
+from app.services.trip_trace_service import trip_trace_store
+
+
+def _upsert_statement(dialect_name: str, rows: list):
+    """INSERT ... ON DUPLICATE KEY UPDATE (MySQL) / ON CONFLICT DO UPDATE (SQLite) de varias filas."""
+    table = DriverPosition.__table__
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        return stmt.on_duplicate_key_update(
+            position=stmt.inserted.position,
+            updated_at=stmt.inserted.updated_at
+        )
+    from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.id_driver],
+        set_={"position": stmt.excluded.position,
+              "updated_at": stmt.excluded.updated_at}
+    )
+
+
+class PositionIngestor:
+    """
+    Recibe las posiciones GPS de los conductores (REST y socket), guarda en memoria
+    solo la última de cada uno y las escribe en driver_position en un único upsert
+    masivo cada POSITION_FLUSH_INTERVAL_MS.
+
+    La posición queda disponible al instante en `latest()`; la base de datos se
+    actualiza con un retraso de a lo sumo un intervalo. Solo las posiciones de
+    conductores ya validados (rol DRIVER aprobado) entran al índice de cercanía, a
+    la presencia y al recorrido; las de ids sin validar esperan al flush, que los
+    valida en una sola consulta por lote antes de indexarlos y escribirlos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest: Dict[UUID, Tuple[float, float, float]] = {}
+        self._dirty: Set[UUID] = set()
+        self._verified: Set[UUID] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_rows = 0
+        self.flushes = 0
+
+    def submit(self, id_driver: UUID, lat: float, lng: float, verified: bool = False) -> Tuple[float, float, float]:
+        """
+        Registra una posición. `verified=True` indica que el llamador ya comprobó
+        que es un conductor aprobado (por ejemplo el endpoint REST).
+        """
+        entry = (float(lat), float(lng), time.time())
+        with self._lock:
+            self._latest[id_driver] = entry
+            self._dirty.add(id_driver)
+            if verified:
+                self._verified.add(id_driver)
+            trusted = id_driver in self._verified
+        if trusted:
+            self._publish(id_driver, entry[0], entry[1])
+            trip_trace_store.append_for_driver(id_driver, lat, lng)
+        return entry
+
+    @staticmethod
+    def _publish(id_driver: UUID, lat: float, lng: float) -> None:
+        # Visible para las búsquedas y los conteos de conductores en línea
+        update_driver_position_index(id_driver, lat, lng)
+        driver_presence.heartbeat(id_driver, lat, lng)
+
+    def latest(self, id_driver: UUID) -> Optional[Tuple[float, float, float]]:
+        """Última posición recibida (lat, lng, timestamp), aunque aún no esté en la base de datos."""
+        return self._latest.get(id_driver)
+
+    def recent(self, since: float) -> Dict[UUID, Tuple[float, float, float]]:
+        """Últimas posiciones recibidas desde `since` (timestamp), pendientes o ya escritas."""
+        with self._lock:
+            return {i: entry for i, entry in self._latest.items() if entry[2] >= since}
+
+    def touch(self, id_driver: UUID) -> bool:
+        """
+        Heartbeat sin movimiento: renueva la marca de tiempo de la última posición y
+        la vuelve a escribir en el siguiente flush, para que los demás workers vean al
+        conductor en línea (driver_position.updated_at). False si no hay posición.
+        """
+        with self._lock:
+            entry = self._latest.get(id_driver)
+            if entry is None:
+                return False
+            self._latest[id_driver] = (entry[0], entry[1], time.time())
+            self._dirty.add(id_driver)
+            return True
+
+    def discard(self, id_driver: UUID) -> None:
+        """Olvida la posición pendiente (por ejemplo al borrar la posición del conductor)."""
+        with self._lock:
+            self._latest.pop(id_driver, None)
+            self._dirty.discard(id_driver)
+
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def _verify(self, session: Session, ids: Set[UUID]) -> Set[UUID]:
+        unknown = [i for i in ids if i not in self._verified]
+        if unknown:
+            rows = session.query(UserHasRole.id_user).filter(
+                UserHasRole.id_user.in_(unknown),
+                UserHasRole.id_rol == "DRIVER",
+                UserHasRole.status == RoleStatus.APPROVED
+            ).all()
+            approved = {row[0] for row in rows}
+            with self._lock:
+                self._verified.update(approved)
+            for id_driver in approved:
+                entry = self._latest.get(id_driver)
+                if entry is not None:
+                    self._publish(id_driver, entry[0], entry[1])
+            for id_driver in set(unknown) - approved:
+                print(f"[WARN] Posición descartada, {id_driver} no es un conductor aprobado")
+                self.discard(id_driver)
+        return {i for i in ids if i in self._verified}
+
+    def flush(self, session_engine=None) -> int:
+        """Escribe en la base de datos las posiciones pendientes. Retorna las filas escritas."""
+        session_engine = session_engine or engine
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            snapshot = {i: self._latest[i] for i in dirty if i in self._latest}
+        if not snapshot:
+            return 0
+        try:
+            with Session(session_engine) as session:
+                ids = self._verify(session, set(snapshot))
+                rows = []
+                for id_driver in ids:
+                    lat, lng, ts = snapshot[id_driver]
+                    updated_at = datetime.utcfromtimestamp(ts)
+                    rows.append({
+                        "id_driver": id_driver,
+                        "position": from_shape(Point(lng, lat), srid=4326),
+                        "created_at": updated_at,
+                        "updated_at": updated_at
+                    })
+                if rows:
+                    session.execute(_upsert_statement(
+                        session_engine.dialect.name, rows))
+                    session.commit()
+        except Exception as e:
+            print(f"[ERROR] No se pudieron guardar {len(snapshot)} posiciones: {e}")
+            with self._lock:
+                # Reintentar en el próximo flush las que no se actualizaron mientras tanto
+                self._dirty.update(i for i in snapshot if i in self._latest)
+            return 0
+        self.flushes += 1
+        self.flushed_rows += len(rows)
+        return len(rows)
+
+    async def run(self, interval_ms: Optional[int] = None) -> None:
+        interval = (interval_ms or settings.POSITION_FLUSH_INTERVAL_MS) / 1000
+        while True:
+            await asyncio.sleep(interval)
+            if self._dirty:
+                await anyio.to_thread.run_sync(self.flush)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Detiene el ciclo y escribe lo que quede pendiente."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await anyio.to_thread.run_sync(self.flush)
+
+
+position_ingestor = PositionIngestor()
@@ -0,0 +1,228 @@
+import asyncio
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import anyio
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models.driver_info import DriverInfo
+from app.models.vehicle_info import VehicleInfo
+from app.services.driver_position_service import driver_position_index
+
+Cell = Tuple[int, int]
+
+
+class DriverPresence:
+    """
+    Conductores en línea en este worker. Cada heartbeat o posición renueva su TTL
+    (PRESENCE_TTL_SECONDS); el barrido periódico retira a los vencidos del índice de
+    cercanía, así un teléfono que perdió la conexión deja de aparecer en las búsquedas.
+
+    Mantiene contadores por celda (PRESENCE_CELL_DEG), por tipo de vehículo y por
+    (celda, tipo) que se actualizan en cada cambio, de modo que las consultas de
+    oferta en línea son O(1). Los heartbeats se guardan en orden de llegada
+    (OrderedDict), y el barrido solo recorre los vencidos.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, cell_deg: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds or settings.PRESENCE_TTL_SECONDS
+        self.cell_deg = cell_deg or settings.PRESENCE_CELL_DEG
+        self._lock = threading.Lock()
+        self._seen: "OrderedDict[UUID, float]" = OrderedDict()
+        self._cells: Dict[UUID, Cell] = {}
+        # Tipo de vehículo por conductor; None si ya se consultó y no tiene vehículo
+        self._types: Dict[UUID, Optional[int]] = {}
+        self._cell_counts: Counter = Counter()
+        self._type_counts: Counter = Counter()
+        self._cell_type_counts: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+        self.heartbeats = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def __contains__(self, id_driver: UUID) -> bool:
+        return self.is_online(id_driver)
+
+    def cell_of(self, lat: float, lng: float) -> Cell:
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def _account(self, id_driver: UUID, delta: int) -> None:
+        cell = self._cells.get(id_driver)
+        vehicle_type_id = self._types.get(id_driver)
+        keys = []
+        if cell is not None:
+            keys.append((self._cell_counts, cell))
+        if vehicle_type_id is not None:
+            keys.append((self._type_counts, vehicle_type_id))
+        if cell is not None and vehicle_type_id is not None:
+            keys.append((self._cell_type_counts, (cell, vehicle_type_id)))
+        for counter, key in keys:
+            counter[key] += delta
+            if counter[key] <= 0:
+                del counter[key]
+
+    def heartbeat(
+        self,
+        id_driver: UUID,
+        lat: Optional[float] = None,
+        lng: Optional[float] = None,
+        vehicle_type_id: Optional[int] = None,
+        now: Optional[float] = None
+    ) -> None:
+        """Marca al conductor en línea; con lat/lng actualiza su celda."""
+        now = time.time() if now is None else now
+        with self._lock:
+            online = id_driver in self._seen
+            if online:
+                self._account(id_driver, -1)
+            self._seen[id_driver] = now
+            self._seen.move_to_end(id_driver)
+            if lat is not None and lng is not None:
+                self._cells[id_driver] = self.cell_of(float(lat), float(lng))
+            if vehicle_type_id is not None:
+                self._types[id_driver] = vehicle_type_id
+            self._account(id_driver, 1)
+            self.heartbeats += 1
+        # Misma marca en el índice de cercanía: un conductor quieto que envía
+        # heartbeats sigue vigente allí aunque no cambie de posición
+        driver_position_index.touch(id_driver, now)
+
+    def _drop(self, id_driver: UUID) -> None:
+        self._account(id_driver, -1)
+        self._seen.pop(id_driver, None)
+        self._cells.pop(id_driver, None)
+        self._types.pop(id_driver, None)
+
+    def remove(self, id_driver: UUID) -> bool:
+        """Quita al conductor de la presencia (no del índice de cercanía)."""
+        with self._lock:
+            if id_driver not in self._seen:
+                return False
+            self._drop(id_driver)
+            return True
+
+    def is_online(self, id_driver: UUID, now: Optional[float] = None) -> bool:
+        seen = self._seen.get(id_driver)
+        now = time.time() if now is None else now
+        return seen is not None and now - seen < self.ttl_seconds
+
+    def online_count(self, vehicle_type_id: Optional[int] = None) -> int:
+        """Conductores en línea, en total o de un tipo de vehículo."""
+        if vehicle_type_id is None:
+            return len(self._seen)
+        return self._type_counts.get(vehicle_type_id, 0)
+
+    def online_in_cell(self, lat: float, lng: float, vehicle_type_id: Optional[int] = None) -> int:
+        """Conductores en línea en la celda de (lat, lng), en total o de un tipo de vehículo."""
+        cell = self.cell_of(lat, lng)
+        if vehicle_type_id is None:
+            return self._cell_counts.get(cell, 0)
+        return self._cell_type_counts.get((cell, vehicle_type_id), 0)
+
+    def sweep(self, now: Optional[float] = None) -> List[UUID]:
+        """
+        Retira a los conductores sin heartbeat en el TTL de la presencia, y del índice
+        de cercanía las entradas cuyo propio updated_at venció con el mismo TTL, sin
+        importar si vienen de este worker o de una recarga desde la base de datos.
+        Un conductor que dejó de enviar aquí pero cuya entrada se renovó desde otro
+        worker sigue en el índice. Retorna los retirados de la presencia.
+        """
+        from app.services.position_ingest_service import position_ingestor
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._seen:
+                id_driver, seen = next(iter(self._seen.items()))
+                if now - seen < self.ttl_seconds:
+                    break
+                self._drop(id_driver)
+                expired.append(id_driver)
+            self.evicted += len(expired)
+        stale = driver_position_index.evict_older_than(now - self.ttl_seconds)
+        for id_driver in set(expired) | set(stale):
+            position_ingestor.discard(id_driver)
+        if expired or stale:
+            print(f"[INFO] Presencia: {len(expired)} conductores fuera de línea por TTL, "
+                  f"{len(stale)} posiciones vencidas retiradas del índice")
+        return expired
+
+    def _unresolved(self) -> List[UUID]:
+        with self._lock:
+            return [i for i in self._seen if i not in self._types]
+
+    def resolve_vehicle_types(self, session: Session, ids: Optional[Iterable[UUID]] = None) -> int:
+        """Carga en una consulta el tipo de vehículo de los conductores que aún no lo tienen."""
+        ids = list(ids) if ids is not None else self._unresolved()
+        if not ids:
+            return 0
+        rows = (
+            session.query(DriverInfo.user_id, VehicleInfo.vehicle_type_id)
+            .join(VehicleInfo, VehicleInfo.driver_info_id == DriverInfo.id)
+            .filter(DriverInfo.user_id.in_(ids))
+            .all()
+        )
+        found = dict(rows)
+        with self._lock:
+            for id_driver in ids:
+                if id_driver not in self._seen or id_driver in self._types:
+                    continue
+                self._account(id_driver, -1)
+                self._types[id_driver] = found.get(id_driver)
+                self._account(id_driver, 1)
+        return len(found)
+
+    def _sweep_and_resolve(self, session_engine=None) -> None:
+        self.sweep()
+        if self._unresolved():
+            with Session(session_engine or engine) as session:
+                self.resolve_vehicle_types(session)
+
+    def stats(self, top_cells: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            busiest = self._cell_counts.most_common(top_cells)
+            return {
+                "online": len(self._seen),
+                "by_vehicle_type": {str(k): v for k, v in self._type_counts.items()},
+                "cells": len(self._cell_counts),
+                "busiest_cells": [
+                    {"lat": round(lat * self.cell_deg, 6), "lng": round(lng * self.cell_deg, 6), "online": count}
+                    for (lat, lng), count in busiest
+                ],
+                "heartbeats": self.heartbeats,
+                "evicted": self.evicted,
+                "ttl_seconds": self.ttl_seconds,
+                "cell_deg": self.cell_deg
+            }
+
+    async def run(self, interval_seconds: Optional[float] = None) -> None:
+        interval = interval_seconds or settings.PRESENCE_SWEEP_SECONDS
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await anyio.to_thread.run_sync(self._sweep_and_resolve)
+            except Exception as e:
+                print(f"[ERROR] Barrido de presencia: {e}")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+driver_presence = DriverPresence()
@@ -1,7 +1,106 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 from app.models.project_settings import ProjectSettings, ProjectSettingsUpdate,ProjectSettingsCreate
+from app.core.cache import SharedVersion
+from app.core.config import settings as app_settings
+from app.core.db import engine
+from dataclasses import dataclass
 from datetime import datetime 
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Mapping, Optional
+import threading
+import time
+
+PERCENTAGE_FIELDS = ("driver_dist", "referral_1", "referral_2", "referral_3", "referral_4",
+                     "referral_5", "driver_saving", "company", "bonus")
+
+
+@dataclass(frozen=True)
+class ProjectSettingsSnapshot:
+    """Configuración del proyecto ya convertida a Decimal; inmutable y compartida entre peticiones."""
+    id: int
+    updated_at: datetime
+    driver_dist: Decimal
+    referral_1: Decimal
+    referral_2: Decimal
+    referral_3: Decimal
+    referral_4: Decimal
+    referral_5: Decimal
+    driver_saving: Decimal
+    company: Decimal
+    bonus: Decimal
+    amount: Decimal  # Monto mínimo para retiro de ahorros
+    percentages: Mapping[str, Decimal]
+
+    @classmethod
+    def from_row(cls, row: ProjectSettings) -> "ProjectSettingsSnapshot":
+        values = {field: Decimal(getattr(row, field)) for field in PERCENTAGE_FIELDS + ("amount",)}
+        return cls(
+            id=row.id,
+            updated_at=row.updated_at,
+            percentages=MappingProxyType({field: values[field] for field in PERCENTAGE_FIELDS}),
+            **values
+        )
+
+    @property
+    def referral_pcts(self) -> list:
+        return [self.referral_1, self.referral_2, self.referral_3, self.referral_4, self.referral_5]
+
+
+class ProjectSettingsCache:
+    """
+    Última configuración del proyecto en memoria.
+
+    Se invalida de dos formas: `invalidate()` incrementa una versión compartida
+    (inmediato en este proceso y, con REDIS_URL, en todos los workers), y cada
+    PROJECT_SETTINGS_CHECK_SECONDS se compara la columna updated_at de la fila,
+    así que sin Redis los demás workers ven el cambio con ese retraso máximo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[ProjectSettingsSnapshot] = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self.version = SharedVersion(
+            "project_settings", check_seconds=app_settings.PROJECT_SETTINGS_CHECK_SECONDS)
+        self.loads = 0
+
+    def _refresh(self, session: Session, version: int) -> Optional[ProjectSettingsSnapshot]:
+        snapshot = self._snapshot
+        if snapshot is not None and version == self._version:
+            # Verificación barata por la columna updated_at
+            updated_at = session.query(ProjectSettings.updated_at).filter(
+                ProjectSettings.id == snapshot.id).scalar()
+            if updated_at == snapshot.updated_at:
+                self._checked_at = time.monotonic()
+                return snapshot
+        row = session.query(ProjectSettings).order_by(ProjectSettings.id).first()
+        self._snapshot = ProjectSettingsSnapshot.from_row(row) if row else None
+        self._version = version
+        self._checked_at = time.monotonic()
+        self.loads += 1
+        return self._snapshot
+
+    def get(self, session: Optional[Session] = None) -> Optional[ProjectSettingsSnapshot]:
+        """Configuración vigente, o None si aún no se ha creado."""
+        version = self.version.get()
+        snapshot = self._snapshot
+        if (snapshot is not None and version == self._version
+                and time.monotonic() - self._checked_at < app_settings.PROJECT_SETTINGS_CHECK_SECONDS):
+            return snapshot
+        with self._lock:
+            if session is not None:
+                return self._refresh(session, version)
+            with Session(engine) as own_session:
+                return self._refresh(own_session, version)
+
+    def invalidate(self) -> None:
+        self.version.bump()
+
+
+project_settings_cache = ProjectSettingsCache()
 
 
 def update_project_settings_service(session: Session, settings_data: ProjectSettingsUpdate):
@@ -34,6 +133,7 @@ def update_project_settings_service(session: Session, settings_data: ProjectSett
         session.add(settings)
         session.commit()
         session.refresh(settings)
+        project_settings_cache.invalidate()
         return settings
     except Exception as e:
         session.rollback()
@@ -73,6 +173,7 @@ def create_project_settings_service(session: Session, settings_data: ProjectSett
         session.add(settings)
         session.commit()
         session.refresh(settings)
+        project_settings_cache.invalidate()
         return settings
     except Exception as e:
         session.rollback()
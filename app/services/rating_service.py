@@ -0,0 +1,155 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, text
+from sqlmodel import Session
+
+from app.models.client_request import ClientRequest, StatusEnum
+from app.models.rating_aggregate import RatingAggregate
+
+ROLES = ("driver", "passenger")
+
+# Lock de MySQL (GET_LOCK) para que un solo worker reconstruya los agregados al arrancar
+REBUILD_LOCK_NAME = "rating_aggregate_rebuild"
+
+
+def _validate_role(role: str) -> None:
+    if role not in ROLES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El parámetro 'role' debe ser 'driver' o 'passenger'"
+        )
+
+
+def apply_rating(session: Session, role: str, id_user: UUID, new_rating: Optional[float], old_rating: Optional[float] = None) -> None:
+    """
+    Ajusta el agregado del usuario cuando una calificación pasa de `old_rating`
+    a `new_rating` (None = sin calificación). Si la solicitud ya estaba calificada
+    se reemplaza el valor anterior en lugar de sumarlo dos veces.
+    No hace commit: queda en la misma transacción que la calificación.
+    """
+    _validate_role(role)
+    delta_sum = (new_rating or 0.0) - (old_rating or 0.0)
+    delta_count = (new_rating is not None) - (old_rating is not None)
+    if delta_sum == 0 and delta_count == 0:
+        return
+    # Upsert atómico: dos primeras calificaciones simultáneas no chocan ni se pierden
+    session.execute(_upsert_statement(
+        session.get_bind().dialect.name, id_user, role, delta_sum, delta_count))
+
+
+def _upsert_statement(dialect_name: str, id_user: UUID, role: str, delta_sum: float, delta_count: int):
+    """INSERT ... ON DUPLICATE KEY UPDATE (MySQL) / ON CONFLICT DO UPDATE (SQLite) que suma los deltas."""
+    table = RatingAggregate.__table__
+    now = datetime.utcnow()
+    values = {
+        "id_user": id_user, "role": role, "updated_at": now,
+        "rating_sum": max(delta_sum, 0.0), "rating_count": max(delta_count, 0)
+    }
+    increments = {
+        "rating_sum": table.c.rating_sum + delta_sum,
+        "rating_count": table.c.rating_count + delta_count,
+        "updated_at": now
+    }
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        return insert(table).values(values).on_duplicate_key_update(**increments)
+    from sqlalchemy.dialects.sqlite import insert
+    return insert(table).values(values).on_conflict_do_update(
+        index_elements=[table.c.id_user, table.c.role], set_=increments)
+
+
+def get_average_rating(session: Session, role: str, id_user: UUID) -> float:
+    """Promedio de calificaciones del usuario en el rol, leído del agregado (0.0 si no tiene)."""
+    _validate_role(role)
+    aggregate = session.get(RatingAggregate, (id_user, role))
+    if aggregate is None or aggregate.rating_count <= 0:
+        return 0.0
+    return aggregate.rating_sum / aggregate.rating_count
+
+
+def get_average_ratings(session: Session, role: str, user_ids: Iterable[UUID]) -> Dict[UUID, float]:
+    """Promedios de varios usuarios en una sola consulta; los que no tienen quedan en 0.0."""
+    _validate_role(role)
+    user_ids = list({i for i in user_ids if i is not None})
+    averages = {i: 0.0 for i in user_ids}
+    if not user_ids:
+        return averages
+    rows = session.query(
+        RatingAggregate.id_user, RatingAggregate.rating_sum, RatingAggregate.rating_count
+    ).filter(
+        RatingAggregate.role == role,
+        RatingAggregate.id_user.in_(user_ids)
+    ).all()
+    for id_user, rating_sum, rating_count in rows:
+        if rating_count > 0:
+            averages[id_user] = rating_sum / rating_count
+    return averages
+
+
+def rebuild_rating_aggregates(session: Session) -> int:
+    """
+    Reconstruye todos los agregados a partir del historial de client_request
+    (solo solicitudes PAID, igual que el promedio original). Retorna las filas creadas.
+    """
+    sources = {
+        "passenger": (ClientRequest.id_client, ClientRequest.client_rating),
+        "driver": (ClientRequest.id_driver_assigned, ClientRequest.driver_rating),
+    }
+    session.query(RatingAggregate).delete()
+    now = datetime.utcnow()
+    created = 0
+    for role, (user_column, rating_column) in sources.items():
+        rows = session.query(
+            user_column, func.sum(rating_column), func.count(rating_column)
+        ).filter(
+            user_column.isnot(None),
+            rating_column.isnot(None),
+            ClientRequest.status == StatusEnum.PAID
+        ).group_by(user_column).all()
+        for id_user, rating_sum, rating_count in rows:
+            session.add(RatingAggregate(
+                id_user=id_user, role=role, rating_sum=float(rating_sum),
+                rating_count=int(rating_count), updated_at=now
+            ))
+            created += 1
+    session.commit()
+    return created
+
+
+def ensure_rating_aggregates(session: Session) -> None:
+    """
+    Si la tabla de agregados está vacía (primer arranque) la llena desde el historial.
+    En MySQL solo lo hace el worker que obtiene el lock REBUILD_LOCK_NAME; los demás
+    arrancan sin esperar (la reconstrucción es idempotente y la ve el siguiente arranque).
+    """
+    bind = session.get_bind()
+    try:
+        with bind.connect() as lock_conn:
+            if bind.dialect.name == "mysql":
+                acquired = lock_conn.execute(
+                    text("SELECT GET_LOCK(:name, 0)"), {"name": REBUILD_LOCK_NAME}).scalar()
+                if acquired != 1:
+                    print("[INFO] Otro worker está reconstruyendo los agregados de calificaciones")
+                    return
+            try:
+                if session.query(RatingAggregate.id_user).first() is None:
+                    created = rebuild_rating_aggregates(session)
+                    print(f"[INFO] Agregados de calificaciones reconstruidos: {created}")
+            finally:
+                if bind.dialect.name == "mysql":
+                    lock_conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": REBUILD_LOCK_NAME})
+    except Exception as e:
+        print(f"[WARN] No se pudieron reconstruir los agregados de calificaciones: {e}")
+        session.rollback()
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.services.rating_service
+    from app.core.db import engine
+
+    with Session(engine) as session:
+        created = rebuild_rating_aggregates(session)
+    print(f"[INFO] Agregados de calificaciones reconstruidos: {created}")
@@ -0,0 +1,147 @@
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlmodel import Session
+
+from app.core.cache import SharedVersion
+from app.core.config import settings
+from app.core.db import engine
+from app.models.bank import Bank
+from app.models.config_service_value import ConfigServiceValue
+from app.models.payment_method import PaymentMethod
+from app.models.type_service import TypeService
+from app.models.vehicle_type import VehicleType
+
+REFERENCE_MODELS = (TypeService, VehicleType, PaymentMethod, ConfigServiceValue, Bank)
+
+
+def _detached_copy(row):
+    # Copia sin sesión: solo columnas, sin relaciones ni carga perezosa
+    return type(row)(**row.model_dump())
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """
+    Foto inmutable de las tablas de referencia. Los objetos no están ligados a
+    ninguna sesión: se leen, no se modifican ni se agregan a una sesión.
+    """
+    version: int
+    loaded_at: float
+    fingerprint: Tuple
+    type_services: Dict[int, TypeService]
+    vehicle_types: Dict[int, VehicleType]
+    payment_methods: Dict[int, PaymentMethod]
+    config_values: Dict[int, ConfigServiceValue]  # por service_type_id
+    banks: Dict[int, Bank]
+
+    @cached_property
+    def tariff_version(self) -> str:
+        """
+        Huella de los valores de ConfigServiceValue: cambia solo si cambia alguna
+        tarifa y es igual en todos los workers que tengan las mismas tarifas.
+        """
+        values = sorted(
+            (c.service_type_id, c.km_value, c.min_value, c.tarifa_value)
+            for c in self.config_values.values()
+        )
+        return hashlib.sha1(repr(values).encode()).hexdigest()[:12]
+
+    def type_services_for_vehicle(self, vehicle_type_id: int) -> List[TypeService]:
+        return [ts for ts in self.type_services.values() if ts.vehicle_type_id == vehicle_type_id]
+
+    def payment_method(self, payment_method_id: Optional[int]) -> Optional[dict]:
+        pm = self.payment_methods.get(payment_method_id)
+        return {"id": pm.id, "name": pm.name} if pm else None
+
+
+class ReferenceDataCache:
+    """
+    Caché de proceso para TypeService, VehicleType, PaymentMethod,
+    ConfigServiceValue y Bank: se carga al arrancar y se sirve desde memoria.
+
+    Las escrituras administrativas llaman `invalidate()`, que incrementa la versión
+    compartida (Redis si está configurado); cada worker recarga en su siguiente
+    acceso al ver una versión distinta. Además, cada REFERENCE_DATA_CHECK_SECONDS
+    se compara (count, max(updated_at)) de las tablas con el de la foto en una sola
+    consulta, así que sin Redis los demás workers ven el cambio con ese retraso.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Optional[ReferenceData] = None
+        self._checked_at = 0.0
+        self.version = SharedVersion(
+            "reference_data", check_seconds=settings.REFERENCE_DATA_VERSION_CHECK_SECONDS)
+        self.loads = 0
+
+    @staticmethod
+    def fingerprint(session: Session) -> Tuple:
+        """(count, max(updated_at)) de cada tabla de referencia, en una sola consulta."""
+        columns = []
+        for model in REFERENCE_MODELS:
+            columns.append(select(func.count()).select_from(model).scalar_subquery())
+            columns.append(select(func.max(model.updated_at)).scalar_subquery())
+        return tuple(session.execute(select(*columns)).one())
+
+    def load(self, session: Session) -> ReferenceData:
+        # La versión y la huella se leen antes de consultar: si cambian durante la carga, se recarga después
+        version = self.version.get()
+        fingerprint = self.fingerprint(session)
+        data = ReferenceData(
+            version=version,
+            loaded_at=time.monotonic(),
+            fingerprint=fingerprint,
+            type_services={row.id: _detached_copy(row) for row in session.query(TypeService).all()},
+            vehicle_types={row.id: _detached_copy(row) for row in session.query(VehicleType).all()},
+            payment_methods={row.id: _detached_copy(row) for row in session.query(PaymentMethod).all()},
+            config_values={row.service_type_id: _detached_copy(row)
+                           for row in session.query(ConfigServiceValue).all()},
+            banks={row.id: _detached_copy(row) for row in session.query(Bank).all()},
+        )
+        self._data = data
+        self._checked_at = data.loaded_at
+        self.loads += 1
+        return data
+
+    def _is_fresh(self, data: Optional[ReferenceData]) -> bool:
+        return (
+            data is not None
+            and data.version == self.version.get()
+            and time.monotonic() - data.loaded_at < settings.REFERENCE_DATA_MAX_AGE_SECONDS
+        )
+
+    def _refresh(self, session: Session) -> ReferenceData:
+        data = self._data
+        if self._is_fresh(data):
+            # Verificación barata: las tablas no cambiaron desde la foto
+            if self.fingerprint(session) == data.fingerprint:
+                self._checked_at = time.monotonic()
+                return data
+        return self.load(session)
+
+    def get(self, session: Optional[Session] = None) -> ReferenceData:
+        """Datos vigentes; recarga (con `session` o una sesión propia) si la versión o las tablas cambiaron."""
+        data = self._data
+        if self._is_fresh(data) and time.monotonic() - self._checked_at < settings.REFERENCE_DATA_CHECK_SECONDS:
+            return data
+        with self._lock:
+            data = self._data
+            if self._is_fresh(data) and time.monotonic() - self._checked_at < settings.REFERENCE_DATA_CHECK_SECONDS:
+                return data
+            if session is not None:
+                return self._refresh(session)
+            with Session(engine) as own_session:
+                return self._refresh(own_session)
+
+    def invalidate(self) -> None:
+        """Llamar después del commit de cualquier escritura sobre estas tablas."""
+        self.version.bump()
+
+
+reference_data = ReferenceDataCache()
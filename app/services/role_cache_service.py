@@ -0,0 +1,89 @@
+from typing import Dict, Optional
+from uuid import UUID
+
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core.cache import build_cache
+from app.core.config import settings
+from app.models.user_has_roles import RoleStatus, UserHasRole
+
+
+class RoleCache:
+    """
+    Roles de cada usuario con su estado ({"DRIVER": "approved", ...}), para que
+    las validaciones de rol de los endpoints no vayan a la base de datos.
+
+    Se carga con una consulta por usuario (todos sus roles) y expira a los
+    ROLE_CACHE_TTL_SECONDS. Quien cambie UserHasRole debe llamar `invalidate`
+    después del commit; con Redis, los demás workers lo ven a más tardar en
+    ROLE_CACHE_LOCAL_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self.cache = build_cache(
+            "user_roles",
+            maxsize=settings.ROLE_CACHE_MAXSIZE,
+            ttl=settings.ROLE_CACHE_TTL_SECONDS,
+            local_ttl=settings.ROLE_CACHE_LOCAL_TTL_SECONDS
+        )
+
+    @staticmethod
+    def _load(session: Session, user_id: UUID) -> Dict[str, str]:
+        rows = session.query(UserHasRole.id_rol, UserHasRole.status).filter(
+            UserHasRole.id_user == user_id
+        ).all()
+        return {id_rol: RoleStatus(status).value for id_rol, status in rows}
+
+    def statuses(self, session: Session, user_id: UUID) -> Dict[str, str]:
+        key = str(user_id)
+        roles = self.cache.get(key)
+        if roles is None:
+            roles = self._load(session, user_id)
+            self.cache.set(key, roles)
+        return roles
+
+    async def statuses_async(self, session: AsyncSession, user_id: UUID) -> Dict[str, str]:
+        """
+        Como `statuses`, para handlers async: la caché (que puede ser Redis síncrono)
+        se consulta en el threadpool y, si falta, la consulta va por la sesión asíncrona.
+        """
+        key = str(user_id)
+        roles = await run_in_threadpool(self.cache.get, key)
+        if roles is None:
+            roles = await session.run_sync(self._load, user_id)
+            await run_in_threadpool(self.cache.set, key, roles)
+        return roles
+
+    @staticmethod
+    def _matches(statuses: Dict[str, str], role: str, approved: bool) -> bool:
+        status = statuses.get(role)
+        if status is None:
+            return False
+        return not approved or status == RoleStatus.APPROVED.value
+
+    def has_role(self, session: Session, user_id: UUID, role: str, approved: bool = True) -> bool:
+        return self._matches(self.statuses(session, user_id), role, approved)
+
+    async def has_role_async(self, session: AsyncSession, user_id: UUID, role: str, approved: bool = True) -> bool:
+        return self._matches(await self.statuses_async(session, user_id), role, approved)
+
+    def approved_role(self, session: Session, user_id: UUID) -> Optional[str]:
+        """Primer rol aprobado del usuario ('CLIENT' antes que 'DRIVER'), o None."""
+        approved = sorted(role for role, status in self.statuses(session, user_id).items()
+                          if status == RoleStatus.APPROVED.value)
+        return approved[0] if approved else None
+
+    def invalidate(self, user_id: Optional[UUID] = None) -> None:
+        """Descarta los roles de `user_id`, o de todos los usuarios si no se indica."""
+        if user_id is None:
+            self.cache.clear()
+        else:
+            self.cache.delete(str(user_id))
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+role_cache = RoleCache()
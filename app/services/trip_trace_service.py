@@ -0,0 +1,324 @@
+import asyncio
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+import anyio
+import numpy as np
+from fastapi import HTTPException
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models.client_request import ClientRequest, StatusEnum
+from app.models.trip_trace import TripTrace, TripTraceChunk
+from app.utils.trace_codec import douglas_peucker, pack_trace, path_length_m, unpack_trace
+
+Points = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class _ActiveTrace:
+    __slots__ = ("id_driver", "id_client", "ts", "lats", "lngs", "last_ts", "count", "started_at")
+
+    def __init__(self, id_driver: Optional[UUID], id_client: Optional[UUID]):
+        self.id_driver = id_driver
+        self.id_client = id_client
+        # Puntos aún no escritos en trip_trace_chunk
+        self.ts = array("d")
+        self.lats = array("d")
+        self.lngs = array("d")
+        self.last_ts: Optional[float] = None
+        self.count = 0
+        self.started_at = datetime.utcnow()
+
+    def take(self) -> Points:
+        points = (np.frombuffer(self.ts, dtype=np.float64).copy(),
+                  np.frombuffer(self.lats, dtype=np.float64).copy(),
+                  np.frombuffer(self.lngs, dtype=np.float64).copy())
+        self.ts, self.lats, self.lngs = array("d"), array("d"), array("d")
+        return points
+
+
+def _merge(parts: List[Points]) -> Points:
+    """Une bloques de puntos (de varios workers) en orden de tiempo."""
+    parts = [part for part in parts if len(part[0])]
+    if not parts:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty, empty
+    ts, lats, lngs = (np.concatenate([part[i] for part in parts]) for i in range(3))
+    order = np.argsort(ts, kind="stable")
+    return ts[order], lats[order], lngs[order]
+
+
+class TripTraceStore:
+    """
+    Recorridos de los viajes en curso, en arreglos tipados (array('d')) por solicitud.
+
+    Un recorrido se abre cuando el viaje pasa a TRAVELLING y solo entonces acepta
+    puntos. Los puntos pueden llegar por la solicitud, por el conductor o por el
+    cliente del viaje; los que llegan a menos de TRIP_TRACE_MIN_INTERVAL_S del
+    anterior se descartan.
+
+    Con varios workers los puntos llegan al que tiene el socket del conductor, así
+    que cada worker escribe los suyos en trip_trace_chunk cada TRIP_TRACE_FLUSH_SECONDS
+    y en el mismo ciclo carga de la base de datos los viajes en TRAVELLING. Al
+    terminar el viaje se unen todos los bloques, se simplifican con Douglas–Peucker
+    y se guarda una sola fila en trip_trace.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Dict[UUID, _ActiveTrace] = {}
+        self._by_driver: Dict[UUID, UUID] = {}
+        self._by_client: Dict[UUID, UUID] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.chunks_written = 0
+
+    def start(self, id_client_request: UUID, id_driver: Optional[UUID] = None, id_client: Optional[UUID] = None) -> None:
+        with self._lock:
+            if id_client_request not in self._active:
+                self._active[id_client_request] = _ActiveTrace(id_driver, id_client)
+            if id_driver is not None:
+                self._by_driver[id_driver] = id_client_request
+            if id_client is not None:
+                self._by_client[id_client] = id_client_request
+
+    def is_active(self, id_client_request: UUID) -> bool:
+        return id_client_request in self._active
+
+    def append(self, id_client_request: UUID, lat: float, lng: float, ts: Optional[float] = None) -> bool:
+        """Agrega un punto al recorrido; False si el viaje no tiene un recorrido abierto o está lleno."""
+        with self._lock:
+            trace = self._active.get(id_client_request)
+            if trace is None or trace.count >= settings.TRIP_TRACE_MAX_POINTS:
+                return False
+            ts = ts if ts is not None else time.time()
+            if trace.last_ts is not None and ts - trace.last_ts < settings.TRIP_TRACE_MIN_INTERVAL_S:
+                return False
+            trace.ts.append(ts)
+            trace.lats.append(float(lat))
+            trace.lngs.append(float(lng))
+            trace.last_ts = ts
+            trace.count += 1
+            return True
+
+    def append_for_driver(self, id_driver: UUID, lat: float, lng: float) -> bool:
+        """Agrega el punto al viaje en curso del conductor, si tiene uno."""
+        id_client_request = self._by_driver.get(id_driver)
+        if id_client_request is None:
+            return False
+        return self.append(id_client_request, lat, lng)
+
+    def append_for_client(self, id_client: UUID, lat: float, lng: float) -> bool:
+        """Agrega el punto al viaje en curso del cliente, si tiene uno."""
+        id_client_request = self._by_client.get(id_client)
+        if id_client_request is None:
+            return False
+        return self.append(id_client_request, lat, lng)
+
+    def snapshot(self, id_client_request: UUID) -> Optional[Points]:
+        """Copia de los puntos de este worker aún no escritos, o None si el viaje no está abierto aquí."""
+        with self._lock:
+            trace = self._active.get(id_client_request)
+            if trace is None:
+                return None
+            return (np.frombuffer(trace.ts, dtype=np.float64).copy(),
+                    np.frombuffer(trace.lats, dtype=np.float64).copy(),
+                    np.frombuffer(trace.lngs, dtype=np.float64).copy())
+
+    def _pop(self, id_client_request: UUID) -> Optional[_ActiveTrace]:
+        with self._lock:
+            trace = self._active.pop(id_client_request, None)
+            if trace is not None:
+                if self._by_driver.get(trace.id_driver) == id_client_request:
+                    del self._by_driver[trace.id_driver]
+                if self._by_client.get(trace.id_client) == id_client_request:
+                    del self._by_client[trace.id_client]
+            return trace
+
+    def flush(self, session_engine=None) -> int:
+        """
+        Escribe en trip_trace_chunk los puntos pendientes de cada viaje (un bloque por
+        viaje) y descarta los de viajes que otro worker ya cerró. Retorna los bloques escritos.
+        """
+        with self._lock:
+            batch = {i: trace.take() for i, trace in self._active.items() if len(trace.ts)}
+        if not batch:
+            return 0
+        try:
+            with Session(session_engine or engine) as session:
+                finished = {row[0] for row in session.query(TripTrace.id_client_request).filter(
+                    TripTrace.id_client_request.in_(list(batch))).all()}
+                written = 0
+                for id_client_request, (ts, lats, lngs) in batch.items():
+                    if id_client_request in finished:
+                        continue
+                    session.add(TripTraceChunk(
+                        id_client_request=id_client_request,
+                        samples=pack_trace(ts, lats, lngs),
+                        point_count=len(ts)
+                    ))
+                    written += 1
+                session.commit()
+        except Exception as e:
+            print(f"[ERROR] No se pudieron guardar los puntos de {len(batch)} recorridos: {e}")
+            with self._lock:
+                # Reintentar en el próximo ciclo, antes de los puntos que llegaron mientras tanto
+                for id_client_request, (ts, lats, lngs) in batch.items():
+                    trace = self._active.get(id_client_request)
+                    if trace is not None:
+                        trace.ts = array("d", ts.tolist()) + trace.ts
+                        trace.lats = array("d", lats.tolist()) + trace.lats
+                        trace.lngs = array("d", lngs.tolist()) + trace.lngs
+            return 0
+        self.chunks_written += written
+        return written
+
+    def refresh_active(self, session: Session) -> None:
+        """Abre aquí los viajes en TRAVELLING (aunque el cambio de estado ocurrió en otro worker) y cierra los demás."""
+        rows = session.query(
+            ClientRequest.id, ClientRequest.id_driver_assigned, ClientRequest.id_client
+        ).filter(ClientRequest.status == StatusEnum.TRAVELLING).all()
+        travelling = set()
+        for id_client_request, id_driver, id_client in rows:
+            travelling.add(id_client_request)
+            self.start(id_client_request, id_driver, id_client)
+        for id_client_request in [i for i in self._active if i not in travelling]:
+            self._pop(id_client_request)
+
+    def _flush_and_refresh(self) -> None:
+        self.flush()
+        with Session(engine) as session:
+            self.refresh_active(session)
+
+    async def run(self, interval_seconds: Optional[float] = None) -> None:
+        interval = interval_seconds or settings.TRIP_TRACE_FLUSH_SECONDS
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await anyio.to_thread.run_sync(self._flush_and_refresh)
+            except Exception as e:
+                print(f"[ERROR] Ciclo de recorridos: {e}")
+
+    def start_flusher(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop_flusher(self) -> None:
+        """Detiene el ciclo y escribe los puntos pendientes."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await anyio.to_thread.run_sync(self.flush)
+
+    def finish(self, session: Session, id_client_request: UUID) -> Optional[TripTrace]:
+        """
+        Cierra el recorrido: une los bloques escritos por todos los workers con los
+        puntos pendientes de este, lo simplifica y lo guarda. None si no había recorrido.
+        """
+        trace = self._pop(id_client_request)
+        chunks = session.query(TripTraceChunk).filter(
+            TripTraceChunk.id_client_request == id_client_request
+        ).order_by(TripTraceChunk.id).all()
+        if trace is None and not chunks:
+            return None
+        parts = [unpack_trace(chunk.samples) for chunk in chunks]
+        if trace is not None:
+            parts.append(trace.take())
+        ts, lats, lngs = _merge(parts)
+        keep = douglas_peucker(lats, lngs, settings.TRIP_TRACE_TOLERANCE_M)
+        row = session.get(TripTrace, id_client_request) or TripTrace(
+            id_client_request=id_client_request)
+        if trace is not None:
+            row.id_driver = trace.id_driver
+            row.started_at = trace.started_at
+        else:
+            row.started_at = datetime.utcfromtimestamp(ts[0]) if len(ts) else datetime.utcnow()
+        row.samples = pack_trace(ts[keep], lats[keep], lngs[keep])
+        row.point_count = len(keep)
+        row.raw_point_count = len(ts)
+        # La distancia se mide sobre los puntos crudos, antes de simplificar
+        row.distance_m = path_length_m(lats, lngs)
+        row.finished_at = datetime.utcnow()
+        session.add(row)
+        for chunk in chunks:
+            session.delete(chunk)
+        session.commit()
+        return row
+
+
+trip_trace_store = TripTraceStore()
+
+
+def sync_trip_trace(session: Session, client_request: ClientRequest) -> None:
+    """Abre o cierra el recorrido según el nuevo estado de la solicitud (llamar después del commit)."""
+    try:
+        if client_request.status == StatusEnum.TRAVELLING:
+            trip_trace_store.start(client_request.id,
+                                   client_request.id_driver_assigned, client_request.id_client)
+        elif client_request.status in (StatusEnum.FINISHED, StatusEnum.PAID, StatusEnum.CANCELLED):
+            trip_trace_store.finish(session, client_request.id)
+    except Exception as e:
+        print(f"[ERROR] No se pudo guardar el recorrido de {client_request.id}: {e}")
+        session.rollback()
+
+
+def iter_trace(session: Session, id_client_request: UUID, chunk_size: int = 500) -> Optional[Iterator[str]]:
+    """
+    Puntos del recorrido como líneas NDJSON ({"t", "lat", "lng"}), en bloques de
+    `chunk_size`. Para un viaje terminado devuelve los guardados en trip_trace; para
+    uno en curso, los crudos de trip_trace_chunk (escritos por cualquier worker) más
+    los pendientes de este worker. None si no hay recorrido.
+    """
+    row = session.get(TripTrace, id_client_request)
+    if row is not None:
+        points = unpack_trace(row.samples)
+    else:
+        chunks = session.query(TripTraceChunk.samples).filter(
+            TripTraceChunk.id_client_request == id_client_request
+        ).order_by(TripTraceChunk.id).all()
+        local = trip_trace_store.snapshot(id_client_request)
+        if not chunks and local is None:
+            return None
+        parts = [unpack_trace(samples) for (samples,) in chunks]
+        if local is not None:
+            parts.append(local)
+        points = _merge(parts)
+    ts, lats, lngs = points
+
+    def generate():
+        for start in range(0, len(ts), chunk_size):
+            end = start + chunk_size
+            yield "".join(
+                f'{{"t":{t:.3f},"lat":{lat:.6f},"lng":{lng:.6f}}}\n'
+                for t, lat, lng in zip(ts[start:end].tolist(), lats[start:end].tolist(), lngs[start:end].tolist())
+            )
+    return generate()
+
+
+def get_trip_trace_stream_service(session: Session, client_request_id: UUID, user_id: UUID) -> Iterator[str]:
+    """
+    Recorrido de una solicitud como NDJSON. Solo el cliente dueño o el conductor
+    asignado pueden verlo.
+    """
+    cr = session.get(ClientRequest, client_request_id)
+    if not cr:
+        raise HTTPException(
+            status_code=404, detail="Client Request no encontrada")
+    if cr.id_client != user_id and cr.id_driver_assigned != user_id:
+        raise HTTPException(
+            status_code=403,
+            detail="No tienes permiso para ver este recorrido. Solo el cliente o el conductor asignado pueden verlo."
+        )
+    stream = iter_trace(session, client_request_id)
+    if stream is None:
+        raise HTTPException(
+            status_code=404, detail="La solicitud no tiene recorrido registrado")
+    return stream
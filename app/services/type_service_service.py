@@ -2,6 +2,7 @@ from sqlmodel import Session, select
 from app.models.type_service import TypeService, TypeServiceCreate, AllowedRole
 from app.models.vehicle_type import VehicleType
 from fastapi import HTTPException
+from app.services.reference_data_service import reference_data
 from datetime import datetime
 
 
@@ -19,6 +20,7 @@ class TypeServiceService:
         self.session.add(db_type_service)
         self.session.commit()
         self.session.refresh(db_type_service)
+        reference_data.invalidate()
         return db_type_service
 
     def get_type_service(self, type_service_id: int) -> TypeService:
@@ -80,3 +82,4 @@ class TypeServiceService:
             self.session.add(moto_service)
 
         self.session.commit()
+        reference_data.invalidate()
@@ -5,6 +5,7 @@ from app.models.driver_documents import DocumentsUpdate, DriverDocuments, Driver
 from app.models.user import User
 from app.models.document_type import DocumentType
 from app.models.user_has_roles import UserHasRole, RoleStatus
+from app.services.role_cache_service import role_cache
 from fastapi import HTTPException, status
 from sqlalchemy import func
 from pydantic import BaseModel
@@ -149,6 +150,8 @@ class VerifyDocsService:
             self.db.add(user_role)
 
         self.db.commit()
+        for user_role in driver_users_result:
+            role_cache.invalidate(user_role.id_user)
         return {"message": "Estados de roles actualizados correctamente"}
     
 
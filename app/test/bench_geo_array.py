@@ -0,0 +1,51 @@
+"""
+Comparación de la conversión fila por fila (shapely + haversine en Python)
+contra geo_array para un conjunto de candidatos.
+
+    python -m app.test.bench_geo_array [n]
+"""
+import random
+import sys
+import time
+
+from geoalchemy2.shape import from_shape
+from shapely.geometry import Point
+
+from app.utils.geo import wkb_to_coords
+from app.utils.geo_array import haversine_array, points_from_wkb, top_k
+from app.utils.geo_index import haversine_m
+
+
+def per_row(elements, lat, lng, k):
+    rows = []
+    for element in elements:
+        coords = wkb_to_coords(element)
+        rows.append(haversine_m(lat, lng, coords["lat"], coords["lng"]))
+    return sorted(range(len(rows)), key=rows.__getitem__)[:k]
+
+
+def vectorized(elements, lat, lng, k):
+    lats, lngs = points_from_wkb(elements)
+    return top_k(haversine_array(lat, lng, lats, lngs), k).tolist()
+
+
+def bench(fn, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(1)
+    elements = [
+        from_shape(Point(-74.2 + rng.random() * 0.3, 4.5 + rng.random() * 0.3), srid=4326)
+        for _ in range(n)
+    ]
+    assert per_row(elements, 4.65, -74.05, 20) == vectorized(elements, 4.65, -74.05, 20)
+    slow = bench(per_row, elements, 4.65, -74.05, 20)
+    fast = bench(vectorized, elements, 4.65, -74.05, 20)
+    print(f"{n} candidatos: por fila {slow * 1000:.1f} ms, vectorizado {fast * 1000:.1f} ms ({slow / fast:.0f}x)")
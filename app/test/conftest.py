@@ -1,10 +1,12 @@
 from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool, StaticPool
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.main import app
-from app.core.db import get_session
+from app.core.db import get_async_session, get_session
 
 sqlite_name = "db.test.sqlite3"
 sqlite_url = f"sqlite:///{sqlite_name}"
@@ -15,6 +17,10 @@ engine = create_engine(
     poolclass=StaticPool
 )
 
+# El mismo archivo por el driver asíncrono, para los handlers con AsyncSessionDep.
+# NullPool: TestClient puede usar otro event loop en cada petición.
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{sqlite_name}", poolclass=NullPool)
+
 
 @pytest.fixture(name="session")
 def session_fixture():
@@ -29,6 +35,12 @@ def client_fixture(session: Session):
     def get_session_override():
         return session
     app.dependency_overrides[get_session] = get_session_override
+
+    async def get_async_session_override():
+        # Ve lo que la sesión de prueba ya confirmó (commit)
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+    app.dependency_overrides[get_async_session] = get_async_session_override
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Servidor compatible con Redis (protocolo RESP2) para pruebas locales, sin
+redis-server. Implementa lo que usan AsyncRedisManager y RedisCache:
+PING, SELECT/CLIENT/HELLO (se aceptan), SUBSCRIBE/UNSUBSCRIBE, PUBLISH,
+GET/MGET/SET/DEL. No persiste nada y no implementa expiración.
+"""
+import asyncio
+from typing import Dict, List, Optional, Set
+
+
+class RedisStandIn:
+
+    def __init__(self):
+        self.data: Dict[bytes, bytes] = {}
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self.published = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.port: Optional[int] = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    def subscribers(self, channel: str) -> int:
+        return len(self.channels.get(channel.encode(), ()))
+
+    async def start(self) -> "RedisStandIn":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        for writers in self.channels.values():
+            for writer in list(writers):
+                writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value: Optional[bytes]) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _array(self, *items: bytes) -> bytes:
+        return b"*%d\r\n" % len(items) + b"".join(items)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        subscribed: Set[bytes] = set()
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                command = args[0].upper()
+                if command == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif command in (b"SELECT", b"CLIENT", b"HELLO"):
+                    writer.write(b"+OK\r\n")
+                elif command == b"SUBSCRIBE":
+                    for channel in args[1:]:
+                        self.channels.setdefault(channel, set()).add(writer)
+                        subscribed.add(channel)
+                        writer.write(self._array(
+                            self._bulk(b"subscribe"), self._bulk(channel), b":%d\r\n" % len(subscribed)))
+                elif command == b"UNSUBSCRIBE":
+                    for channel in args[1:] or list(subscribed):
+                        self.channels.get(channel, set()).discard(writer)
+                        subscribed.discard(channel)
+                        writer.write(self._array(
+                            self._bulk(b"unsubscribe"), self._bulk(channel), b":%d\r\n" % len(subscribed)))
+                elif command == b"PUBLISH":
+                    channel, message = args[1], args[2]
+                    receivers = list(self.channels.get(channel, ()))
+                    for receiver in receivers:
+                        receiver.write(self._array(
+                            self._bulk(b"message"), self._bulk(channel), self._bulk(message)))
+                    self.published += 1
+                    writer.write(b":%d\r\n" % len(receivers))
+                elif command == b"GET":
+                    writer.write(self._bulk(self.data.get(args[1])))
+                elif command == b"MGET":
+                    writer.write(self._array(*(self._bulk(self.data.get(key)) for key in args[1:])))
+                elif command == b"SET":
+                    self.data[args[1]] = args[2]
+                    writer.write(b"+OK\r\n")
+                elif command == b"DEL":
+                    removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+                    writer.write(b":%d\r\n" % removed)
+                else:
+                    writer.write(b"-ERR unknown command '%s'\r\n" % args[0])
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from app.core import security
+from app.core.config import settings
+from app.core.dependencies.auth import get_current_user
+from app.core.middleware.auth import JWTAuthMiddleware
+
+
+def _token(minutes=10, **claims):
+    claims["exp"] = datetime.utcnow() + timedelta(minutes=minutes)
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def _client():
+    app = FastAPI()
+    app.add_middleware(JWTAuthMiddleware)
+
+    @app.get("/me")
+    def me(request: Request, payload=Depends(get_current_user)):
+        return {"user_id": str(request.state.user_id), "sub": payload["sub"]}
+
+    @app.get("/users/")
+    def public():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_token_is_decoded_once_and_claims_reach_dependencies(monkeypatch):
+    decodes = []
+    real_decode = security.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decodes.append(1)
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(security.jwt, "decode", counting_decode)
+    security.verified_tokens.clear()
+    client = _client()
+    user_id = str(uuid4())
+    headers = {"Authorization": f"Bearer {_token(sub=user_id)}"}
+
+    for _ in range(3):
+        response = client.get("/me", headers=headers)
+        assert response.json() == {"user_id": user_id, "sub": user_id}
+    assert len(decodes) == 1
+
+    assert client.get("/users/").status_code == 200
+    assert client.get("/me").status_code == 401
+    assert client.get("/me", headers={"Authorization": "Bearer basura"}).status_code == 401
+    expired = {"Authorization": f"Bearer {_token(minutes=-1, sub=user_id)}"}
+    assert client.get("/me", headers=expired).status_code == 401
@@ -0,0 +1,34 @@
+import asyncio
+from uuid import uuid4
+
+from app.services import dispatch_service
+
+
+def test_dispatch_widens_radius_until_request_is_taken(monkeypatch):
+    near, far = uuid4(), uuid4()
+    calls = []
+    emitted = []
+
+    def fake_select(id_client_request, radius_m, k, exclude):
+        calls.append((radius_m, set(exclude)))
+        if len(calls) == 3:
+            return None  # ya recibió una oferta
+        drivers = [(near, 1500.0, 1), (far, 3500.0, 1)]
+        return [d for d in drivers if d[1] <= radius_m and d[0] not in exclude][:k]
+
+    async def fake_emit(user_id, event, data):
+        emitted.append((user_id, event, data["wave"]))
+
+    monkeypatch.setattr(dispatch_service, "_select_in_thread", fake_select)
+    monkeypatch.setattr(dispatch_service, "emit_to_user", fake_emit)
+
+    notified = asyncio.run(dispatch_service.dispatch_client_request(
+        uuid4(), radii_m=[2000, 4000, 7000, 10000], k=5, wave_seconds=0))
+
+    assert emitted == [
+        (near, "created_client_request", 1),
+        (far, "created_client_request", 2),
+    ]
+    assert calls[1] == (4000, {near})
+    assert len(calls) == 3
+    assert notified == {near, far}
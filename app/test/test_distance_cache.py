@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import httpx
+
+from app.core.cache import RedisCache, TTLCache, get_redis
+from app.services import distance_matrix_service
+from app.services.distance_matrix_service import DistanceMatrixClient, get_distance_matrix, get_distance_matrix_async
+from app.test.redis_standin import RedisStandIn
+
+
+def google_handler(calls):
+    """Transporte falso que responde como Google con 1 km / 2 min por elemento."""
+    def handler(request):
+        params = dict(request.url.params)
+        calls.append(params)
+        origins = params["origins"].split("|")
+        destinations = params["destinations"].split("|")
+        return httpx.Response(200, json={
+            "status": "OK",
+            "origin_addresses": [f"o{o}" for o in origins],
+            "destination_addresses": [f"d{d}" for d in destinations],
+            "rows": [
+                {"elements": [{"status": "OK", "distance": {"value": 1000}, "duration": {"value": 120}}
+                              for _ in destinations]}
+                for _ in origins
+            ]
+        })
+    return handler
+
+
+def test_ttl_cache_lru_and_expiration():
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" pasa a ser el más reciente
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.evictions == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_distance_matrix_reuses_snapped_pairs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(distance_matrix_service, "distance_cache", TTLCache(maxsize=100, ttl=60))
+    monkeypatch.setattr(distance_matrix_service, "distance_matrix_client",
+                        DistanceMatrixClient(transport=httpx.MockTransport(google_handler(calls))))
+
+    first = get_distance_matrix([(4.70001, -74.07001)], [(4.71, -74.08)])
+    # Mismo par desplazado unos metros dentro de la misma celda: sale de la caché
+    second = get_distance_matrix([(4.70002, -74.07002)], [(4.71, -74.08)])
+    # Un destino nuevo: solo se consulta ese destino
+    third = get_distance_matrix([(4.70001, -74.07001)], [(4.71, -74.08), (4.75, -74.05)])
+
+    assert len(calls) == 2
+    assert calls[1]["destinations"] == "4.75,-74.05"
+    assert second["rows"] == first["rows"]
+    assert len(third["rows"][0]["elements"]) == 2
+    assert third["origin_addresses"] == first["origin_addresses"]
+
+
+def test_redis_cache_is_read_and_written_in_batches_off_the_loop(monkeypatch):
+    calls = []
+    monkeypatch.setattr(distance_matrix_service, "distance_matrix_client",
+                        DistanceMatrixClient(transport=httpx.MockTransport(google_handler(calls))))
+    origins = [(4.70001, -74.07001), (4.72, -74.06)]
+    destinations = [(4.71, -74.08), (4.75, -74.05)]
+
+    async def run():
+        # El Redis de prueba corre en este mismo event loop: una llamada síncrona
+        # hecha desde el loop no recibiría respuesta hasta vencer su timeout
+        redis = await RedisStandIn().start()
+        cache = RedisCache(get_redis(redis.url), "distance_matrix", ttl=60)
+        monkeypatch.setattr(distance_matrix_service, "distance_cache", cache)
+        try:
+            first = await get_distance_matrix_async(origins, destinations)
+            second = await get_distance_matrix_async(origins, destinations)
+        finally:
+            await distance_matrix_service.distance_matrix_client.aclose()
+            await redis.stop()
+        return first, second, cache, redis
+
+    started = time.monotonic()
+    first, second, cache, redis = asyncio.run(run())
+
+    assert time.monotonic() - started < 1
+    assert len(calls) == 1 and second == first
+    assert len(redis.data) == 4
+    assert cache.errors == 0 and cache.stats()["hits"] == 4
+
+
+def test_client_chunks_large_matrices_and_coalesces_inflight():
+    calls = []
+    client = DistanceMatrixClient(transport=httpx.MockTransport(google_handler(calls)))
+    origins = [(4.6 + i * 0.001, -74.1) for i in range(30)]
+    destination = [(4.7, -74.05)]
+
+    async def run():
+        try:
+            return await asyncio.gather(client.fetch(origins, destination), client.fetch(origins, destination))
+        finally:
+            await client.aclose()
+
+    first, second = asyncio.run(run())
+
+    # 30 orígenes x 1 destino -> bloques de 25 + 5; la segunda petición idéntica no sale a Google
+    assert len(calls) == 2
+    assert client.coalesced_calls == 2
+    assert len(first["rows"]) == 30
+    assert first == second
+    assert first["origin_addresses"][29] == "o4.629,-74.1"
@@ -0,0 +1,210 @@
+from datetime import date, datetime
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+from geoalchemy2 import Geometry
+from sqlalchemy import Column, LargeBinary, MetaData, Table, create_engine, event
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session
+
+from app.models.bank import Bank
+from app.models.client_request import ClientRequest, StatusEnum
+from app.models.config_service_value import ConfigServiceValue
+from app.models.driver_info import DriverInfo
+from app.models.driver_position import DriverPosition
+from app.models.driver_trip_offer import DriverTripOffer
+from app.models.payment_method import PaymentMethod
+from app.models.rating_aggregate import RatingAggregate
+from app.models.type_service import TypeService
+from app.models.user import User
+from app.models.user_has_roles import UserHasRole, RoleStatus
+from app.models.vehicle_info import VehicleInfo
+from app.models.vehicle_type import VehicleType
+from app.core.config import settings
+from app.services import client_requests_service
+from app.services.driver_position_service import driver_position_index
+from app.services.driver_trip_offer_service import DriverTripOfferService, offers_cache
+from app.services.rating_service import apply_rating
+from app.services.reference_data_service import reference_data
+
+MODELS = [User, UserHasRole, DriverInfo, VehicleInfo, PaymentMethod, TypeService,
+          ClientRequest, DriverTripOffer, DriverPosition, RatingAggregate,
+          VehicleType, ConfigServiceValue, Bank]
+
+
+def _plain_table(model, metadata):
+    # SQLite sin spatialite: las columnas de geometría se guardan como blobs y sin llaves foráneas
+    columns = [
+        Column(c.name, LargeBinary if isinstance(c.type, Geometry) else c.type,
+               primary_key=c.primary_key)
+        for c in model.__mapper__.columns
+    ]
+    return Table(model.__tablename__, metadata, *columns)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def register_spatial_functions(dbapi_connection, _):
+        dbapi_connection.create_function("AsEWKB", 1, lambda value: value)
+        dbapi_connection.create_function("GeomFromEWKT", 1, lambda value: None)
+
+    metadata = MetaData()
+    for model in MODELS:
+        _plain_table(model, metadata)
+    metadata.create_all(engine)
+    return engine
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def _count_queries(engine, fn):
+    counter = QueryCounter(engine)
+    with Session(engine) as session:
+        fn(session)
+    event.remove(engine, "before_cursor_execute", counter._on_execute)
+    return counter.count
+
+
+def _seed(engine, n):
+    """Una solicitud con `n` ofertas de conductores distintos y `n` solicitudes PAID del cliente."""
+    with Session(engine) as session:
+        session.add(PaymentMethod(id=1, name="cash"))
+        session.add(PaymentMethod(id=2, name="nequi"))
+        session.add(TypeService(id=1, name="Car", vehicle_type_id=1))
+        client = User(full_name="Cliente", country_code="+57", phone_number="3000000000", is_active=True)
+        session.add(client)
+        session.flush()
+        request = ClientRequest(id_client=client.id, type_service_id=1,
+                                payment_method_id=1, status=StatusEnum.CREATED)
+        session.add(request)
+        drivers = []
+        for i in range(n):
+            driver = User(full_name=f"Conductor {i}", country_code="+57",
+                          phone_number=f"31000000{i:02d}", is_active=True)
+            session.add(driver)
+            session.flush()
+            session.add(UserHasRole(id_user=driver.id, id_rol="DRIVER", status=RoleStatus.APPROVED))
+            info = DriverInfo(user_id=driver.id, first_name="C", last_name=str(i),
+                              birth_date=date(1990, 1, 1))
+            session.add(info)
+            session.flush()
+            session.add(VehicleInfo(driver_info_id=info.id, brand="Kia", model="Picanto",
+                                    model_year=2020, color="Rojo", plate=f"ABC{i:03d}", vehicle_type_id=1))
+            session.add(DriverTripOffer(id_driver=driver.id, id_client_request=request.id,
+                                        fare_offer=10000, time=5, distance=2))
+            session.add(ClientRequest(id_client=client.id, type_service_id=1,
+                                      payment_method_id=1 + i % 2, status=StatusEnum.PAID))
+            apply_rating(session, "driver", driver.id, 4 + i % 2)
+            drivers.append(driver.id)
+        session.commit()
+        return client.id, request.id, drivers
+
+
+def _seed_open_requests(engine, n):
+    """`n` solicitudes CREATED de clientes distintos, cada uno con su calificación de pasajero."""
+    with Session(engine) as session:
+        requests = []
+        for i in range(n):
+            client = User(full_name=f"Pasajero {i}", country_code="+57",
+                          phone_number=f"32000000{i:02d}", is_active=True)
+            session.add(client)
+            session.flush()
+            request = ClientRequest(id_client=client.id, type_service_id=1,
+                                    payment_method_id=1, status=StatusEnum.CREATED)
+            session.add(request)
+            session.flush()
+            apply_rating(session, "passenger", client.id, 3 + i % 3)
+            requests.append(request.id)
+        session.commit()
+        return requests
+
+
+@pytest.mark.parametrize("n", [1, 8])
+def test_list_services_have_constant_query_count(engine, monkeypatch, n):
+    client_id, request_id, drivers = _seed(engine, n)
+    open_requests = _seed_open_requests(engine, n)
+    monkeypatch.setattr(client_requests_service.eta_estimator, "ensure_calibrated", lambda session: None)
+    monkeypatch.setattr(client_requests_service, "get_distance_matrix", lambda *args, **kwargs: {"rows": []})
+    monkeypatch.setattr(client_requests_service, "find_nearby_driver_positions",
+                        lambda session, lat, lng, radius: [(d, 4.7, -74.0, 100.0 * i) for i, d in enumerate(drivers)])
+    monkeypatch.setattr(client_requests_service, "find_nearby_open_requests",
+                        lambda session, lat, lng, radius, type_service_ids: {
+                            r: 100.0 * i for i, r in enumerate([request_id] + open_requests)})
+
+    with Session(engine) as session:
+        reference_data.load(session)
+
+    nearby = []
+    counts = {
+        "offers": _count_queries(engine, lambda session: DriverTripOfferService(
+            session).get_offers_by_client_request(request_id, client_id, "CLIENT")),
+        "by_status": _count_queries(engine, lambda session: client_requests_service.get_client_requests_by_status_service(
+            session, "PAID", client_id)),
+        "nearby_drivers": _count_queries(engine, lambda session: client_requests_service.get_nearby_drivers_service(
+            4.7, -74.0, 1, session, None)),
+        "nearby_requests": _count_queries(engine, lambda session: nearby.extend(
+            client_requests_service.get_nearby_client_requests_service(4.7, -74.0, session, None))),
+    }
+
+    # Mismas consultas con 1 u 8 filas: ninguna consulta depende de la cantidad de resultados
+    assert counts == {"offers": 2, "by_status": 1, "nearby_drivers": 2, "nearby_requests": 2}
+    # La solicitud de _seed más las n sembradas, cada una con la calificación de su cliente
+    assert len(nearby) == n + 1
+    assert all(r["client"]["average_rating"] is not None for r in nearby[1:])
+
+
+def test_offers_are_cached_until_a_new_offer_arrives(engine):
+    client_id, request_id, drivers = _seed(engine, 2)
+
+    def list_offers(session):
+        return DriverTripOfferService(session).get_offers_by_client_request(request_id, client_id, "CLIENT")
+
+    assert _count_queries(engine, list_offers) == 2
+    assert _count_queries(engine, list_offers) == 0
+
+    # Otro cliente no puede verlas, aunque estén en caché
+    with Session(engine) as session:
+        with pytest.raises(HTTPException) as exc:
+            DriverTripOfferService(session).get_offers_by_client_request(request_id, uuid4(), "CLIENT")
+    assert exc.value.status_code == 403
+
+    with Session(engine) as session:
+        own = DriverTripOfferService(session).get_offers_by_client_request(request_id, drivers[1], "DRIVER")
+        assert [offer.user.id for offer in own] == [drivers[1]]
+        DriverTripOfferService(session).create_offer({
+            "id_driver": drivers[0], "id_client_request": request_id,
+            "fare_offer": 9000, "time": 4, "distance": 1.5})
+    assert offers_cache.get(str(request_id)) is None
+
+    with Session(engine) as session:
+        assert len(list_offers(session)) == 3
+
+
+def test_offers_are_ranked_by_driver_distance_to_pickup(engine, monkeypatch):
+    far, near, unknown = uuid4(), uuid4(), uuid4()
+    monkeypatch.setattr(settings, "GEO_INDEX_ENABLED", True)
+    # Recogida en (4.70, -74.07); conductores a ~2.2 km y ~110 m, el tercero sin posición
+    driver_position_index.load([(far, 4.72, -74.07, {}), (near, 4.701, -74.07, {})])
+    offers = [SimpleNamespace(user=SimpleNamespace(id=i)) for i in (far, unknown, near)]
+    offers.append(SimpleNamespace(user=None))
+
+    try:
+        with Session(engine) as session:
+            ranked = DriverTripOfferService(session)._rank_by_pickup_distance(offers, [4.70, -74.07])
+    finally:
+        driver_position_index.clear()
+
+    assert [offer.user.id if offer.user else None for offer in ranked] == [near, far, unknown, None]
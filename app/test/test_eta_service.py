@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from app.services.eta_service import EtaEstimator
+
+CAR = 1
+MONDAY_8AM = datetime(2025, 6, 2, 8, 0)
+MONDAY_3AM = datetime(2025, 6, 2, 3, 0)
+
+
+def test_uses_defaults_without_data():
+    estimator = EtaEstimator()
+    estimator.fit([])
+
+    road_m, seconds = estimator.estimate([1000.0], CAR, MONDAY_8AM)
+
+    assert road_m[0] == 1300.0  # ETA_DEFAULT_DETOUR
+    assert round(seconds[0]) == round(1300.0 / (22.0 / 3.6))  # ETA_DEFAULT_SPEED_KMH
+
+
+def test_learns_detour_and_hourly_speed():
+    # Hora pico a 15 km/h y madrugada a 40 km/h, siempre con desvío 1.4
+    rows = []
+    for _ in range(10):
+        rows.append((CAR, 5000.0, 7000.0, 7.0 / 15 * 3600, MONDAY_8AM))
+        rows.append((CAR, 5000.0, 7000.0, 7.0 / 40 * 3600, MONDAY_3AM))
+    estimator = EtaEstimator()
+    estimator.fit(rows)
+
+    road_m, peak = estimator.estimate([2000.0], CAR, MONDAY_8AM)
+    _, night = estimator.estimate([2000.0], CAR, MONDAY_3AM)
+    element = estimator.estimate_elements([2000.0], CAR, MONDAY_8AM)[0]
+
+    assert abs(road_m[0] - 2800.0) < 1e-6
+    assert abs(peak[0] - 2.8 / 15 * 3600) < 1e-6
+    assert abs(night[0] - 2.8 / 40 * 3600) < 1e-6
+    assert element["source"] == "estimate"
+    assert element["distance"]["value"] == 2800
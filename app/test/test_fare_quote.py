@@ -0,0 +1,118 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.config_service_value import ConfigServiceValue
+from app.models.type_service import AllowedRole, TypeService
+from app.services import config_service_value_service, fare_quote_service
+from app.services.config_service_value_service import ConfigServiceValueService
+from app.services.fare_quote_service import (compute_fares, create_fare_quote, fare_cache, get_quoted_fare,
+                                             resolve_quoted_fare)
+from app.services.reference_data_service import ReferenceData
+
+ORIGIN = (4.718136, -74.073170)
+DESTINATION = (4.702468, -74.109776)
+
+
+class StaticReferenceData:
+    def __init__(self, data):
+        self.data = data
+
+    def get(self, session=None):
+        return self.data
+
+
+def _reference_data():
+    return ReferenceData(
+        version=0, loaded_at=0.0, fingerprint=(), vehicle_types={}, payment_methods={}, banks={},
+        type_services={
+            1: TypeService(id=1, name="Car_Ride", vehicle_type_id=1, allowed_role=AllowedRole.DRIVER),
+            2: TypeService(id=2, name="Motorcycle_Ride", vehicle_type_id=2, allowed_role=AllowedRole.DRIVER),
+        },
+        config_values={
+            1: ConfigServiceValue(km_value=1200, min_value=150, tarifa_value=6000, weight_value=0, service_type_id=1),
+            2: ConfigServiceValue(km_value=800, min_value=100, tarifa_value=None, weight_value=0, service_type_id=2),
+        },
+    )
+
+
+def test_compute_fares_applies_minimum_per_service():
+    configs = list(_reference_data().config_values.values())
+
+    # 2 km / 5 min: el carro queda en su mínimo, la moto no tiene mínimo
+    assert compute_fares(2000, 300, configs).tolist() == [6000.0, 2100.0]
+    assert compute_fares(10000, 1200, configs).tolist() == [15000.0, 10000.0]
+
+
+def _fake_matrix(lookups):
+    async def fake_matrix(origins, destinations, mode="driving"):
+        lookups.append((origins, destinations))
+        return {
+            "status": "OK", "origin_addresses": ["Suba"], "destination_addresses": ["Engativá"],
+            "rows": [{"elements": [{"status": "OK", "distance": {"text": "5.2 km", "value": 5200},
+                                    "duration": {"text": "18 mins", "value": 1080}}]}]
+        }
+    return fake_matrix
+
+
+def test_quote_uses_one_route_lookup_and_is_reusable_on_create(monkeypatch):
+    lookups = []
+    fake_matrix = _fake_matrix(lookups)
+    monkeypatch.setattr(fare_quote_service, "get_distance_matrix_async", fake_matrix)
+    monkeypatch.setattr(fare_quote_service, "reference_data", StaticReferenceData(_reference_data()))
+    user_id = uuid4()
+
+    quote = asyncio.run(create_fare_quote(None, user_id, ORIGIN, DESTINATION))
+
+    assert len(lookups) == 1
+    assert [(f["type_service_id"], f["recommended_value"]) for f in quote["fares"]] == [(1, 8940.0), (2, 5960.0)]
+    # Unos metros de diferencia en la recogida siguen siendo el mismo recorrido
+    nearby_origin = (ORIGIN[0] + 0.0003, ORIGIN[1])
+    assert get_quoted_fare(quote["quote_id"], user_id, 2, nearby_origin, DESTINATION) == 5960.0
+
+    assert get_quoted_fare(quote["quote_id"], uuid4(), 2, ORIGIN, DESTINATION) is None
+    with pytest.raises(HTTPException):
+        get_quoted_fare(quote["quote_id"], user_id, 2, (4.60, -74.08), DESTINATION)
+
+
+def test_quote_from_another_worker_is_recomputed_instead_of_rejected(monkeypatch):
+    lookups = []
+    monkeypatch.setattr(fare_quote_service, "get_distance_matrix_async", _fake_matrix(lookups))
+    monkeypatch.setattr(fare_quote_service, "reference_data", StaticReferenceData(_reference_data()))
+    fare_cache.clear()
+
+    def resolve(fare_offered=None):
+        # La cotización se emitió en otro worker: este quote_cache no la tiene
+        return asyncio.run(resolve_quoted_fare(
+            None, "cotizacion-de-otro-worker", uuid4(), 1, ORIGIN, DESTINATION, fare_offered=fare_offered))
+
+    assert resolve(fare_offered=9000) is None and lookups == []
+    # Misma tarifa que habría dado la cotización, y el recorrido queda en fare_cache
+    assert resolve() == 8940.0
+    assert resolve() == 8940.0
+    assert len(lookups) == 1
+
+
+def test_fare_is_cached_per_cell_pair_until_tariffs_change(monkeypatch):
+    lookups = []
+    refs = StaticReferenceData(_reference_data())
+    monkeypatch.setattr(config_service_value_service, "get_distance_matrix_async", _fake_matrix(lookups))
+    monkeypatch.setattr(config_service_value_service, "reference_data", refs)
+    fare_cache.clear()
+    service = ConfigServiceValueService(None)
+
+    def fare(origin):
+        return asyncio.run(service.get_fare(1, *origin, *DESTINATION)).recommended_value
+
+    assert fare(ORIGIN) == 8940.0
+    # Otro pasajero a unos metros, en la misma celda: no se vuelve a consultar la ruta
+    assert fare((ORIGIN[0] + 0.0003, ORIGIN[1])) == 8940.0
+    assert len(lookups) == 1
+
+    # Con tarifas nuevas la clave cambia y el valor viejo no se sirve
+    refs.data = _reference_data()
+    refs.data.config_values[1].km_value = 1500
+    assert fare(ORIGIN) == 10500.0
+    assert len(lookups) == 2
@@ -0,0 +1,43 @@
+import random
+
+import numpy as np
+from geoalchemy2.shape import from_shape
+from shapely.geometry import Point
+
+from app.utils.geo import wkb_to_coords
+from app.utils.geo_array import CoordArray, bearing_array, coords_from_wkb, haversine_array, top_k
+from app.utils.geo_index import haversine_m
+
+
+def test_haversine_array_matches_scalar():
+    rng = random.Random(3)
+    points = [(4.5 + rng.random(), -74.5 + rng.random()) for _ in range(500)]
+    lats = np.array([p[0] for p in points])
+    lngs = np.array([p[1] for p in points])
+
+    distances = haversine_array(4.7, -74.1, lats, lngs)
+
+    expected = [haversine_m(4.7, -74.1, lat, lng) for lat, lng in points]
+    assert np.allclose(distances, expected, rtol=0, atol=1e-6)
+
+
+def test_bearing_array_cardinal_directions():
+    bearings = bearing_array(0.0, 0.0, np.array([1.0, 0.0, -1.0, 0.0]), np.array([0.0, 1.0, 0.0, -1.0]))
+    assert np.allclose(bearings, [0.0, 90.0, 180.0, 270.0])
+
+
+def test_nearest_uses_radius_and_top_k():
+    coords = CoordArray(["a", "b", "c", "d"], [4.700, 4.710, 4.720, 5.500], [-74.07] * 4)
+
+    positions, distances = coords.nearest(4.700, -74.07, radius_m=5000, k=2)
+
+    assert [coords.keys[i] for i in positions] == ["a", "b"]
+    assert distances[0] < distances[1]
+    assert list(top_k(np.array([3.0, np.nan, 1.0]))) == [2, 0, 1]
+
+
+def test_coords_from_wkb_matches_shapely():
+    elements = [from_shape(Point(-74.07 + i * 0.001, 4.7 - i * 0.001), srid=4326) for i in range(20)]
+    elements.append(None)
+
+    assert coords_from_wkb(elements) == [wkb_to_coords(e) for e in elements]
@@ -0,0 +1,104 @@
+import random
+import time
+
+from app.utils.geo_index import GridIndex, PartitionedGridIndex, haversine_m
+
+
+def test_haversine_known_distance():
+    # Bogotá (Plaza de Bolívar) -> Aeropuerto El Dorado ~ 13.95 km
+    distance = haversine_m(4.598056, -74.075833, 4.701594, -74.146947)
+    assert 13900 < distance < 14000
+
+
+def test_nearby_returns_sorted_matches_within_radius():
+    index = GridIndex(cell_deg=0.01)
+    index.upsert("near", 4.7090, -74.0765)
+    index.upsert("mid", 4.7200, -74.0800)
+    index.upsert("far", 4.9000, -74.3000)
+
+    results = index.nearby(4.708822, -74.076542, 5000)
+
+    assert [entry.key for entry, _ in results] == ["near", "mid"]
+    assert results[0][1] < results[1][1] <= 5000
+
+
+def test_upsert_moves_entry_between_cells_and_remove():
+    index = GridIndex(cell_deg=0.01)
+    index.upsert("driver", 4.70, -74.07)
+    index.upsert("driver", 6.25, -75.56)  # Medellín
+
+    assert index.nearby(4.70, -74.07, 2000) == []
+    assert [e.key for e, _ in index.nearby(6.25, -75.56, 2000)] == ["driver"]
+
+    index.remove("driver")
+    assert len(index) == 0
+    assert index.nearby(6.25, -75.56, 2000) == []
+
+
+def test_load_keeps_entries_newer_than_snapshot():
+    index = GridIndex(cell_deg=0.01)
+    started_at = time.time()
+    index.upsert("moved", 4.80, -74.10)
+
+    index.load([("moved", 4.70, -74.07, {}), ("other", 4.71, -74.08, {})],
+               started_at=started_at)
+
+    assert index.get("moved").lat == 4.80
+    assert "other" in index
+    assert not index.needs_reload(60)
+
+
+def test_nearby_matches_brute_force():
+    rng = random.Random(7)
+    index = GridIndex(cell_deg=0.01)
+    points = {}
+    for i in range(5000):
+        lat = 4.6 + rng.random() * 0.2
+        lng = -74.2 + rng.random() * 0.2
+        points[i] = (lat, lng)
+        index.upsert(i, lat, lng)
+
+    expected = sorted(
+        key for key, (lat, lng) in points.items()
+        if haversine_m(4.7, -74.1, lat, lng) <= 3000
+    )
+    assert sorted(e.key for e, _ in index.nearby(4.7, -74.1, 3000)) == expected
+
+
+def test_partitioned_index_filters_by_partition():
+    index = PartitionedGridIndex(cell_deg=0.01)
+    index.upsert(1, "car", 4.7090, -74.0765)
+    index.upsert(2, "moto", 4.7091, -74.0766)
+
+    assert [e.key for e, _ in index.nearby(4.709, -74.0765, 1000, partitions=[1])] == ["car"]
+    assert len(index.nearby(4.709, -74.0765, 1000)) == 2
+
+    index.upsert(2, "car", 4.7090, -74.0765)  # cambia de partición
+    assert [e.key for e, _ in index.nearby(4.709, -74.0765, 1000, partitions=[1])] == []
+    index.remove("moto")
+    assert len(index) == 1
+
+
+def test_load_does_not_restore_entries_removed_during_snapshot():
+    index = GridIndex(cell_deg=0.01)
+    index.upsert("closed", 4.70, -74.07)
+    started_at = time.time()
+    index.remove("closed")
+
+    # La fila se leyó antes de la eliminación: la recarga no debe reponerla
+    index.load([("closed", 4.70, -74.07, {}), ("other", 4.71, -74.08, {})],
+               started_at=started_at)
+    assert "closed" not in index and "other" in index
+
+    requests = PartitionedGridIndex(cell_deg=0.01)
+    started_at = time.time()
+    requests.remove("taken")
+    requests.load([(1, "taken", 4.70, -74.07, {}), (1, "open", 4.71, -74.08, {})],
+                  started_at=started_at)
+    assert "taken" not in requests and "open" in requests
+
+    # Una eliminación anterior a la lectura ya no cuenta: la fila vuelve a ser válida
+    requests.upsert(1, "taken", 4.70, -74.07)
+    requests.remove("taken")
+    requests.load([(1, "taken", 4.70, -74.07, {})], started_at=time.time() + 1)
+    assert "taken" in requests
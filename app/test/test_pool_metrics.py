@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.core.pool_metrics import InstrumentedQueuePool, pool_stats
+
+
+def test_pool_stats_report_checkouts_waits_and_timeouts(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        stats = pool_stats(engine)
+        assert (stats["checked_out"], stats["checkouts"]) == (1, 1)
+
+        # Pool agotado: el segundo checkout espera pool_timeout y falla
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+
+    stats = pool_stats(engine)
+    assert stats["checked_out"] == 0
+    assert stats["timeouts"] == 1
+    assert stats["wait_max_ms"] >= 50
+    assert stats["checkout_latency_ms"]["+Inf"] == 2
+
+    # dispose() recrea el pool sin perder lo acumulado
+    engine.dispose()
+    assert pool_stats(engine)["checkouts"] == 1
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+from app.services import position_ingest_service
+from app.services.position_ingest_service import PositionIngestor
+
+
+class FakeSession:
+    executed = []
+
+    def __init__(self, engine):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, stmt):
+        FakeSession.executed.append(stmt)
+
+    def commit(self):
+        pass
+
+
+def test_flush_writes_only_latest_position_in_one_statement(monkeypatch):
+    statements = []
+    monkeypatch.setattr(position_ingest_service, "Session", FakeSession)
+    monkeypatch.setattr(position_ingest_service, "_upsert_statement",
+                        lambda dialect_name, rows: statements.append((dialect_name, rows)) or "UPSERT")
+    FakeSession.executed = []
+    ingestor = PositionIngestor()
+    driver_a, driver_b = uuid4(), uuid4()
+
+    ingestor.submit(driver_a, 4.70, -74.07, verified=True)
+    ingestor.submit(driver_a, 4.71, -74.08, verified=True)
+    ingestor.submit(driver_b, 4.60, -74.10, verified=True)
+
+    assert ingestor.latest(driver_a)[:2] == (4.71, -74.08)
+    written = ingestor.flush(SimpleNamespace(dialect=SimpleNamespace(name="mysql")))
+
+    assert written == 2
+    assert FakeSession.executed == ["UPSERT"]
+    dialect_name, rows = statements[0]
+    assert dialect_name == "mysql"
+    assert sorted(row["id_driver"] for row in rows) == sorted([driver_a, driver_b])
+    assert ingestor.pending() == 0
+    # Sin cambios nuevos no se vuelve a escribir
+    assert ingestor.flush(SimpleNamespace(dialect=SimpleNamespace(name="mysql"))) == 0
+    position_ingest_service.driver_position_index.remove(driver_a)
+    position_ingest_service.driver_position_index.remove(driver_b)
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *args):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+def test_unverified_ids_are_indexed_only_after_approval(monkeypatch):
+    approved, intruder = uuid4(), uuid4()
+
+    class ApprovalSession(FakeSession):
+        def query(self, *columns):
+            return FakeQuery([(approved,)])
+
+    monkeypatch.setattr(position_ingest_service, "Session", ApprovalSession)
+    monkeypatch.setattr(position_ingest_service, "_upsert_statement",
+                        lambda dialect_name, rows: rows)
+    index = position_ingest_service.driver_position_index
+    presence = position_ingest_service.driver_presence
+    ingestor = PositionIngestor()
+
+    # Llegan por socket sin validar: no entran al índice ni a la presencia todavía
+    ingestor.submit(approved, 4.70, -74.07)
+    ingestor.submit(intruder, 4.70, -74.07)
+    assert approved not in index and intruder not in index
+    assert not presence.is_online(intruder)
+
+    assert ingestor.flush(SimpleNamespace(dialect=SimpleNamespace(name="sqlite"))) == 1
+    assert approved in index and presence.is_online(approved)
+    assert intruder not in index and ingestor.latest(intruder) is None
+
+    # Ya validado: las siguientes posiciones se indexan al instante
+    ingestor.submit(approved, 4.71, -74.08)
+    assert index.get(approved).lat == 4.71
+    index.remove(approved)
+    presence.remove(approved)
@@ -0,0 +1,53 @@
+from uuid import uuid4
+
+from app.services.driver_position_service import driver_position_index
+from app.services.presence_service import DriverPresence
+
+
+def test_heartbeats_keep_counts_and_expired_drivers_are_evicted():
+    presence = DriverPresence(ttl_seconds=60, cell_deg=0.01)
+    moto, car, idle = uuid4(), uuid4(), uuid4()
+    for id_driver in (moto, car, idle):
+        driver_position_index.upsert(id_driver, 4.7101, -74.0721, updated_at=1000)
+
+    presence.heartbeat(moto, 4.7101, -74.0721, vehicle_type_id=1, now=1000)
+    presence.heartbeat(car, 4.7102, -74.0722, vehicle_type_id=2, now=1000)
+    presence.heartbeat(idle, 4.7103, -74.0723, vehicle_type_id=1, now=1000)
+    assert presence.online_in_cell(4.7105, -74.0725) == 3
+    assert presence.online_in_cell(4.7105, -74.0725, vehicle_type_id=1) == 2
+    assert presence.online_count(2) == 1
+
+    # El conductor en moto se mueve a otra celda y sigue enviando heartbeats
+    presence.heartbeat(moto, 4.7301, -74.0721, now=1030)
+    presence.heartbeat(car, now=1050)
+    assert presence.online_in_cell(4.7105, -74.0725, vehicle_type_id=1) == 1
+    assert presence.online_in_cell(4.7301, -74.0721, vehicle_type_id=1) == 1
+
+    assert presence.sweep(now=1070) == [idle]
+    assert idle not in driver_position_index and moto in driver_position_index
+    assert not presence.is_online(idle, now=1070)
+    assert presence.online_count() == 2 and presence.online_count(1) == 1
+    assert presence.online_in_cell(4.7105, -74.0725) == 1
+
+    assert presence.sweep(now=1120) == [moto, car]
+    assert presence.stats()["online"] == 0 and presence.stats()["cells"] == 0
+    assert presence.stats()["evicted"] == 3
+
+
+def test_index_entries_expire_by_their_own_timestamp():
+    presence = DriverPresence(ttl_seconds=60, cell_deg=0.01)
+    here, elsewhere, reloaded = uuid4(), uuid4(), uuid4()
+    driver_position_index.upsert(here, 4.7101, -74.0721, updated_at=1000)
+    presence.heartbeat(here, 4.7101, -74.0721, now=1000)
+    presence.heartbeat(elsewhere, 4.7101, -74.0721, now=1000)
+    # Cargadas por una recarga con el updated_at de su fila: `elsewhere` siguió
+    # enviando posiciones a otro worker; `reloaded` nunca se vio en este
+    driver_position_index.upsert(elsewhere, 4.7102, -74.0722, updated_at=1050)
+    driver_position_index.upsert(reloaded, 4.7103, -74.0723, updated_at=1000)
+
+    assert presence.sweep(now=1070) == [here, elsewhere]
+    assert here not in driver_position_index and reloaded not in driver_position_index
+    assert elsewhere in driver_position_index
+
+    assert presence.sweep(now=1120) == []
+    assert elsewhere not in driver_position_index
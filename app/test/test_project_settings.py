@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session
+
+from app.core.cache import SharedVersion
+from app.core.config import settings
+from app.models.project_settings import ProjectSettings, ProjectSettingsUpdate
+from app.services import project_settings_service
+from app.services.earnings_service import get_config_percentages
+from app.services.project_settings_service import ProjectSettingsCache, update_project_settings_service
+
+
+def _engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine, tables=[ProjectSettings.__table__])
+    with Session(engine) as session:
+        session.add(ProjectSettings(
+            id=1, driver_dist="2", referral_1="0.02", referral_2="0.0125", referral_3="0.0075",
+            referral_4="0.005", referral_5="0.005", driver_saving="0.01", company="0.04",
+            bonus="20000", amount="50000", updated_at=datetime(2025, 5, 20)))
+        session.commit()
+    return engine
+
+
+def _cache(monkeypatch):
+    cache = ProjectSettingsCache()
+    cache.version = SharedVersion("project_settings", client=None)
+    monkeypatch.setattr(project_settings_service, "project_settings_cache", cache)
+    monkeypatch.setattr("app.services.earnings_service.project_settings_cache", cache)
+    return cache
+
+
+def test_snapshot_is_parsed_once_and_refreshed_on_update(monkeypatch):
+    engine = _engine()
+    cache = _cache(monkeypatch)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    with Session(engine) as session:
+        percentages = get_config_percentages(session)
+        assert percentages["company"] == Decimal("0.04")
+        assert cache.get(session).amount == Decimal("50000")
+        assert len(statements) == 1
+
+        update_project_settings_service(session, ProjectSettingsUpdate(company="0.05"))
+        assert get_config_percentages(session)["company"] == Decimal("0.05")
+        assert cache.loads == 2
+
+
+def test_change_from_another_worker_is_seen_through_updated_at(monkeypatch):
+    engine = _engine()
+    cache = _cache(monkeypatch)
+    monkeypatch.setattr(settings, "PROJECT_SETTINGS_CHECK_SECONDS", 0)
+
+    with Session(engine) as session:
+        assert cache.get(session).bonus == Decimal("20000")
+        # Sin esta verificación, otro worker no se enteraría: no pasa por invalidate()
+        session.execute(update(ProjectSettings).values(
+            bonus="30000", updated_at=datetime(2025, 5, 20) + timedelta(days=1)))
+        session.commit()
+        assert cache.get(session).bonus == Decimal("30000")
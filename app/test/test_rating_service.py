@@ -0,0 +1,61 @@
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import create_engine
+from sqlmodel import Session
+
+from app.models.rating_aggregate import RatingAggregate
+from app.services.rating_service import apply_rating, get_average_rating, get_average_ratings
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    RatingAggregate.__table__.create(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def test_apply_rating_keeps_sum_and_count(session):
+    driver = uuid4()
+    apply_rating(session, "driver", driver, 5)
+    apply_rating(session, "driver", driver, 4)
+    session.commit()
+
+    assert get_average_rating(session, "driver", driver) == pytest.approx(4.5)
+    # El mismo usuario como pasajero no tiene calificaciones
+    assert get_average_rating(session, "passenger", driver) == 0.0
+
+
+def test_apply_rating_replaces_previous_value(session):
+    client = uuid4()
+    apply_rating(session, "passenger", client, 2)
+    apply_rating(session, "passenger", client, 4)
+    # Se corrige la primera calificación de 2 a 5
+    apply_rating(session, "passenger", client, 5, old_rating=2)
+    session.commit()
+
+    aggregate = session.get(RatingAggregate, (client, "passenger"))
+    assert aggregate.rating_count == 2
+    assert get_average_rating(session, "passenger", client) == pytest.approx(4.5)
+
+
+def test_get_average_ratings_in_batch(session):
+    rated, unrated = uuid4(), uuid4()
+    apply_rating(session, "driver", rated, 3)
+    session.commit()
+
+    assert get_average_ratings(session, "driver", [rated, unrated, None]) == {rated: 3.0, unrated: 0.0}
+
+
+
+def test_rating_upsert_is_a_single_atomic_statement():
+    from sqlalchemy.dialects import mysql, sqlite
+    from app.services.rating_service import _upsert_statement
+
+    driver = uuid4()
+    mysql_sql = str(_upsert_statement("mysql", driver, "driver", 5.0, 1).compile(dialect=mysql.dialect()))
+    sqlite_sql = str(_upsert_statement("sqlite", driver, "driver", 5.0, 1).compile(dialect=sqlite.dialect()))
+    # Sin UPDATE previo + INSERT: la fila se crea o se incrementa en la misma sentencia
+    assert "ON DUPLICATE KEY UPDATE rating_sum = (rating_aggregate.rating_sum +" in mysql_sql
+    assert "ON CONFLICT (id_user, role) DO UPDATE SET rating_sum = (rating_aggregate.rating_sum +" in sqlite_sql
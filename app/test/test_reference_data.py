@@ -0,0 +1,99 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, Session
+
+from app.core.cache import SharedVersion
+from app.core.config import settings
+from app.models.bank import Bank
+from app.models.config_service_value import ConfigServiceValue
+from app.models.payment_method import PaymentMethod
+from app.models.type_service import AllowedRole, TypeService
+from app.models.vehicle_type import VehicleType
+from app.services.bank_service import BankService
+from app.services.reference_data_service import ReferenceDataCache
+
+
+class FakeRedis:
+    """Lo mínimo de redis.Redis que usa SharedVersion (get/incr), compartido por dos "workers"."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+def _engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine, tables=[
+        VehicleType.__table__, TypeService.__table__, PaymentMethod.__table__,
+        ConfigServiceValue.__table__, Bank.__table__])
+    with Session(engine) as session:
+        session.add(VehicleType(id=1, name="Car", capacity=4))
+        session.add(TypeService(id=1, name="Car_Ride", vehicle_type_id=1, allowed_role=AllowedRole.DRIVER))
+        session.add(PaymentMethod(id=1, name="cash"))
+        session.add(ConfigServiceValue(km_value=1000, min_value=200, tarifa_value=5000,
+                                       weight_value=0, service_type_id=1))
+        session.commit()
+    return engine
+
+
+def test_reference_data_is_served_from_memory_until_a_write_bumps_the_version(monkeypatch):
+    engine = _engine()
+    cache = ReferenceDataCache()
+    cache.version = SharedVersion("reference_data", client=None)
+    monkeypatch.setattr("app.services.bank_service.reference_data", cache)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    with Session(engine) as session:
+        refs = cache.get(session)
+        loaded = len(statements)
+        assert refs.type_services[1].name == "Car_Ride"
+        assert refs.config_values[1].km_value == 1000
+        assert refs.payment_method(1) == {"id": 1, "name": "cash"}
+        assert cache.get(session) is refs
+        assert len(statements) == loaded
+
+        BankService(session).create_bank({"bank_code": "1007", "bank_name": "Bancolombia"})
+        refs = cache.get(session)
+        assert [bank.bank_name for bank in refs.banks.values()] == ["Bancolombia"]
+        assert cache.loads == 2
+
+
+def test_worker_without_redis_sees_other_workers_writes_after_the_check(monkeypatch):
+    engine = _engine()
+    monkeypatch.setattr(settings, "REFERENCE_DATA_CHECK_SECONDS", 0)
+    # Dos workers sin Redis: cada uno con su versión local, que el otro nunca ve
+    reader, writer = ReferenceDataCache(), ReferenceDataCache()
+    for cache in (reader, writer):
+        cache.version = SharedVersion("reference_data", client=None)
+    monkeypatch.setattr("app.services.bank_service.reference_data", writer)
+
+    with Session(engine) as session:
+        refs = reader.get(session)
+        assert reader.get(session) is refs and reader.loads == 1
+
+        bank = BankService(session).create_bank({"bank_code": "1007", "bank_name": "Bancolombia"})
+        assert [b.bank_name for b in reader.get(session).banks.values()] == ["Bancolombia"]
+
+        BankService(session).update_bank(bank.id, {"bank_name": "Bancolombia S.A."})
+        assert [b.bank_name for b in reader.get(session).banks.values()] == ["Bancolombia S.A."]
+
+        BankService(session).delete_bank(bank.id)
+        assert reader.get(session).banks == {}
+        assert reader.loads == 4
+
+
+def test_shared_version_propagates_between_workers():
+    redis = FakeRedis()
+    writer = SharedVersion("reference_data", check_seconds=0, client=redis)
+    reader = SharedVersion("reference_data", check_seconds=0, client=redis)
+
+    assert reader.get() == 0
+    writer.bump()
+    assert reader.get() == 1
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel
+
+from app.core.dependencies.roles import require_role
+from app.models.role import Role
+from app.models.user import User
+from app.models.user_has_roles import RoleStatus, UserHasRole
+from app.services.role_cache_service import role_cache
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine, tables=[User.__table__, Role.__table__, UserHasRole.__table__])
+    return engine
+
+
+def test_roles_are_cached_until_invalidated(engine):
+    role_cache.invalidate()
+    with Session(engine) as session:
+        user = User(full_name="Conductor", country_code="+57", phone_number="3100000000", is_active=True)
+        session.add(user)
+        session.flush()
+        session.add(UserHasRole(id_user=user.id, id_rol="DRIVER", status=RoleStatus.PENDING))
+        session.commit()
+        user_id = user.id
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(1))
+    check = require_role("DRIVER", approved=True)
+    request = SimpleNamespace(state=SimpleNamespace(user_id=user_id))
+
+    with Session(engine) as session:
+        with pytest.raises(HTTPException) as exc:
+            check(request, session)
+        assert exc.value.status_code == 403
+        assert role_cache.has_role(session, user_id, "DRIVER", approved=False)
+        assert role_cache.approved_role(session, user_id) is None
+    assert len(queries) == 1
+
+    # Aprobación de documentos: el cambio se ve después de invalidar
+    with Session(engine) as session:
+        session.get(UserHasRole, (user_id, "DRIVER")).status = RoleStatus.APPROVED
+        session.commit()
+    role_cache.invalidate(user_id)
+
+    with Session(engine) as session:
+        assert check(request, session) == user_id
+        assert role_cache.approved_role(session, user_id) == "DRIVER"
+        assert not role_cache.has_role(session, user_id, "CLIENT")
@@ -0,0 +1,178 @@
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+import socketio
+from jose import jwt
+
+from app.core import sio_events
+from app.core.config import settings
+from app.core.socket_registry import socket_registry
+
+
+def _token(user_id):
+    claims = {"sub": str(user_id), "exp": datetime.utcnow() + timedelta(minutes=10)}
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    emitted, rooms = [], {}
+
+    async def fake_emit(event, data=None, room=None, to=None, **kwargs):
+        emitted.append((event, room or to, data))
+
+    async def fake_enter_room(sid, room, namespace=None):
+        rooms.setdefault(room, set()).add(sid)
+
+    def fake_participants(namespace, room):
+        return [(sid, None) for sid in rooms.get(room, ())]
+
+    monkeypatch.setattr(sio_events.sio, "emit", fake_emit)
+    monkeypatch.setattr(sio_events.sio, "enter_room", fake_enter_room)
+    monkeypatch.setattr(sio_events.sio.manager, "get_participants", fake_participants)
+    roles, trips = {}, {}
+    monkeypatch.setattr(sio_events, "_approved_roles", lambda user_id: roles.get(user_id, ["CLIENT"]))
+    monkeypatch.setattr(sio_events, "_load_trip_parties", lambda id_client_request: trips.get(id_client_request))
+    monkeypatch.setattr(sio_events, "_has_offer", lambda id_driver, id_client_request: False)
+    monkeypatch.setattr(sio_events, "_load_driver_trip", lambda id_driver: next(
+        (trip for trip, (_, assigned) in trips.items() if assigned == id_driver), None))
+    monkeypatch.setattr(sio_events, "_load_user_name", lambda user_id: f"Usuario {str(user_id)[:4]}")
+    sio_events.trip_parties.clear()
+    sio_events.user_names.clear()
+    sio_events.driver_trips.clear()
+    return emitted, rooms, roles, trips
+
+
+def test_user_and_trip_events_go_to_their_rooms(recorder):
+    emitted, rooms, roles, trips = recorder
+    client, driver, trip = uuid4(), uuid4(), uuid4()
+    roles[driver] = ["DRIVER"]
+    trips[trip] = (client, driver)
+
+    async def scenario():
+        await sio_events.connect("sid-client", {"QUERY_STRING": f"token={_token(client)}"})
+        await sio_events.connect("sid-driver", {}, {"token": _token(driver)})
+        await sio_events.new_client_request("sid-client", {"id_client_request": str(trip)})
+        await sio_events.new_driver_assigned("sid-client", {"id_driver": str(driver), "id_client_request": str(trip)})
+        await sio_events.update_status_trip("sid-driver", {"id_client_request": str(trip), "status": "ON_THE_WAY"})
+        # El driver_id y el nombre que envía el cliente se ignoran: se usa el usuario del socket
+        await sio_events.driver_to_client_message("sid-driver", {
+            "id_client": str(client), "message": "llegando", "driver_id": "otro",
+            "driver_name": "Conductor", "id_client_request": str(trip)})
+
+    asyncio.run(scenario())
+
+    assert rooms[f"user:{client}"] == {"sid-client"}
+    assert rooms[f"trip:{trip}"] == {"sid-client", "sid-driver"}
+    # Mismos nombres de evento, pero dirigidos a la sala y no a todas las conexiones
+    assert [(event, room) for event, room, _ in emitted] == [
+        # Difusión global heredada (DISPATCH_LEGACY_BROADCAST) para las apps sin migrar
+        ("created_client_request", None),
+        (f"driver_assigned/{driver}", f"user:{driver}"),
+        (f"new_status_trip/{trip}", f"trip:{trip}"),
+        (f"driver_message/{client}", f"user:{client}"),
+    ]
+    assert emitted[-1][2]["driver_id"] == str(driver)
+    assert emitted[-1][2]["driver_name"] == f"Usuario {str(driver)[:4]}"
+    assert socket_registry.sids(driver) == {"sid-driver"}
+    assert asyncio.run(sio_events.has_role("sid-driver", "DRIVER"))
+    assert not asyncio.run(sio_events.has_role("sid-client", "DRIVER"))
+
+    asyncio.run(sio_events.disconnect("sid-driver"))
+    asyncio.run(sio_events.disconnect("sid-client"))
+    assert socket_registry.user_id("sid-driver") is None
+
+
+def test_connect_without_valid_token_is_refused(recorder):
+    for environ, auth in [({}, None), ({"HTTP_AUTHORIZATION": "Bearer no-es-un-jwt"}, None)]:
+        with pytest.raises(socketio.exceptions.ConnectionRefusedError):
+            asyncio.run(sio_events.connect("sid-anon", environ, auth))
+    assert socket_registry.user_id("sid-anon") is None
+
+
+def test_trip_events_require_a_trip_participant(recorder, monkeypatch):
+    emitted, rooms, roles, trips = recorder
+    client, driver, outsider, trip = uuid4(), uuid4(), uuid4(), uuid4()
+    roles[driver] = roles[outsider] = ["DRIVER"]
+    trips[trip] = (client, None)
+    submitted = []
+    monkeypatch.setattr(sio_events.position_ingestor, "submit",
+                        lambda *args, **kwargs: submitted.append((args, kwargs)))
+
+    async def scenario():
+        for sid, user in [("sid-client", client), ("sid-driver", driver), ("sid-out", outsider)]:
+            await sio_events.connect(sid, {}, {"token": _token(user)})
+        await sio_events.subscribe("sid-client", {"id_client_request": str(trip)})
+        # Nadie ajeno al viaje se suscribe, cambia su estado ni publica posiciones en él
+        await sio_events.subscribe("sid-out", {"id_client_request": str(trip)})
+        await sio_events.update_status_trip("sid-out", {"id_client_request": str(trip), "status": "FINISHED"})
+        await sio_events.trip_change_driver_position("sid-out", {
+            "id_client_request": str(trip), "id_client": str(client), "lat": 4.7, "lng": -74.0})
+        await sio_events.new_driver_assigned("sid-out", {"id_driver": str(outsider), "id_client_request": str(trip)})
+        # Asignación hecha por HTTP después de la suscripción del cliente: se relee el viaje
+        trips[trip] = (client, driver)
+        await sio_events.new_driver_assigned("sid-client", {"id_driver": str(outsider), "id_client_request": str(trip)})
+        await sio_events.trip_change_driver_position("sid-driver", {
+            "id_client_request": str(trip), "id_client": str(outsider), "lat": 4.7, "lng": -74.0})
+        # Nadie ajeno al viaje escribe en su chat, aunque ponga otro destinatario o nombre
+        await sio_events.client_to_driver_message("sid-out", {
+            "id_driver": str(driver), "message": "hola", "client_name": "Cliente", "id_client_request": str(trip)})
+        await sio_events.driver_to_client_message("sid-out", {
+            "id_client": str(client), "message": "hola", "driver_name": "Conductor", "id_client_request": str(trip)})
+        # El cliente escribe al conductor asignado, no al id_driver del JSON
+        await sio_events.client_to_driver_message("sid-client", {
+            "id_driver": str(outsider), "message": "hola", "client_name": "Otro", "id_client_request": str(trip)})
+        # Un cliente no publica posiciones de conductor
+        await sio_events.change_driver_position("sid-client", {"lat": 4.7, "lng": -74.0})
+        await sio_events.change_driver_position("sid-driver", {"lat": 4.7, "lng": -74.0})
+        for sid in ("sid-client", "sid-driver", "sid-out"):
+            await sio_events.disconnect(sid)
+
+    asyncio.run(scenario())
+
+    assert rooms[f"trip:{trip}"] == {"sid-client", "sid-driver"}
+    assert [(event, room) for event, room, _ in emitted] == [
+        (f"driver_assigned/{driver}", f"user:{driver}"),
+        (f"trip_new_driver_position/{client}", f"user:{client}"),
+        (f"client_message/{driver}", f"user:{driver}"),
+        # La posición del conductor va solo a la sala de su viaje activo
+        ("new_driver_position", f"trip:{trip}"),
+    ]
+    message = next(data for event, _, data in emitted if event == f"client_message/{driver}")
+    assert message["client_name"] == f"Usuario {str(client)[:4]}"
+    assert submitted == [((driver, 4.7, -74.0), {"verified": True})]
+
+
+def test_a_user_keeps_every_open_socket_until_its_own_disconnect(recorder):
+    client = uuid4()
+
+    async def scenario():
+        await sio_events.connect("sid-phone", {}, {"token": _token(client)})
+        await sio_events.connect("sid-tablet", {}, {"token": _token(client)})
+        assert socket_registry.sids(client) == {"sid-phone", "sid-tablet"}
+        await sio_events.disconnect("sid-phone")
+        assert socket_registry.user_id("sid-tablet") == client
+        await sio_events.disconnect("sid-tablet")
+
+    asyncio.run(scenario())
+    assert not socket_registry.is_connected(client)
+
+
+def test_driver_positions_without_a_trip_are_not_broadcast(recorder, monkeypatch):
+    emitted, rooms, roles, trips = recorder
+    driver = uuid4()
+    roles[driver] = ["DRIVER"]
+    monkeypatch.setattr(sio_events.position_ingestor, "submit", lambda *args, **kwargs: None)
+
+    async def scenario():
+        await sio_events.connect("sid-driver", {}, {"token": _token(driver)})
+        await sio_events.change_driver_position("sid-driver", {"lat": 4.7, "lng": -74.0})
+        monkeypatch.setattr(settings, "DRIVER_POSITION_LEGACY_BROADCAST", True)
+        await sio_events.change_driver_position("sid-driver", {"lat": 4.7, "lng": -74.0})
+        await sio_events.disconnect("sid-driver")
+
+    asyncio.run(scenario())
+    # Sin viaje activo no se emite; la difusión global solo con la bandera heredada
+    assert [(event, room) for event, room, _ in emitted] == [("new_driver_position", None)]
@@ -0,0 +1,122 @@
+import asyncio
+import importlib.util
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+import socketio
+import uvicorn
+from jose import jwt
+
+from app.core import cache, sio_events
+from app.core.config import settings
+from app.core.sio_events import build_client_manager
+from app.test.redis_standin import RedisStandIn
+
+
+def test_build_client_manager_by_setting():
+    assert type(build_client_manager("memory")) is socketio.AsyncManager
+    assert isinstance(build_client_manager("redis", "redis://127.0.0.1:6390/0"), socketio.AsyncRedisManager)
+    with pytest.raises(ValueError):
+        build_client_manager("redis", "")
+    with pytest.raises(ValueError):
+        build_client_manager("kafka", "redis://127.0.0.1:6390/0")
+
+
+def _worker(redis_url, trips, monkeypatch):
+    """
+    Un worker con su propia copia de los handlers reales de sio_events (su AsyncServer,
+    su manager y su user_sids); solo comparten el Redis, como dos procesos uvicorn.
+    """
+    monkeypatch.setattr(settings, "SOCKETIO_MANAGER", "redis")
+    monkeypatch.setattr(settings, "SOCKETIO_REDIS_URL", redis_url)
+    name = f"sio_worker_{len(_workers)}"
+    spec = importlib.util.spec_from_file_location(name, sio_events.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "_approved_roles", lambda user_id: [])
+    monkeypatch.setattr(module, "_load_trip_parties", lambda id_client_request: trips.get(id_client_request))
+    _workers.append(module)
+    return socketio.ASGIApp(module.sio)
+
+
+_workers = []
+
+
+async def _serve(app):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def _until(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timeout esperando condición"
+        await asyncio.sleep(0.02)
+
+
+def _token(user_id):
+    claims = {"sub": str(user_id), "exp": datetime.utcnow() + timedelta(minutes=10)}
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def test_emit_on_one_worker_reaches_socket_on_the_other(monkeypatch):
+    client, driver, trip = uuid4(), uuid4(), uuid4()
+    trips = {trip: (client, driver)}
+    monkeypatch.setattr(cache, "_redis_clients", {})
+    _workers.clear()
+
+    async def scenario():
+        redis = await RedisStandIn().start()
+        workers = [await _serve(_worker(redis.url, trips, monkeypatch)) for _ in range(2)]
+        client_app, driver_app = socketio.AsyncClient(), socketio.AsyncClient()
+        received = {"client": [], "driver": []}
+
+        @client_app.on("*")
+        async def client_event(event, data):
+            received["client"].append((event, data.get("status")))
+
+        @driver_app.on("*")
+        async def driver_event(event, data):
+            received["driver"].append((event, data.get("status")))
+
+        try:
+            await client_app.connect(workers[0][2], auth={"token": _token(client)}, transports=["websocket"])
+            await driver_app.connect(workers[1][2], auth={"token": _token(driver)}, transports=["websocket"])
+            # Cada worker escucha el canal al recibir su primera conexión
+            await _until(lambda: redis.subscribers("socketio") == 2)
+            # El sid del conductor quedó en el Redis del manager, visible para el worker 0
+            await _until(lambda: f"socket_sid:{driver}".encode() in redis.data)
+
+            # El cliente (worker 0) asigna: el socket del conductor (worker 1) se une al viaje
+            # por Redis y recibe el aviso en su sala de usuario
+            await client_app.emit("new_driver_assigned", {"id_driver": str(driver), "id_client_request": str(trip)})
+            await _until(lambda: len(received["driver"]) == 1)
+
+            await client_app.emit("update_status_trip", {"id_client_request": str(trip), "status": "ON_THE_WAY"})
+            await _until(lambda: len(received["driver"]) == 2)
+            await driver_app.emit("update_status_trip", {"id_client_request": str(trip), "status": "ARRIVED"})
+            await _until(lambda: len(received["client"]) == 2)
+        finally:
+            await client_app.disconnect()
+            await driver_app.disconnect()
+            for server, task, _ in workers:
+                server.should_exit = True
+                await task
+            await redis.stop()
+        return received
+
+    received = asyncio.run(asyncio.wait_for(scenario(), timeout=30))
+    assert received["driver"] == [
+        (f"driver_assigned/{driver}", None),
+        (f"new_status_trip/{trip}", "ON_THE_WAY"),
+        (f"new_status_trip/{trip}", "ARRIVED"),
+    ]
+    assert received["client"] == [
+        (f"new_status_trip/{trip}", "ON_THE_WAY"),
+        (f"new_status_trip/{trip}", "ARRIVED"),
+    ]
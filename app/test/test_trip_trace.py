@@ -0,0 +1,68 @@
+import json
+from uuid import uuid4
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel
+
+from app.models.trip_trace import TripTrace, TripTraceChunk
+from app.services.trip_trace_service import TripTraceStore, iter_trace
+from app.utils.trace_codec import douglas_peucker, pack_trace, path_length_m, unpack_trace
+
+
+def test_pack_roundtrip_keeps_microdegree_precision():
+    ts = np.array([1717000000.0, 1717000001.5, 1717000004.25])
+    lats = np.array([4.7081234, 4.7082345, 4.7090001])
+    lngs = np.array([-74.0761234, -74.0762345, -74.0770001])
+
+    blob = pack_trace(ts, lats, lngs)
+    out_ts, out_lats, out_lngs = unpack_trace(blob)
+
+    assert len(blob) == 13 + 3 * 12
+    assert np.allclose(out_ts, ts, atol=1e-3)
+    assert np.allclose(out_lats, lats, atol=1e-6)
+    assert np.allclose(out_lngs, lngs, atol=1e-6)
+
+
+def test_douglas_peucker_drops_collinear_points_and_keeps_corners():
+    # Tramo recto hacia el norte y luego hacia el este, con puntos intermedios
+    lats = np.concatenate([np.linspace(4.70, 4.71, 50), np.full(50, 4.71)])
+    lngs = np.concatenate([np.full(50, -74.08), np.linspace(-74.08, -74.07, 50)])
+
+    keep = douglas_peucker(lats, lngs, tolerance_m=5)
+
+    assert list(keep) == [0, 49, 99]
+    simplified = path_length_m(lats[keep], lngs[keep])
+    assert abs(simplified - path_length_m(lats, lngs)) < 1
+
+
+def test_points_from_two_workers_are_served_and_merged_from_the_db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine, tables=[TripTrace.__table__, TripTraceChunk.__table__])
+    trip, driver = uuid4(), uuid4()
+    # El socket del conductor cambió de worker a mitad del viaje
+    worker_a, worker_b = TripTraceStore(), TripTraceStore()
+    for store in (worker_a, worker_b):
+        store.start(trip, id_driver=driver)
+    worker_a.append(trip, 4.700, -74.070, ts=1000)
+    worker_a.append(trip, 4.702, -74.070, ts=1010)
+    worker_b.append(trip, 4.701, -74.070, ts=1005)
+    assert worker_a.flush(engine) == 1 and worker_b.flush(engine) == 1
+    worker_b.append(trip, 4.703, -74.070, ts=1015)
+
+    # Cualquier worker sirve el recorrido en curso desde la base de datos
+    with Session(engine) as session:
+        lines = [json.loads(line) for chunk in iter_trace(session, trip) for line in chunk.splitlines()]
+    assert [p["t"] for p in lines] == [1000, 1005, 1010]
+
+    with Session(engine) as session:
+        row = worker_b.finish(session, trip)
+        assert row.raw_point_count == 4 and row.id_driver == driver
+        assert session.query(TripTraceChunk).count() == 0
+        ts, lats, _ = unpack_trace(row.samples)
+        assert list(ts) == sorted(ts)
+
+    # Puntos tardíos del otro worker no reabren un viaje ya cerrado
+    worker_a.append(trip, 4.704, -74.070, ts=1020)
+    assert worker_a.flush(engine) == 0
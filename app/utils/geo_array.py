@@ -0,0 +1,148 @@
+import struct
+from typing import Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+# WKB de un POINT 2D en little endian: orden (1 byte), tipo (uint32), x (double), y (double)
+_WKB_POINT_DTYPE = np.dtype([
+    ("order", "u1"),
+    ("type", "<u4"),
+    ("x", "<f8"),
+    ("y", "<f8"),
+])
+_WKB_POINT_SIZE = _WKB_POINT_DTYPE.itemsize  # 21 bytes
+_EWKB_SRID_FLAG = 0x20000000
+
+
+def haversine_array(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """
+    Distancias en metros desde (lat, lng) hasta cada punto de `lats`/`lngs`
+    (arreglos en grados). Misma fórmula que geo_index.haversine_m, vectorizada.
+    Si (lat, lng) también son arreglos, calcula las distancias par a par.
+    """
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lngs - lng)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def bearing_array(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Rumbo inicial en grados [0, 360) desde (lat, lng) hacia cada punto."""
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dlmb = np.radians(lngs - lng)
+    y = np.sin(dlmb) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlmb)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+
+def top_k(values: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """
+    Índices de los `k` valores menores, ordenados de menor a mayor.
+    Con argpartition el costo es O(n + k log k) en lugar de ordenar todo el arreglo.
+    """
+    n = len(values)
+    if k is None or k >= n:
+        return np.argsort(values, kind="stable")
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    part = np.argpartition(values, k - 1)[:k]
+    return part[np.argsort(values[part], kind="stable")]
+
+
+class CoordArray:
+    """
+    Conjunto de puntos en arreglos float64 contiguos (uno para lat y otro para lng),
+    con sus claves en el mismo orden. Pensado para armarse una vez por consulta
+    a partir de los candidatos y resolver distancias/orden en una sola llamada.
+    """
+
+    def __init__(self, keys: Sequence[Hashable], lats: Iterable[float], lngs: Iterable[float]):
+        self.keys = list(keys)
+        self.lats = np.ascontiguousarray(np.fromiter(lats, dtype=np.float64, count=len(self.keys)))
+        self.lngs = np.ascontiguousarray(np.fromiter(lngs, dtype=np.float64, count=len(self.keys)))
+
+    @classmethod
+    def from_entries(cls, entries: Sequence) -> "CoordArray":
+        """Construye el arreglo a partir de objetos con atributos key/lat/lng (IndexEntry)."""
+        return cls(
+            [entry.key for entry in entries],
+            (entry.lat for entry in entries),
+            (entry.lng for entry in entries)
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def distances(self, lat: float, lng: float) -> np.ndarray:
+        return haversine_array(lat, lng, self.lats, self.lngs)
+
+    def bearings(self, lat: float, lng: float) -> np.ndarray:
+        return bearing_array(lat, lng, self.lats, self.lngs)
+
+    def nearest(self, lat: float, lng: float, radius_m: Optional[float] = None, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Posiciones (dentro del arreglo) y distancias de los puntos más cercanos,
+        a `radius_m` metros o menos si se indica, ordenados por distancia.
+        """
+        distances = self.distances(lat, lng)
+        positions = np.arange(len(distances))
+        if radius_m is not None:
+            mask = distances <= radius_m
+            positions = positions[mask]
+            distances = distances[mask]
+        order = top_k(distances, k)
+        return positions[order], distances[order]
+
+
+def _wkb_bytes(wkb) -> Optional[bytes]:
+    if wkb is None:
+        return None
+    data = getattr(wkb, "data", wkb)
+    if isinstance(data, str):
+        return bytes.fromhex(data)
+    return bytes(data)
+
+
+def _decode_point(blob: bytes) -> Tuple[float, float]:
+    """Decodifica un POINT WKB/EWKB en (lat, lng) sin pasar por shapely."""
+    endian = "<" if blob[0] == 1 else ">"
+    (geom_type,) = struct.unpack_from(endian + "I", blob, 1)
+    offset = 9 if geom_type & _EWKB_SRID_FLAG else 5
+    if geom_type & 0xFF != 1:
+        raise ValueError(f"WKB no es un POINT (tipo {geom_type})")
+    x, y = struct.unpack_from(endian + "dd", blob, offset)
+    return y, x
+
+
+def points_from_wkb(wkbs: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convierte una lista de WKBElement (POINT) en arreglos (lats, lngs).
+    Los valores nulos quedan como NaN. Si todos son WKB little endian de 21 bytes
+    (lo que devuelve MySQL) se decodifican de una vez con np.frombuffer.
+    """
+    blobs = [_wkb_bytes(wkb) for wkb in wkbs]
+    if blobs and all(blob is not None and len(blob) == _WKB_POINT_SIZE for blob in blobs):
+        records = np.frombuffer(b"".join(blobs), dtype=_WKB_POINT_DTYPE)
+        if (records["order"] == 1).all() and (records["type"] == 1).all():
+            return (np.ascontiguousarray(records["y"]),
+                    np.ascontiguousarray(records["x"]))
+    lats = np.full(len(blobs), np.nan)
+    lngs = np.full(len(blobs), np.nan)
+    for i, blob in enumerate(blobs):
+        if blob is not None:
+            lats[i], lngs[i] = _decode_point(blob)
+    return lats, lngs
+
+
+def coords_from_wkb(wkbs: Sequence) -> List[Optional[dict]]:
+    """Versión en lote de wkb_to_coords: lista de {'lat', 'lng'} o None por cada elemento."""
+    lats, lngs = points_from_wkb(wkbs)
+    return [
+        None if np.isnan(lat) else {"lat": float(lat), "lng": float(lng)}
+        for lat, lng in zip(lats.tolist(), lngs.tolist())
+    ]
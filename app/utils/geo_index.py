@@ -0,0 +1,387 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from app.utils.geo_array import EARTH_RADIUS_M, CoordArray
+
+METERS_PER_DEGREE_LAT = 111320.0
+
+# Cuánto se recuerda una eliminación para descartarla de una recarga en curso
+TOMBSTONE_SECONDS = 300.0
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    Distancia en metros sobre la esfera entre dos puntos (lat/lng en grados).
+    Equivale a ST_Distance_Sphere de MySQL.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lng: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """
+    Rectángulo lat/lng que contiene el círculo de `radius_m` metros alrededor del punto.
+    Returns:
+        (min_lat, min_lng, max_lat, max_lng)
+    """
+    dlat = radius_m / METERS_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(radius_m / (METERS_PER_DEGREE_LAT * cos_lat), 180.0)
+    return (
+        max(lat - dlat, -90.0),
+        max(lng - dlng, -180.0),
+        min(lat + dlat, 90.0),
+        min(lng + dlng, 180.0)
+    )
+
+
+def rank_entries(entries: List["IndexEntry"], lat: float, lng: float, radius_m: float, limit: Optional[int] = None) -> List[Tuple["IndexEntry", float]]:
+    """Filtra por radio y ordena por distancia los candidatos en una sola pasada vectorizada."""
+    if not entries:
+        return []
+    positions, distances = CoordArray.from_entries(entries).nearest(
+        lat, lng, radius_m=radius_m, k=limit)
+    return [(entries[i], distance) for i, distance in zip(positions.tolist(), distances.tolist())]
+
+
+class Tombstones:
+    """
+    Claves eliminadas del índice con la hora de eliminación. Una recarga desde la
+    base de datos que empezó antes de la eliminación puede traer la fila todavía;
+    `load` la descarta si la clave se eliminó después de `started_at`.
+    """
+
+    def __init__(self, max_age_seconds: float = TOMBSTONE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self._removed: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._removed)
+
+    def add(self, key: Hashable, removed_at: Optional[float] = None) -> None:
+        removed_at = removed_at if removed_at is not None else time.time()
+        self._removed.pop(key, None)
+        self._removed[key] = removed_at
+        self.prune(removed_at - self.max_age_seconds)
+
+    def discard(self, key: Hashable) -> None:
+        self._removed.pop(key, None)
+
+    def removed_since(self, key: Hashable, since: float) -> bool:
+        removed_at = self._removed.get(key)
+        return removed_at is not None and removed_at >= since
+
+    def prune(self, before: float) -> None:
+        """Olvida las eliminaciones anteriores a `before` (se guardan en orden de tiempo)."""
+        while self._removed:
+            key, removed_at = next(iter(self._removed.items()))
+            if removed_at >= before:
+                break
+            del self._removed[key]
+
+
+@dataclass
+class IndexEntry:
+    key: Hashable
+    lat: float
+    lng: float
+    updated_at: float = field(default_factory=time.time)
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+class GridIndex:
+    """
+    Índice espacial en memoria basado en celdas uniformes de lat/lng.
+
+    Cada entrada vive en una sola celda de `cell_deg` grados; una búsqueda por
+    radio solo revisa las celdas que cubren el círculo y aplica la distancia
+    exacta sobre esos candidatos. Es seguro para usarse desde varios hilos
+    (los endpoints síncronos de FastAPI corren en un threadpool).
+    """
+
+    def __init__(self, cell_deg: float = 0.01):
+        self.cell_deg = cell_deg
+        self._entries: Dict[Hashable, IndexEntry] = {}
+        self._cells: Dict[Tuple[int, int], Dict[Hashable, IndexEntry]] = {}
+        self._removed = Tombstones()
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def cell_of(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def get(self, key: Hashable) -> Optional[IndexEntry]:
+        return self._entries.get(key)
+
+    def upsert(self, key: Hashable, lat: float, lng: float, updated_at: Optional[float] = None, **data) -> IndexEntry:
+        """Inserta o mueve una entrada; `data` se mezcla con la existente."""
+        with self._lock:
+            self._removed.discard(key)
+            return self._put(key, lat, lng, updated_at, data)
+
+    def _put(self, key: Hashable, lat: float, lng: float, updated_at: Optional[float], data: Dict[str, Any]) -> IndexEntry:
+        with self._lock:
+            previous = self._entries.get(key)
+            merged = dict(previous.data) if previous else {}
+            merged.update(data)
+            entry = IndexEntry(
+                key=key,
+                lat=float(lat),
+                lng=float(lng),
+                updated_at=updated_at if updated_at is not None else time.time(),
+                data=merged
+            )
+            if previous is not None:
+                self._discard_from_cell(previous)
+            self._entries[key] = entry
+            self._cells.setdefault(self.cell_of(lat, lng), {})[key] = entry
+            return entry
+
+    def touch(self, key: Hashable, updated_at: Optional[float] = None) -> bool:
+        """Renueva la marca de tiempo de la entrada sin moverla. False si no existe."""
+        updated_at = updated_at if updated_at is not None else time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry.updated_at = max(entry.updated_at, updated_at)
+            return True
+
+    def remove(self, key: Hashable) -> Optional[IndexEntry]:
+        """Quita la entrada y recuerda la eliminación para que una recarga en curso no la reponga."""
+        with self._lock:
+            self._removed.add(key)
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._discard_from_cell(entry)
+            return entry
+
+    def evict_older_than(self, before: float) -> List[Hashable]:
+        """Quita las entradas con `updated_at` anterior a `before`; retorna sus claves."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.updated_at < before]
+            for key in stale:
+                self.remove(key)
+            return stale
+
+    def _discard_from_cell(self, entry: IndexEntry) -> None:
+        cell_key = self.cell_of(entry.lat, entry.lng)
+        cell = self._cells.get(cell_key)
+        if cell is not None:
+            cell.pop(entry.key, None)
+            if not cell:
+                del self._cells[cell_key]
+
+    def entries(self) -> List[IndexEntry]:
+        with self._lock:
+            return list(self._entries.values())
+
+    def candidates(self, lat: float, lng: float, radius_m: float, predicate: Optional[Callable[[IndexEntry], bool]] = None) -> List[IndexEntry]:
+        """Entradas de las celdas que cubren el círculo (sin filtrar aún por distancia exacta)."""
+        min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_m)
+        min_row, min_col = self.cell_of(min_lat, min_lng)
+        max_row, max_col = self.cell_of(max_lat, max_lng)
+        with self._lock:
+            span = (max_row - min_row + 1) * (max_col - min_col + 1)
+            if span > len(self._cells):
+                # Radio muy grande frente a las celdas ocupadas: recorrer solo las ocupadas
+                cells = [
+                    cell for (row, col), cell in self._cells.items()
+                    if min_row <= row <= max_row and min_col <= col <= max_col
+                ]
+            else:
+                cells = [
+                    self._cells[(row, col)]
+                    for row in range(min_row, max_row + 1)
+                    for col in range(min_col, max_col + 1)
+                    if (row, col) in self._cells
+                ]
+            return [
+                entry for cell in cells for entry in cell.values()
+                if predicate is None or predicate(entry)
+            ]
+
+    def nearby(
+        self,
+        lat: float,
+        lng: float,
+        radius_m: float,
+        limit: Optional[int] = None,
+        predicate: Optional[Callable[[IndexEntry], bool]] = None
+    ) -> List[Tuple[IndexEntry, float]]:
+        """
+        Devuelve las entradas a `radius_m` metros o menos de (lat, lng),
+        ordenadas de la más cercana a la más lejana, como tuplas (entrada, distancia_m).
+        """
+        return rank_entries(self.candidates(lat, lng, radius_m, predicate), lat, lng, radius_m, limit)
+
+    def load(self, rows: Iterable[Tuple], started_at: Optional[float] = None) -> None:
+        """
+        Reemplaza el contenido con `rows` (key, lat, lng, data[, updated_at]) leídas de
+        la base de datos. Sin `updated_at` la entrada toma `started_at`.
+        Las entradas actualizadas en memoria después de `started_at` se conservan,
+        porque son más recientes que la lectura, y las eliminadas después de
+        `started_at` no se reponen.
+        """
+        started_at = started_at if started_at is not None else time.time()
+        with self._lock:
+            newer = {
+                key: entry for key, entry in self._entries.items()
+                if entry.updated_at >= started_at
+            }
+            self._entries = {}
+            self._cells = {}
+            for key, lat, lng, data, *updated_at in rows:
+                if key in newer or lat is None or lng is None:
+                    continue
+                if self._removed.removed_since(key, started_at):
+                    continue
+                # Una marca posterior a la lectura (relojes desfasados) se acota a started_at
+                ts = min(updated_at[0], started_at) if updated_at and updated_at[0] is not None else started_at
+                self._put(key, lat, lng, ts, data or {})
+            for key, entry in newer.items():
+                self._put(key, entry.lat, entry.lng, entry.updated_at, entry.data)
+            self._removed.prune(started_at)
+            self._loaded_at = time.time()
+
+    def needs_reload(self, max_age_seconds: Optional[float]) -> bool:
+        """True si nunca se cargó desde la base de datos o la carga es más vieja que `max_age_seconds`."""
+        if self._loaded_at is None:
+            return True
+        if not max_age_seconds:
+            return False
+        return time.time() - self._loaded_at > max_age_seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._cells = {}
+            self._loaded_at = None
+
+
+class PartitionedGridIndex:
+    """
+    Conjunto de GridIndex separados por una clave de partición (por ejemplo
+    type_service_id), para que una búsqueda solo toque las particiones pedidas.
+    """
+
+    def __init__(self, cell_deg: float = 0.01):
+        self.cell_deg = cell_deg
+        self._partitions: Dict[Hashable, GridIndex] = {}
+        self._partition_of: Dict[Hashable, Hashable] = {}
+        self._removed = Tombstones()
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._partition_of)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._partition_of
+
+    def get(self, key: Hashable) -> Optional[IndexEntry]:
+        partition = self._partition_of.get(key)
+        if partition is None:
+            return None
+        return self._partitions[partition].get(key)
+
+    def upsert(self, partition: Hashable, key: Hashable, lat: float, lng: float, updated_at: Optional[float] = None, **data) -> IndexEntry:
+        with self._lock:
+            self._removed.discard(key)
+            previous = self._partition_of.get(key)
+            if previous is not None and previous != partition:
+                self._partitions[previous].remove(key)
+            index = self._partitions.get(partition)
+            if index is None:
+                index = self._partitions[partition] = GridIndex(self.cell_deg)
+            self._partition_of[key] = partition
+            return index.upsert(key, lat, lng, updated_at=updated_at, **data)
+
+    def _put(self, partition: Hashable, key: Hashable, lat: float, lng: float, updated_at: Optional[float], data: Dict[str, Any]) -> IndexEntry:
+        index = self._partitions.get(partition)
+        if index is None:
+            index = self._partitions[partition] = GridIndex(self.cell_deg)
+        self._partition_of[key] = partition
+        return index._put(key, lat, lng, updated_at, data)
+
+    def remove(self, key: Hashable) -> Optional[IndexEntry]:
+        with self._lock:
+            self._removed.add(key)
+            partition = self._partition_of.pop(key, None)
+            if partition is None:
+                return None
+            return self._partitions[partition].remove(key)
+
+    def nearby(
+        self,
+        lat: float,
+        lng: float,
+        radius_m: float,
+        partitions: Optional[Iterable[Hashable]] = None,
+        limit: Optional[int] = None,
+        predicate: Optional[Callable[[IndexEntry], bool]] = None
+    ) -> List[Tuple[IndexEntry, float]]:
+        with self._lock:
+            if partitions is None:
+                indexes = list(self._partitions.values())
+            else:
+                indexes = [self._partitions[p]
+                           for p in partitions if p in self._partitions]
+        candidates = [
+            entry for index in indexes
+            for entry in index.candidates(lat, lng, radius_m, predicate)
+        ]
+        return rank_entries(candidates, lat, lng, radius_m, limit)
+
+    def load(self, rows: Iterable[Tuple[Hashable, Hashable, float, float, Dict[str, Any]]], started_at: Optional[float] = None) -> None:
+        """Reemplaza el contenido con `rows` (partition, key, lat, lng, data); ver GridIndex.load."""
+        started_at = started_at if started_at is not None else time.time()
+        with self._lock:
+            newer = [
+                (self._partition_of[entry.key], entry)
+                for index in self._partitions.values()
+                for entry in index.entries()
+                if entry.updated_at >= started_at
+            ]
+            newer_keys = {entry.key for _, entry in newer}
+            self._partitions = {}
+            self._partition_of = {}
+            for partition, key, lat, lng, data in rows:
+                if key in newer_keys or lat is None or lng is None:
+                    continue
+                if self._removed.removed_since(key, started_at):
+                    continue
+                self._put(partition, key, lat, lng, started_at, data or {})
+            for partition, entry in newer:
+                self._put(partition, entry.key, entry.lat, entry.lng,
+                          entry.updated_at, entry.data)
+            self._removed.prune(started_at)
+            self._loaded_at = time.time()
+
+    def needs_reload(self, max_age_seconds: Optional[float]) -> bool:
+        if self._loaded_at is None:
+            return True
+        if not max_age_seconds:
+            return False
+        return time.time() - self._loaded_at > max_age_seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._partitions = {}
+            self._partition_of = {}
+            self._loaded_at = None
@@ -0,0 +1,39 @@
+from sqlalchemy import and_, func
+from app.utils.geo_index import bounding_box
+
+# Las posiciones se guardan como POINT(lng lat) con SRID 4326 (ver from_shape(Point(lng, lat)));
+# el envolvente usa el mismo orden de ejes para que MBRContains sea coherente con los datos.
+
+
+def point_expr(lat: float, lng: float):
+    """Expresión SQL del punto (lat, lng) en SRID 4326."""
+    return func.ST_GeomFromText(f'POINT({float(lng)} {float(lat)})', 4326)
+
+
+def envelope_expr(lat: float, lng: float, radius_m: float):
+    """Expresión SQL del polígono envolvente del radio, en SRID 4326."""
+    min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_m)
+    polygon = (
+        f'POLYGON(({min_lng} {min_lat}, {max_lng} {min_lat}, '
+        f'{max_lng} {max_lat}, {min_lng} {max_lat}, {min_lng} {min_lat}))'
+    )
+    return func.ST_GeomFromText(polygon, 4326)
+
+
+def distance_sphere(column, lat: float, lng: float):
+    """Distancia en metros entre la columna espacial y el punto."""
+    return func.ST_Distance_Sphere(column, point_expr(lat, lng))
+
+
+def within_radius(column, lat: float, lng: float, radius_m: float):
+    """
+    Condición para filtrar filas a `radius_m` metros o menos del punto.
+
+    MBRContains sobre el envolvente permite que MySQL use el índice SPATIAL
+    (R-tree) de la columna; ST_Distance_Sphere solo se evalúa sobre las filas
+    que quedan dentro del rectángulo.
+    """
+    return and_(
+        func.MBRContains(envelope_expr(lat, lng, radius_m), column),
+        distance_sphere(column, lat, lng) <= radius_m
+    )
@@ -0,0 +1,82 @@
+import math
+import struct
+from typing import Tuple
+
+import numpy as np
+
+from app.utils.geo_array import EARTH_RADIUS_M, haversine_array
+
+# Formato del blob (little endian):
+#   cabecera: versión (uint8), cantidad de puntos (uint32), timestamp inicial (float64, epoch s)
+#   por punto: ms desde el inicio (uint32), lat y lng en microgrados (int32) -> 12 bytes
+TRACE_VERSION = 1
+_HEADER = struct.Struct("<BId")
+_POINT_DTYPE = np.dtype([("dt_ms", "<u4"), ("lat", "<i4"), ("lng", "<i4")])
+_MICRO = 1e6
+
+
+def pack_trace(ts: np.ndarray, lats: np.ndarray, lngs: np.ndarray) -> bytes:
+    """Empaqueta los arreglos (timestamps en s, lat, lng en grados) en un blob compacto."""
+    count = len(ts)
+    start = float(ts[0]) if count else 0.0
+    points = np.empty(count, dtype=_POINT_DTYPE)
+    points["dt_ms"] = np.round((np.asarray(ts, dtype=np.float64) - start) * 1000)
+    points["lat"] = np.round(np.asarray(lats, dtype=np.float64) * _MICRO)
+    points["lng"] = np.round(np.asarray(lngs, dtype=np.float64) * _MICRO)
+    return _HEADER.pack(TRACE_VERSION, count, start) + points.tobytes()
+
+
+def unpack_trace(blob: bytes) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Inverso de pack_trace: (timestamps, lats, lngs) como arreglos float64."""
+    version, count, start = _HEADER.unpack_from(blob, 0)
+    if version != TRACE_VERSION:
+        raise ValueError(f"Versión de recorrido no soportada: {version}")
+    points = np.frombuffer(blob, dtype=_POINT_DTYPE, count=count, offset=_HEADER.size)
+    return (
+        start + points["dt_ms"].astype(np.float64) / 1000,
+        points["lat"].astype(np.float64) / _MICRO,
+        points["lng"].astype(np.float64) / _MICRO
+    )
+
+
+def path_length_m(lats: np.ndarray, lngs: np.ndarray) -> float:
+    """Longitud total del recorrido en metros (suma de tramos haversine)."""
+    if len(lats) < 2:
+        return 0.0
+    return float(haversine_array(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).sum())
+
+
+def douglas_peucker(lats: np.ndarray, lngs: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """
+    Índices de los puntos que conserva la simplificación de Douglas–Peucker con
+    tolerancia `tolerance_m`. Las distancias se calculan en una proyección
+    equirectangular local, suficiente para la escala de un viaje urbano.
+    """
+    n = len(lats)
+    if n <= 2:
+        return np.arange(n)
+    lat0 = math.radians(float(np.mean(lats)))
+    y = np.radians(lats) * EARTH_RADIUS_M
+    x = np.radians(lngs) * EARTH_RADIUS_M * math.cos(lat0)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        seg_len = math.hypot(dx, dy)
+        px = x[first + 1:last] - x[first]
+        py = y[first + 1:last] - y[first]
+        if seg_len == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dx * py - dy * px) / seg_len
+        idx = int(np.argmax(distances))
+        if distances[idx] > tolerance_m:
+            split = first + 1 + idx
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)